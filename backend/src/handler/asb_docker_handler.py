@@ -1,74 +1,183 @@
 import json
 import os
 import logging
-from src.recommender.asb_recommender import main
+from src.recommender.asb_recommender import main, sweep, depth_sweep, get_cache_stats, render_tree, get_analysis_config
+from src.recommender.asb_jobs import submit_asb_job, get_job_status, run_job
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+def build_config(analysis_config, body):
+    config = get_analysis_config(analysis_config)
+    config.update({
+        'render': analysis_config.get('render'),
+        'rules_format': analysis_config.get('rules_format', 'text'),
+        'sample_seed': body.get('sample_seed'),
+        'sample_by': body.get('sample_by'),
+        'depth_refit': analysis_config.get('depth_refit', False),
+        'n_jobs': int(os.environ.get('ASB_WORKERS', os.cpu_count() or 1))
+    })
+    return config
+
+def sweep_handler(body, degree_id, sample_size):
+    configs = [build_config(c, body) for c in body['analysis_configs']]
+    logger.info(f"Barrido ASB de {len(configs)} configuraciones para degree_id: {degree_id}")
+    table, results = sweep(
+        degree_id=degree_id,
+        table_name=os.environ.get('TABLE_NAME', 'AdaProjectTable'),
+        sample_size=sample_size,
+        configs=configs,
+        n_jobs=int(os.environ.get('ASB_WORKERS', os.cpu_count() or 1)),
+        seed=body.get('sample_seed'),
+        sample_by=body.get('sample_by')
+    )
+    logger.info(f"Caché de features ASB: {get_cache_stats()}")
+    response_data = {
+        'table': table.astype(object).where(table.notna(), None).to_dict(orient='records'),
+        'results': [
+            {'score_dict': r[0], 'DT_names': r[1], 'figures': r[2], 'parsed': r[3], 'error_msg': r[4], 'trees': r[5]}
+            for r in results
+        ],
+        'cache_stats': get_cache_stats()
+    }
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps(response_data, default=str)
+    }
+
+def depth_sweep_handler(body, degree_id, sample_size):
+    config = build_config(body.get('analysis_config', {}), body)
+    logger.info(f"Barrido de profundidad ASB 1-{config['max_depth']} para degree_id: {degree_id}")
+    curves, error_msg = depth_sweep(
+        degree_id=degree_id,
+        table_name=os.environ.get('TABLE_NAME', 'AdaProjectTable'),
+        sample_size=sample_size,
+        config=config
+    )
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps({'curves': curves, 'error_msg': error_msg, 'cache_stats': get_cache_stats()}, default=str)
+    }
+
+def analyze(body, progress=None):
+    degree_id = body.get('degree_id', '2491')
+    analysis_config = body.get('analysis_config', {})
+
+    logger.info(f"Procesando request ASB para degree_id: {degree_id}")
+    logger.info(f"Configuración recibida: {analysis_config}")
+
+    config = build_config(analysis_config, body)
+
+    logger.info(f"Configuración ASB: {config}")
+    logger.info("Iniciando procesamiento ASB con main...")
+
+    try:
+        table_name = os.environ.get('TABLE_NAME', 'AdaProjectTable')
+        score_dict, DT_names, figures, parsed, error_msg, trees = main(
+            degree_id=degree_id,
+            table_name=table_name,
+            sample_size=body.get('sample_size'),
+            config=config,
+            progress=progress
+        )
+        logger.info(f"Procesamiento ASB completado. Error: {error_msg}")
+        logger.info(f"Caché de features ASB: {get_cache_stats()}")
+    except Exception as e:
+        logger.error(f"Error en procesamiento ASB: {str(e)}")
+        import traceback
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        score_dict, DT_names, figures, parsed, error_msg, trees = {}, [], [], [], f"Error en procesamiento ASB: {str(e)}", []
+
+    return {
+        'score_dict': score_dict,
+        'DT_names': DT_names,
+        'figures': figures,
+        'parsed': parsed,
+        'trees': trees,
+        'error_msg': error_msg,
+        'cache_stats': get_cache_stats()
+    }
+
+def json_response(status_code, data):
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps(data, default=str)
+    }
+
+def submit_job_handler(body):
+    if body.get('analysis_configs') or body.get('analysis_config', {}).get('depth_sweep'):
+        return json_response(400, {'error_msg': 'El modo asíncrono solo admite análisis individuales'})
+    job = submit_asb_job(body, analyze)
+    logger.info(f"Job ASB {job['job_id']} encolado para degree_id: {body.get('degree_id', '2491')}")
+    return json_response(202, {'job_id': job['job_id'], 'status': job['status'], 'created_at': job['created_at']})
+
+def job_status_handler(job_id):
+    job = get_job_status(job_id)
+    if job is None:
+        return json_response(404, {'error_msg': f'Job ASB no encontrado: {job_id}'})
+    return json_response(200, job)
+
+def job_worker_handler(event):
+    # one SQS record per invocation (BatchSize 1); the queue's maximum concurrency bounds the pool.
+    # Failed records go back to the queue and end up in the dead-letter queue after maxReceiveCount
+    failures = []
+    for record in event['Records']:
+        try:
+            run_job(json.loads(record['body'])['job_id'], analyze)
+        except Exception as e:
+            logger.error(f"Job ASB fallido (mensaje {record['messageId']}): {str(e)}")
+            failures.append({'itemIdentifier': record['messageId']})
+    return {'batchItemFailures': failures}
+
 def lambda_handler(event, context):
     try:
+        if event.get('Records'):
+            return job_worker_handler(event)
+        job_id = (event.get('pathParameters') or {}).get('job_id')
+        if job_id:
+            return job_status_handler(job_id)
+
         if isinstance(event.get('body'), str):
             body = json.loads(event['body'])
         else:
             body = event.get('body', {})
 
+        if body.get('tree') is not None:
+            figure = render_tree(body['tree'], body.get('render') or 'png')
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json.dumps({'figure': figure, 'cache_stats': get_cache_stats()})
+            }
+
+        if body.get('async'):
+            return submit_job_handler(body)
+
         degree_id = body.get('degree_id', '2491')
         sample_size = body.get('sample_size')
         analysis_config = body.get('analysis_config', {})
 
-        logger.info(f"Procesando request ASB para degree_id: {degree_id}")
-        logger.info(f"Configuración recibida: {analysis_config}")
-
-        config = {
-            'label': analysis_config.get('label', 'Overall GPA'),
-            'GPA_grades': 'passed+failed last attempt',
-            'is_binary_label': analysis_config.get('is_binary_label', False),
-            'model': 'DT',
-            'max_depth': analysis_config.get('max_depth', 3),
-            'is_atomic': analysis_config.get('is_atomic', True),
-            'is_pm': analysis_config.get('is_pm', False),
-            'index_type': analysis_config.get('index_type', 'fachsemester'),
-            'feature': analysis_config.get('feature', 'Course-Semester'),
-            'combinations': analysis_config.get('combinations', ['behav']),
-            'label_index': analysis_config.get('label_index', None),
-            'course': analysis_config.get('course', None)
-        }
-
-        logger.info(f"Configuración ASB: {config}")
-        logger.info("Iniciando procesamiento ASB con main...")
-
-        try:
-            table_name = os.environ.get('TABLE_NAME', 'AdaProjectTable')
-            score_dict, DT_names, figures, parsed, error_msg = main(
-                degree_id=degree_id,
-                table_name=table_name,
-                sample_size=sample_size,
-                config=config
-            )
-            logger.info(f"Procesamiento ASB completado. Error: {error_msg}")
-        except Exception as e:
-            logger.error(f"Error en procesamiento ASB: {str(e)}")
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            score_dict, DT_names, figures, parsed, error_msg = {}, [], [], [], f"Error en procesamiento ASB: {str(e)}"
-
-        response_data = {
-            'score_dict': score_dict,
-            'DT_names': DT_names,
-            'figures': figures,
-            'parsed': parsed,
-            'error_msg': error_msg
-        }
+        if body.get('analysis_configs'):
+            return sweep_handler(body, degree_id, sample_size)
+        if analysis_config.get('depth_sweep'):
+            return depth_sweep_handler(body, degree_id, sample_size)
 
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps(response_data, default=str)
-        }
+        return json_response(200, analyze(body))
 
     except Exception as e:
         logger.error(f"Error en lambda_handler: {str(e)}")
@@ -85,6 +194,7 @@ def lambda_handler(event, context):
                 'DT_names': [],
                 'figures': [],
                 'parsed': [],
+                'trees': [],
                 'error_msg': f'Error interno del servidor: {str(e)}'
             })
         }
@@ -55,7 +55,10 @@ def create_sagemaker_training_job(algorithm: str, degree_id: str, config: Dict[s
                 "ASB_LABEL_INDEX": str(config.get("label_index", 1)),
                 "ASB_IS_PM": str(config.get("is_pm", False)).lower(),
                 "ASB_GPA_GRADES": config.get("GPA_grades", "passed+failed last attempt"),
-                "ASB_BINARY_THRESHOLD": str(config.get("binary_threshold", 2.0))
+                "ASB_BINARY_THRESHOLD": str(config.get("binary_threshold", 2.0)),
+                "ASB_PM_VOCABULARY": config.get("pm_vocabulary", "all"),
+                "ASB_PM_MIN_SUPPORT": str(config.get("pm_min_support", 1)),
+                "ASB_CONFIGS": json.dumps(config.get("configs", []))
             }
         },
         "rf": {
@@ -81,7 +84,10 @@ def create_sagemaker_training_job(algorithm: str, degree_id: str, config: Dict[s
                 "DEGREE_ID": degree_id,
                 "GPA_SUCCESS_THRESHOLD": str(config.get("gpa_success_threshold", 3.6)),
                 "SIMILARITY_THRESHOLD": str(config.get("similarity_threshold", 0.7)),
-                "TOP_K": str(config.get("top_k", 5))
+                "TOP_K": str(config.get("top_k", 5)),
+                "PM_WORKERS": str(config.get("workers", 1)),
+                "PM_LSH_BANDS": str(config.get("lsh_bands", 0)),
+                "PM_LSH_ROWS": str(config.get("lsh_rows", 4))
             }
         },
         "spm": {
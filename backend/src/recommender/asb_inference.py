@@ -0,0 +1,81 @@
+import os
+import sys
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+sys.path.append('/opt/ml/code')
+from asb_recommender import get_analysis_config, get_model_key, get_text_rules, render_tree
+
+
+def trained_configs(model: Dict[str, Any]):
+    return [m["config"] for m in model.get("models", {}).values()]
+
+def predict_asb(input_data: Dict[str, Any], model_pack: Dict[str, Any]) -> Dict[str, Any]:
+    model = model_pack["model"]
+    degree_id = str(input_data.get("degree_id") or input_data.get("degreeId") or model.get("degree_id"))
+    if degree_id != str(model.get("degree_id")):
+        return {"error": f"El modelo ASB fue entrenado para degree {model.get('degree_id')}, no para {degree_id}"}
+
+    analysis_config = input_data.get("analysis_config", {})
+    config = get_analysis_config(analysis_config)
+    entry = model.get("models", {}).get(get_model_key(config))
+    if entry is None:
+        return {
+            "error": "Configuración ASB no entrenada",
+            "config": config,
+            "trained_configs": trained_configs(model)
+        }
+
+    missing = [c for c in config["combinations"] if c not in entry["combinations"]]
+    if entry["combinations"] and missing:
+        return {
+            "error": f"Combinaciones no entrenadas: {missing}",
+            "trained_combinations": list(entry["combinations"])
+        }
+
+    render = analysis_config.get("render")
+    structured = analysis_config.get("rules_format", "text") == "structured"
+
+    score_dict, DT_names, figures, parsed, trees = {}, [], [], [], []
+    if entry["combinations"]:
+        for combi in config["combinations"]:
+            result = entry["combinations"][combi]
+            score_dict[combi] = result["scores"]
+            DT_names.append(combi)
+            trees.append(result["tree"])
+            parsed.append(result["rules"] if structured else get_text_rules(result["rules"]))
+            if render:
+                figures.append(render_tree(result["tree"], render))
+
+    return {
+        "algorithm": "asb",
+        "model_version": model_pack.get("metadata", {}).get("export_time",
+                         datetime.now(timezone.utc).isoformat()),
+        "degree_id": degree_id,
+        "data_version": model.get("data_version"),
+        "score_dict": score_dict,
+        "DT_names": DT_names,
+        "figures": figures,
+        "parsed": parsed,
+        "trees": trees,
+        "error_msg": entry["error_msg"]
+    }
+
+
+if __name__ == "__main__":
+    import joblib
+    try:
+        input_str = sys.stdin.read().strip()
+        if input_str:
+            inp = json.loads(input_str)
+            model_dir = os.environ.get("MODEL_DIR", "/opt/ml/model")
+            with open(os.path.join(model_dir, "metadata.json"), "r") as f:
+                metadata = json.load(f)
+            model_pack = {"model": joblib.load(os.path.join(model_dir, "model.joblib")), "metadata": metadata}
+            out = predict_asb(inp, model_pack)
+            print(json.dumps(out, ensure_ascii=False, indent=2, default=str))
+        else:
+            print(json.dumps({"error": "Proveer JSON por STDIN"}, ensure_ascii=False))
+    except Exception as e:
+        print(json.dumps({"error": str(e)}, ensure_ascii=False))
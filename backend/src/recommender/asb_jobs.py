@@ -0,0 +1,186 @@
+import os
+import copy
+import json
+import queue
+import threading
+import time
+import traceback
+import uuid
+import boto3
+from datetime import datetime, timezone
+
+# "sqs" stores jobs in DynamoDB/S3 and hands them to the queue-triggered Lambda;
+# "local" keeps everything in memory with a fixed pool of worker threads. Local has to be asked for:
+# on Lambda its threads freeze once the response is returned and the jobs would stay queued
+JOB_QUEUE_URL = os.environ.get("ASB_JOB_QUEUE_URL")
+JOB_BACKEND = os.environ.get("ASB_JOB_BACKEND", "sqs")
+JOB_WORKERS = int(os.environ.get("ASB_JOB_WORKERS", "2"))
+# job records expire through the table TTL, results through the S3 lifecycle rule on asb-jobs/
+JOB_TTL_DAYS = int(os.environ.get("ASB_JOB_TTL_DAYS", "7"))
+JOB_STAGES = ["fetch", "index", "labels", "features", "cv"]
+
+_local_jobs = {}
+_local_lock = threading.Lock()
+_local_queue = queue.Queue()
+_local_workers = []
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat()
+
+def job_table():
+    dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+    return dynamodb.Table(os.environ.get("TABLE_NAME", "AdaProjectTable"))
+
+def job_key(job_id):
+    return {"PK": f"ASB_JOB#{job_id}", "SK": "STATUS"}
+
+def result_key(job_id):
+    return f"{os.environ.get('S3_PREFIX', 'recommenders')}/asb-jobs/{job_id}.json"
+
+def new_job(request):
+    created_at = now()
+    return {
+        "job_id": uuid.uuid4().hex,
+        "status": "queued",
+        "created_at": created_at,
+        "updated_at": created_at,
+        # DynamoDB rejects floats, so the request is kept as JSON text
+        "request": json.dumps(request),
+        "progress": {stage: {"done": 0, "total": 0} for stage in JOB_STAGES},
+        "error_msg": "",
+        "expires_at": int(time.time()) + JOB_TTL_DAYS * 86400,
+    }
+
+def put_job(job):
+    if JOB_BACKEND == "local":
+        with _local_lock:
+            _local_jobs[job["job_id"]] = copy.deepcopy(job)
+        return
+    job_table().put_item(Item=dict(job_key(job["job_id"]), **job))
+
+def get_job(job_id):
+    if JOB_BACKEND == "local":
+        with _local_lock:
+            job = _local_jobs.get(job_id)
+            return copy.deepcopy(job) if job is not None else None
+    item = job_table().get_item(Key=job_key(job_id)).get("Item")
+    if not item:
+        return None
+    item.pop("PK", None)
+    item.pop("SK", None)
+    # progress counters come back as Decimal
+    return json.loads(json.dumps(item, default=int))
+
+def update_job(job_id, **fields):
+    fields["updated_at"] = now()
+    if JOB_BACKEND == "local":
+        with _local_lock:
+            _local_jobs[job_id].update(fields)
+        return
+    names = {f"#f{i}": name for i, name in enumerate(fields)}
+    values = {f":v{i}": value for i, value in enumerate(fields.values())}
+    job_table().update_item(
+        Key=job_key(job_id),
+        UpdateExpression="SET " + ", ".join(f"#f{i} = :v{i}" for i in range(len(fields))),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+    )
+
+def update_progress(job_id, stage, done, total):
+    counters = {"done": int(done), "total": int(total)}
+    if JOB_BACKEND == "local":
+        with _local_lock:
+            _local_jobs[job_id]["progress"][stage] = counters
+            _local_jobs[job_id]["updated_at"] = now()
+        return
+    job_table().update_item(
+        Key=job_key(job_id),
+        UpdateExpression="SET progress.#stage = :counters, updated_at = :updated_at",
+        ExpressionAttributeNames={"#stage": stage},
+        ExpressionAttributeValues={":counters": counters, ":updated_at": now()},
+    )
+
+def put_result(job_id, result):
+    if JOB_BACKEND == "local":
+        with _local_lock:
+            _local_jobs[job_id]["result"] = result
+        return
+    # results carry figures and rules, which can exceed the DynamoDB item limit
+    boto3.client("s3").put_object(
+        Bucket=os.environ.get("S3_BUCKET", "recommendation-data-ort"),
+        Key=result_key(job_id),
+        Body=json.dumps(result, default=str).encode("utf-8"),
+        ContentType="application/json",
+    )
+
+def get_result(job_id):
+    if JOB_BACKEND == "local":
+        with _local_lock:
+            return copy.deepcopy(_local_jobs[job_id].get("result"))
+    obj = boto3.client("s3").get_object(
+        Bucket=os.environ.get("S3_BUCKET", "recommendation-data-ort"),
+        Key=result_key(job_id),
+    )
+    return json.loads(obj["Body"].read())
+
+def run_job(job_id, run):
+    job = get_job(job_id)
+    # SQS delivers at least once; finished jobs are not run again, failed ones are retried
+    # while the queue keeps redelivering them
+    if job is None or job["status"] == "done":
+        return
+    update_job(job_id, status="running", started_at=now())
+    try:
+        result = run(json.loads(job["request"]), lambda stage, done, total: update_progress(job_id, stage, done, total))
+        put_result(job_id, result)
+        update_job(job_id, status="done", finished_at=now(), error_msg=result.get("error_msg", ""))
+    except Exception as e:
+        print(f"Error en job ASB {job_id}: {e}")
+        traceback.print_exc()
+        update_job(job_id, status="failed", finished_at=now(), error_msg=f"Error en job ASB: {str(e)}")
+        raise
+
+def local_worker(run):
+    while True:
+        job_id = _local_queue.get()
+        try:
+            run_job(job_id, run)
+        except Exception:
+            # already recorded as failed; the local backend does not retry
+            pass
+        finally:
+            _local_queue.task_done()
+
+def start_local_workers(run, n_workers=JOB_WORKERS):
+    with _local_lock:
+        while len(_local_workers) < n_workers:
+            worker = threading.Thread(target=local_worker, args=(run,), daemon=True)
+            worker.start()
+            _local_workers.append(worker)
+
+def wait_local_jobs():
+    _local_queue.join()
+
+def submit_asb_job(request, run):
+    if JOB_BACKEND == "sqs" and not JOB_QUEUE_URL:
+        raise RuntimeError("ASB_JOB_QUEUE_URL no está definida; use ASB_JOB_BACKEND=local para la cola en proceso")
+    if JOB_BACKEND not in ("sqs", "local"):
+        raise ValueError(f"ASB_JOB_BACKEND desconocido: {JOB_BACKEND}")
+    job = new_job(request)
+    put_job(job)
+    if JOB_BACKEND == "local":
+        start_local_workers(run)
+        _local_queue.put(job["job_id"])
+    else:
+        boto3.client("sqs").send_message(QueueUrl=JOB_QUEUE_URL, MessageBody=json.dumps({"job_id": job["job_id"]}))
+    return job
+
+def get_job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return None
+    job["request"] = json.loads(job["request"])
+    if job["status"] == "done":
+        job["result"] = get_result(job_id)
+    return job
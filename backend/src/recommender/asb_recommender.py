@@ -1,23 +1,76 @@
+import os
 import boto3
-import math
-import statistics
+import logging
+import hashlib
+import resource
+import json
+import joblib
 import warnings
 import base64
+import threading
+import io
 import pandas as pd
 import numpy as np
 
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from boto3.dynamodb.conditions import Key
+from scipy import sparse
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.model_selection import KFold
 from sklearn.metrics import classification_report
 try:
     import graphviz
-    import pydot
     _GRAPHVIZ_OK = True
 except Exception:
     _GRAPHVIZ_OK = False
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
+logger = logging.getLogger(__name__)
+
+# one LRU per kind of entry, so a burst of tree renders cannot evict the degree frames or feature sets
+CACHE_SIZES = {
+    "features": int(os.environ.get("ASB_CACHE_SIZE", "16")),
+    "frame": int(os.environ.get("ASB_FRAME_CACHE_SIZE", "4")),
+    "degree-state": int(os.environ.get("ASB_FRAME_CACHE_SIZE", "4")),
+    "figure": int(os.environ.get("ASB_FIGURE_CACHE_SIZE", "64")),
+}
+# figures are cheap to redraw and stay in memory only, so they never take a slot of the disk tier
+DISK_CACHE_KINDS = ("features", "frame", "degree-state")
+FEATURE_CACHE_DISK_SIZE = int(os.environ.get("ASB_CACHE_DISK_SIZE", "64"))
+FEATURE_CACHE_DIR = os.environ.get("ASB_CACHE_DIR", "/tmp/asb_cache")
+PROGRESS_STAGES = ["fetch", "index", "labels", "features", "cv"]
+LABEL_FIELDS = ["label", "course", "is_binary_label", "GPA_grades", "label_index", "is_pm"]
+SWEEP_FIELDS = ["label", "course", "label_index", "is_binary_label", "feature", "is_atomic", "index_type", "max_depth"]
+FEATURE_CACHE_FIELDS = [
+    "feature", "is_atomic", "index_type", "label_index", "label", "course", "is_binary_label",
+    "GPA_grades", "is_pm", "combinations", "pm_vocabulary", "pm_min_support", "sample_seed", "sample_by",
+]
+MODEL_FIELDS = [
+    "feature", "is_atomic", "index_type", "label_index", "label", "course", "is_binary_label",
+    "GPA_grades", "is_pm", "pm_vocabulary", "pm_min_support", "max_depth",
+]
+CONFIG_DEFAULTS = {
+    "label": "Overall GPA",
+    "GPA_grades": "passed+failed last attempt",
+    "is_binary_label": False,
+    "max_depth": 3,
+    "is_atomic": True,
+    "is_pm": False,
+    "index_type": "fachsemester",
+    "feature": "Course-Semester",
+    "combinations": ["behav"],
+    "label_index": None,
+    "course": None,
+    "pm_vocabulary": "all",
+    "pm_min_support": 1,
+}
+
+_caches = {kind: OrderedDict() for kind in CACHE_SIZES}
+cache_stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+# async job threads share the caches and the counters
+_cache_lock = threading.Lock()
 
 def get_training_data(degree_id: str, table_name: str, page_limit: int = 1000):
     print(f"Obteniendo datos para degree {degree_id} desde tabla {table_name}")
@@ -44,13 +97,6 @@ def get_training_data(degree_id: str, table_name: str, page_limit: int = 1000):
     print(f"Obtenidos {len(items)} registros de DynamoDB")
     return items
 
-def map_result_to_status(result):
-    r = str(result).upper()
-    if r == "APR":
-        return "PASSED"
-    else:
-        return "FAILED"
-
 def map_grade(grade_str):
     if pd.isna(grade_str) or grade_str == "":
         return np.nan
@@ -67,20 +113,33 @@ def map_grade(grade_str):
     except Exception:
         return np.nan
 
-def determine_credit_value(grade, result):
-    if pd.isna(grade) or grade == 0:
-        return 0
-    return 1 if map_result_to_status(result) == "PASSED" else 0
+def as_categorical(values):
+    # categories in order of first appearance, so category codes follow the row order of the frame
+    codes, uniques = pd.factorize(values)
+    return pd.Categorical.from_codes(codes, categories=uniques)
+
+def categorical_from_codes(codes, names):
+    names = pd.Index(names, dtype=object)
+    if names.is_unique:
+        return pd.Categorical.from_codes(codes, categories=names)
+    return as_categorical(names.values[codes])
 
 def convert_dynamodb_to_asb_format(items):
     print("Convirtiendo datos al formato ASB...")
     print(f"Total items recibidos: {len(items)}")
 
-    if items:
-        print(f"DEBUG: Estructura del primer item: {list(items[0].keys())}")
-        print(f"DEBUG: Primer item completo: {items[0]}")
+    debug = logger.isEnabledFor(logging.DEBUG)
+    if items and debug:
+        logger.debug(f"Estructura del primer item: {list(items[0].keys())}")
+        logger.debug(f"Primer item completo: {items[0]}")
+
+    # rows are appended into typed columns; students and courses stay integer codes and become categoricals
+    student_names, student_dates = [], []
+    course_codes = {}
+    student_col, course_col = array("i"), array("i")
+    semester_col, grade_col, passed_col = array("q"), array("d"), array("b")
+    grade_memo = {}
 
-    asb_rows = []
     students_processed = 0
     students_skipped_insufficient_subjects = 0
     subjects_processed = 0
@@ -97,6 +156,7 @@ def convert_dynamodb_to_asb_format(items):
             continue
 
         students_processed += 1
+        student_code = -1
 
         subjects_by_code = {}
         for subject in subjects:
@@ -128,41 +188,43 @@ def convert_dynamodb_to_asb_format(items):
             for subject in subject_list:
                 try:
                     result_raw = subject.get("status", "")
-                    result_type_raw = subject.get("result_type", "")
-                    result_source_raw = subject.get("result_source", "")
+                    passed = str(result_raw).upper() == "APR"
 
-                    if (has_apr_dictado_T and
-                        str(result_raw).upper() == "APR" and
-                        str(result_source_raw).lower().strip() == "por dictado" and
-                        str(result_type_raw).upper() == "P"):
+                    if (has_apr_dictado_T and passed and
+                        str(subject.get("result_source", "")).lower().strip() == "por dictado" and
+                        str(subject.get("result_type", "")).upper() == "P"):
                         subjects_filtered_apr += 1
                         continue
 
                     sem_raw = subject.get("semester")
                     try:
                         semester = int(float(sem_raw))
-                        print(f"DEBUG: Procesando materia {subject_code} - fachsemester: {semester} (raw: {sem_raw})")
                     except (TypeError, ValueError):
-                        print(f"DEBUG: Error procesando semestre para materia {subject_code} - raw: {sem_raw}")
+                        if debug:
+                            logger.debug(f"Error procesando semestre para materia {subject_code} - raw: {sem_raw}")
                         subjects_skipped += 1
                         continue
+                    if debug:
+                        logger.debug(f"Procesando materia {subject_code} - fachsemester: {semester} (raw: {sem_raw})")
 
                     grade_raw = subject.get("grade")
-
-                    grade = map_grade(grade_raw)
-                    status = map_result_to_status(result_raw)
-                    credits = determine_credit_value(grade, result_raw)
+                    try:
+                        grade = grade_memo[grade_raw]
+                    except KeyError:
+                        grade = grade_memo[grade_raw] = map_grade(grade_raw)
+                    except TypeError:
+                        grade = map_grade(grade_raw)
 
                     if pd.notna(grade):
-                        asb_rows.append({
-                            "studentstudyid": f"student_{student_id}",
-                            "Course": subject_code,
-                            "fachsemester": semester,
-                            "course-grade": grade,
-                            "Credit": credits,
-                            "Final Course Status": status,
-                            "Time-Start": date_val
-                        })
+                        if student_code == -1:
+                            student_code = len(student_names)
+                            student_names.append(f"student_{student_id}")
+                            student_dates.append(date_val)
+                        student_col.append(student_code)
+                        course_col.append(course_codes.setdefault(subject_code, len(course_codes)))
+                        semester_col.append(semester)
+                        grade_col.append(grade)
+                        passed_col.append(passed)
                     else:
                         subjects_skipped += 1
 
@@ -171,7 +233,21 @@ def convert_dynamodb_to_asb_format(items):
                     subjects_skipped += 1
                     continue
 
-    df = pd.DataFrame(asb_rows)
+    if len(student_col):
+        students = np.array(student_col, dtype=np.int32)
+        passed = np.array(passed_col, dtype=bool)
+        grades = np.array(grade_col, dtype=np.float64)
+        df = pd.DataFrame({
+            "studentstudyid": categorical_from_codes(students, student_names),
+            "Course": categorical_from_codes(np.array(course_col, dtype=np.int32), list(course_codes)),
+            "fachsemester": np.array(semester_col, dtype=np.int64),
+            "course-grade": grades,
+            "Credit": (passed & (grades != 0)).astype(np.int64),
+            "Final Course Status": np.array(["FAILED", "PASSED"], dtype=object)[passed.view(np.int8)],
+            "Time-Start": pd.Series(student_dates).to_numpy()[students],
+        })
+    else:
+        df = pd.DataFrame()
     print(f"Datos convertidos: {len(df)} registros")
     print("Estadísticas de procesamiento:")
     print(f"  - Estudiantes procesados: {students_processed}")
@@ -181,88 +257,143 @@ def convert_dynamodb_to_asb_format(items):
     print(f"  - Materias APR dictado filtradas (P cuando hay T): {subjects_filtered_apr}")
     return df
 
-def format_from_dynamodb(degree_id="2491", table_name="AdaProjectTable", sample_size=None):
-    items = get_training_data(degree_id, table_name)
-    if not items:
-        raise ValueError("No se pudieron obtener datos de DynamoDB")
+def get_student_keys(degree_id: str, table_name: str, page_limit: int = 1000):
+    dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+    table = dynamodb.Table(table_name)
+    key_cond = Key("PK").eq(f"DEGREE#{degree_id}") & Key("SK").begins_with("STUDENTS#")
 
-    df = convert_dynamodb_to_asb_format(items)
+    keys = []
+    start_key = None
+    while True:
+        params = {
+            "KeyConditionExpression": key_cond,
+            "ProjectionExpression": "PK, SK, start_date, #d",
+            "ExpressionAttributeNames": {"#d": "date"},
+            "Limit": page_limit,
+        }
+        if start_key:
+            params["ExclusiveStartKey"] = start_key
+        resp = table.query(**params)
+        keys.extend(resp.get("Items", []))
+        start_key = resp.get("LastEvaluatedKey")
+        if not start_key:
+            break
 
-    if sample_size:
-        unique_students = df["studentstudyid"].unique()
-        if len(unique_students) > sample_size:
-            selected = np.random.choice(unique_students, sample_size, replace=False)
-            df = df[df["studentstudyid"].isin(selected)]
-            print(f"Muestreados {sample_size} estudiantes: {df.shape}")
+    print(f"Obtenidas {len(keys)} claves de estudiantes para degree {degree_id}")
+    return keys
+
+def get_cohort_year(key):
+    date_val = str(key.get("start_date") or key.get("date") or "")
+    year = date_val.rsplit("/", 1)[-1]
+    return year if len(year) == 4 and year.isdigit() else "unknown"
+
+def sample_student_keys(keys, sample_size, seed=None, sample_by=None):
+    rng = np.random.RandomState(seed)
+    keys = sorted(keys, key=lambda k: k["SK"])
+    if sample_by != "cohort":
+        selected = rng.choice(len(keys), sample_size, replace=False)
+        return [keys[i] for i in sorted(selected)]
+
+    cohorts = {}
+    for key in keys:
+        cohorts.setdefault(get_cohort_year(key), []).append(key)
+    names = sorted(cohorts)
+    # proportional allocation per cohort year, leftover slots go to the largest remainders
+    quotas = np.array([len(cohorts[n]) for n in names]) * sample_size / len(keys)
+    counts = np.floor(quotas).astype(int)
+    for i in np.argsort(-(quotas - counts), kind="stable")[:sample_size - counts.sum()]:
+        counts[i] += 1
+    sampled = []
+    for name, count in zip(names, counts):
+        members = cohorts[name]
+        sampled.extend(members[i] for i in sorted(rng.choice(len(members), count, replace=False)))
+    return sampled
+
+def get_student_items(table_name, keys, batch_size=100):
+    dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+    items = []
+    for i in range(0, len(keys), batch_size):
+        request = {table_name: {"Keys": [{"PK": k["PK"], "SK": k["SK"]} for k in keys[i:i + batch_size]]}}
+        while request:
+            resp = dynamodb.batch_get_item(RequestItems=request)
+            items.extend(resp.get("Responses", {}).get(table_name, []))
+            request = resp.get("UnprocessedKeys")
+    # batch_get_item does not preserve order
+    items.sort(key=lambda item: item["SK"])
+    print(f"Obtenidos {len(items)} registros de DynamoDB")
+    return items
 
-    return df
+def format_from_dynamodb(degree_id="2491", table_name="AdaProjectTable", sample_size=None, seed=None, sample_by=None):
+    items = None
+    if sample_size:
+        # only keys and start dates are read for the whole degree; subjects are fetched for the sample
+        keys = get_student_keys(degree_id, table_name)
+        if len(keys) > sample_size:
+            selected = sample_student_keys(keys, sample_size, seed, sample_by)
+            items = get_student_items(table_name, selected)
+            print(f"Muestreados {len(selected)} de {len(keys)} estudiantes (seed={seed}, por={sample_by})")
+    if items is None:
+        items = get_training_data(degree_id, table_name)
+    if not items:
+        raise ValueError("No se pudieron obtener datos de DynamoDB")
 
-def add_course_index(df, feature, is_atomic, pm_index_type):
-    def order(row):
-        s_id = row["studentstudyid"]; c = row["Course"]; sem = row["fachsemester"]; status = row["Final Course Status"]
-        student = df.loc[df["studentstudyid"] == s_id]
-        semesters = sorted(student["fachsemester"].unique())
-        idx = semesters.index(sem)
-        if is_atomic:
-            return c + "_" + str(idx + 1), idx + 1, None
-        else:
-            first_attempt_sem = sorted(student.loc[student["Course"] == c]["fachsemester"].values)[0]
-            if first_attempt_sem == sem:
-                if status == "PASSED":
-                    return "e_" + c, idx + 1, "s_" + c
-                return None, idx + 1, "s_" + c
-            else:
-                if status == "PASSED":
-                    return "e_" + c, idx + 1, None
-                return None, None, None
-
-    def distance(row):
-        s_id = row["studentstudyid"]; c = row["Course"]; sem = row["fachsemester"]; status = row["Final Course Status"]
-        student = df.loc[df["studentstudyid"] == s_id]
-        semesters = sorted(student["fachsemester"].unique())
-        first_sem = semesters[0]
-        if is_atomic:
-            return c + "_" + str(sem - first_sem), sem - first_sem, None
-        else:
-            first_attempt_sem = sorted(student.loc[student["Course"] == c]["fachsemester"].values)[0]
-            if first_attempt_sem == sem:
-                if status == "PASSED":
-                    return "e_" + c, sem - first_sem, "s_" + c
-                return None, sem - first_sem, "s_" + c
-            else:
-                if status == "PASSED":
-                    return "e_" + c, sem - first_sem, None
-                return None, None, None
+    return convert_dynamodb_to_asb_format(items)
 
-    def semester(row):
-        s_id = row["studentstudyid"]; c = row["Course"]; sem = row["fachsemester"]; status = row["Final Course Status"]
-        student = df.loc[df["studentstudyid"] == s_id]
-        if is_atomic:
-            return c + "_" + str(sem), sem, None
-        else:
-            first_attempt_sem = sorted(student.loc[student["Course"] == c]["fachsemester"].values)[0]
-            if first_attempt_sem == sem:
-                if status == "PASSED":
-                    return "e_" + c, sem, "s_" + c
-                return None, sem, "s_" + c
-            else:
-                if status == "PASSED":
-                    return "e_" + c, sem, None
-                return None, None, None
+def get_index_pairs(codes, categories, index, keep):
+    # (category, index) pairs are factorized as integers and only the distinct pairs are turned into names
+    codes, index = codes[keep].astype(np.int64), index[keep].astype(np.int64)
+    if len(index) == 0:
+        return np.empty(0, dtype=np.int64), pd.Index([], dtype=object)
+    low = index.min()
+    span = index.max() - low + 1
+    pair_codes, pairs = pd.factorize(codes * span + (index - low))
+    categories = np.asarray(categories, dtype=object)
+    names = [f"{categories[pair // span]}_{pair % span + low}" for pair in pairs.tolist()]
+    return pair_codes, pd.Index(names, dtype=object)
 
+def add_course_index(df, feature, is_atomic, pm_index_type):
     if feature == "Course-Order":
-        df["course-index"], df["index"], df["start-index"] = zip(*df.apply(lambda r: order(r), axis=1))
+        index_kind = "order"
     elif feature == "Course-Distance":
-        df["course-index"], df["index"], df["start-index"] = zip(*df.apply(lambda r: distance(r), axis=1))
+        index_kind = "distance"
     elif feature == "Course-Semester":
-        df["course-index"], df["index"], df["start-index"] = zip(*df.apply(lambda r: semester(r), axis=1))
+        index_kind = "fachsemester"
     else:
-        if pm_index_type == "fachsemester":
-            df["course-index"], df["index"], df["start-index"] = zip(*df.apply(lambda r: semester(r), axis=1))
-        elif pm_index_type == "order":
-            df["course-index"], df["index"], df["start-index"] = zip(*df.apply(lambda r: order(r), axis=1))
-        else:
-            df["course-index"], df["index"], df["start-index"] = zip(*df.apply(lambda r: distance(r), axis=1))
+        index_kind = pm_index_type if pm_index_type in ("fachsemester", "order") else "distance"
+
+    for col in ("studentstudyid", "Course"):
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = as_categorical(df[col])
+
+    sem = df["fachsemester"]
+    by_student = df.groupby("studentstudyid", sort=False, observed=True)["fachsemester"]
+    if index_kind == "fachsemester":
+        index = sem
+    elif f"{index_kind}-index" in df.columns:
+        index = df[f"{index_kind}-index"].copy()
+    elif index_kind == "order":
+        index = by_student.rank(method="dense").astype("int64")
+    else:
+        index = sem - by_student.transform("min")
+
+    course = df["Course"].cat
+    if is_atomic:
+        keep = np.ones(len(df), dtype=bool)
+        codes, names = get_index_pairs(course.codes.values, course.categories, index.values, keep)
+        df["course-index"] = pd.Categorical.from_codes(codes, categories=names)
+        df["index"] = index
+        df["start-index"] = None
+        return
+
+    if "first-attempt" in df.columns:
+        is_first_attempt = df["first-attempt"].values
+    else:
+        first_attempt_sem = df.groupby(["studentstudyid", "Course"], sort=False, observed=True)["fachsemester"].transform("min")
+        is_first_attempt = (sem == first_attempt_sem).values
+    passed = (df["Final Course Status"] == "PASSED").values
+    df["course-index"] = pd.Categorical.from_codes(np.where(passed, course.codes, -1), categories="e_" + course.categories)
+    df["index"] = index.where(is_first_attempt | passed)
+    df["start-index"] = pd.Categorical.from_codes(np.where(is_first_attempt, course.codes, -1), categories="s_" + course.categories)
 
 def get_2_label(label, number):
     if number <= 2.5:
@@ -279,80 +410,113 @@ def get_5_label(label, number):
     elif number > 4.0: return label + " Failed"
     return None
 
-def get_GPA(row, df, incl_fail):
-    s = row["studentstudyid"]
-    credit_grades = df.loc[(df["studentstudyid"] == s)][["Credit", "course-grade"]].values
-    c_g = [[c, g] for c, g in credit_grades if not pd.isna(g)]
+def get_student_GPAs(df, incl_fail):
+    grades = df["course-grade"]
+    counted = grades.notna()
     if not incl_fail:
-        c_g = [[c, g] for c, g in c_g if g != 5.0]
-    weighted_grade = sum([c * g for c, g in c_g])
-    total_credits = sum([c for c, g in c_g])
-    GPA = None
-    if total_credits > 0:
-        GPA = weighted_grade / total_credits
-        GPA = math.floor(GPA * 10) / 10.0
-    gpa_2 = get_2_label("GPA", GPA) if (GPA is not None and not pd.isna(GPA)) else None
-    gpa_5 = get_5_label("GPA", GPA) if (GPA is not None and not pd.isna(GPA)) else None
-    return GPA, gpa_2, gpa_5
+        counted &= grades != 5.0
+    credits = df["Credit"].where(counted, 0)
+    weighted = (credits * grades).where(counted, 0)
+    totals = pd.DataFrame({"weighted": weighted, "credits": credits}).groupby(df["studentstudyid"], sort=False, observed=True).sum()
+    GPA = (totals["weighted"] / totals["credits"]).where(totals["credits"] > 0)
+    GPA = np.floor(GPA * 10) / 10.0
+    gpa_2 = [get_2_label("GPA", g) if pd.notna(g) else None for g in GPA.values]
+    gpa_5 = [get_5_label("GPA", g) if pd.notna(g) else None for g in GPA.values]
+    return pd.DataFrame({
+        "GPA": GPA,
+        "GPA-2level": pd.Series(gpa_2, index=GPA.index, dtype=object),
+        "GPA-5level": pd.Series(gpa_5, index=GPA.index, dtype=object),
+    })
+
+def get_GPA_column(GPA_grades):
+    if GPA_grades == "passed+failed last attempt":
+        return "GPA-last-attempt"
+    if GPA_grades == "passed":
+        return "GPA-passed"
+    return "GPA-all"
 
-def compute_exact_GPA(df, GPA_grades):
+def get_GPA_rows(df, GPA_grades):
     incl_fail = True
     if GPA_grades == "passed+failed last attempt":
-        df = df.drop_duplicates(subset=["studentstudyid", "Course", "fachsemester"], keep="last")
+        df = df.drop_duplicates(subset=["studentstudyid", "Course", "fachsemester"], keep="last").copy()
     elif GPA_grades == "passed":
         incl_fail = False
-    df["GPA"], df["GPA-2level"], df["GPA-5level"] = zip(*df.apply(lambda row: get_GPA(row, df, incl_fail), axis=1))
+    return df, get_student_GPAs(df, incl_fail)
+
+def compute_exact_GPA(df, GPA_grades):
+    column = get_GPA_column(GPA_grades)
+    if column not in df.columns:
+        df, student_GPAs = get_GPA_rows(df, GPA_grades)
+        rows = student_GPAs.reindex(df["studentstudyid"].values)
+        df["GPA"], df["GPA-2level"], df["GPA-5level"] = rows["GPA"].values, rows["GPA-2level"].values, rows["GPA-5level"].values
+        return df
+    # the persisted frame already carries each student's GPA; only its few distinct values get labels
+    if GPA_grades == "passed+failed last attempt":
+        df = df.drop_duplicates(subset=["studentstudyid", "Course", "fachsemester"], keep="last").copy()
+    GPA = df[column].values
+    values, codes = np.unique(GPA, return_inverse=True)
+    gpa_2 = np.array([get_2_label("GPA", g) if pd.notna(g) else None for g in values], dtype=object)
+    gpa_5 = np.array([get_5_label("GPA", g) if pd.notna(g) else None for g in values], dtype=object)
+    df["GPA"], df["GPA-2level"], df["GPA-5level"] = GPA, gpa_2[codes], gpa_5[codes]
     return df
 
 def get_GPA_label(df, is_binary, GPA_grades):
     students = df["studentstudyid"].unique()
     df = compute_exact_GPA(df, GPA_grades)
-    GPAs = []
-    for s in students:
-        label_GPA = df.loc[df["studentstudyid"] == s]["GPA-2level" if is_binary else "GPA-5level"].values[0]
-        GPAs.append(label_GPA)
+    first_rows = df.drop_duplicates(subset="studentstudyid").set_index("studentstudyid")
+    GPAs = first_rows["GPA-2level" if is_binary else "GPA-5level"].reindex(students).values
     return pd.DataFrame(GPAs, columns=pd.Index(["label"])), df
 
-def get_passfail_label(df, course, is_atomic, label_index, is_pm):
-    students = df["studentstudyid"].unique()
-    pass_fail = []
+def get_label_engine(df):
+    rows = df.loc[df["course-index"].notna(), ["studentstudyid", "course-index", "index", "course-grade", "Final Course Status"]]
+    return {
+        "students": df["studentstudyid"].unique(),
+        "rows": rows,
+        "positions": rows.groupby("course-index", sort=False, observed=True).indices,
+    }
+
+def lookup_label_rows(engine, course_index, label_index=None, match_index=False):
+    positions = engine["positions"].get(course_index, [])
+    rows = engine["rows"].iloc[positions]
+    if match_index:
+        rows = rows.loc[rows["index"] == label_index]
+    return rows.drop_duplicates(subset="studentstudyid").set_index("studentstudyid").reindex(engine["students"])
+
+def get_passfail_label(df, course, is_atomic, label_index, is_pm, engine=None):
     if is_atomic:
-        for s in students:
-            status = list(df.loc[
-                (df["studentstudyid"] == s) & (df["course-index"] == f"{course}_{label_index}")
-            ]["Final Course Status"])
-            pass_fail.append(str(status[0]) if status else None)
+        engine = engine if engine is not None else get_label_engine(df)
+        status = lookup_label_rows(engine, f"{course}_{label_index}")["Final Course Status"].values
+        pass_fail = [str(st) if pd.notna(st) else None for st in status]
     else:
-        pass_fail = [None for _ in students]
+        pass_fail = [None for _ in df["studentstudyid"].unique()]
     return pd.DataFrame(pass_fail, columns=pd.Index(["label"]))
 
-def get_course_grade_label(df, course, is_binary, is_atomic, label_index, is_pm):
-    students = df["studentstudyid"].unique()
+def get_course_grade_label(df, course, is_binary, is_atomic, label_index, is_pm, engine=None):
+    engine = engine if engine is not None else get_label_engine(df)
+    if is_atomic:
+        label_index_name = f"{course}_{label_index}"
+        first_rows = lookup_label_rows(engine, label_index_name)
+    elif is_pm:
+        label_index_name = "e_" + course
+        first_rows = lookup_label_rows(engine, label_index_name)
+    else:
+        label_index_name = f"e_{course}_{label_index}"
+        first_rows = lookup_label_rows(engine, "e_" + course, label_index, match_index=True)
     grades = []
-    for s in students:
-        if is_atomic:
-            label_index_name = f"{course}_{label_index}"
-            grade = list(df.loc[
-                (df["studentstudyid"] == s) & (df["course-index"] == label_index_name)
-            ]["course-grade"])
-        else:
-            if is_pm:
-                label_index_name = "e_" + course
-                grade = list(df.loc[(df["studentstudyid"] == s) & (df["course-index"] == label_index_name)]["course-grade"])
-            else:
-                label_index_name = f"e_{course}_{label_index}"
-                grade = list(df.loc[
-                    (df["studentstudyid"] == s) &
-                    (df["course-index"] == "e_" + course) &
-                    (df["index"] == label_index)
-                ]["course-grade"])
-        if grade:
-            exact = grade[0]
+    for exact in first_rows["course-grade"].values:
+        if pd.notna(exact):
             grades.append(get_2_label(label_index_name, exact) if is_binary else get_5_label(label_index_name, exact))
         else:
             grades.append(None)
     return pd.DataFrame(np.array(grades), columns=pd.Index(["label"]))
 
+def get_course_grade_labels(df, course, is_binary, is_atomic, label_indices, is_pm):
+    engine = get_label_engine(df)
+    return {
+        label_index: get_course_grade_label(df, course, is_binary, is_atomic, label_index, is_pm, engine)
+        for label_index in label_indices
+    }
+
 def get_label(df, clf_dict):
     label_name = clf_dict["label"]
     if label_name == "Overall GPA":
@@ -363,35 +527,81 @@ def get_label(df, clf_dict):
             clf_dict["is_atomic"], clf_dict["label_index"], clf_dict["is_pm"]
         )
 
+class SparseFeatures:
+    def __init__(self, matrix, columns):
+        self.matrix = sparse.csr_matrix(matrix)
+        self.columns = pd.Index(columns)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def __getitem__(self, mask):
+        return SparseFeatures(self.matrix[np.asarray(mask)], self.columns)
+
+def concat_features(features):
+    if not any(isinstance(f, SparseFeatures) for f in features):
+        return pd.concat(features, axis=1)
+    blocks = [
+        f.matrix if isinstance(f, SparseFeatures) else sparse.csr_matrix(f.apply(pd.to_numeric).values.astype(np.float64))
+        for f in features
+    ]
+    columns = [c for f in features for c in f.columns]
+    return SparseFeatures(sparse.hstack(blocks, format="csr"), columns)
+
+def get_lifecycle_index_pairs(df, col, label_index=None):
+    index = df["index"].values
+    keep = df[col].notna().values & ~np.isnan(index)
+    if pd.notna(label_index):
+        keep &= index <= int(label_index)
+    codes = df[col].cat.codes.values
+    pair_codes, names = get_index_pairs(codes, df[col].cat.categories, index, keep)
+    return keep, pair_codes, names
+
 def get_lifecycle_course_index(df, label_index):
-    end_indices = df[["course-index", "index"]].values
-    start_indices = df[["start-index", "index"]].values
-    if pd.isna(label_index):
-        all_start_features = list(set([e[0] + "_" + str(int(e[1])) for e in start_indices if pd.notna(e[0])]))
-        all_end_features = list(set([e[0] + "_" + str(int(e[1])) for e in end_indices if pd.notna(e[0])]))
-    else:
-        all_start_features = list(set([e[0] + "_" + str(int(e[1])) for e in start_indices if (pd.notna(e[0]) and e[1] <= int(label_index))]))
-        all_end_features = list(set([e[0] + "_" + str(int(e[1])) for e in end_indices if (pd.notna(e[0]) and e[1] <= int(label_index))]))
+    # names come in first-appearance order; a set() would order them by string hash, i.e. by PYTHONHASHSEED
+    all_start_features = list(dict.fromkeys(get_lifecycle_index_pairs(df, "start-index", label_index)[2]))
+    all_end_features = list(dict.fromkeys(get_lifecycle_index_pairs(df, "course-index", label_index)[2]))
     return all_start_features + all_end_features
 
+def get_row_course_index(df, is_atomic):
+    codes, _ = pd.factorize(df["studentstudyid"])
+    if is_atomic:
+        return codes, df["course-index"].cat.codes.values, df["course-index"].cat.categories
+    student_codes, name_codes, names = [], [], []
+    for col in ["start-index", "course-index"]:
+        keep, pair_codes, pair_names = get_lifecycle_index_pairs(df, col)
+        student_codes.append(codes[keep])
+        name_codes.append(pair_codes + len(names))
+        names.extend(pair_names)
+    return np.concatenate(student_codes), np.concatenate(name_codes), pd.Index(names, dtype=object)
+
 def feature_non_pm(df, clf_dict):
     students = df["studentstudyid"].unique()
     is_atomic = clf_dict["is_atomic"]
     label = clf_dict["label"]
     label_index = clf_dict["label_index"]
     if label == "Overall GPA":
-        all_feature_names = df["course-index"].unique() if is_atomic else get_lifecycle_course_index(df, None)
+        all_feature_names = np.asarray(df["course-index"].unique(), dtype=object) if is_atomic else get_lifecycle_course_index(df, None)
     else:
         if is_atomic:
-            all_feature_names = df.loc[(df["index"] <= label_index)]["course-index"].unique()
+            all_feature_names = np.asarray(df.loc[(df["index"] <= label_index)]["course-index"].unique(), dtype=object)
         else:
             all_feature_names = get_lifecycle_course_index(df, label_index)
-    rows = []
-    for s in students:
-        student_df = df.loc[(df["studentstudyid"] == s)]
-        student_features = student_df["course-index"].values if is_atomic else get_lifecycle_course_index(student_df, None)
-        rows.append([1 if f in student_features else 0 for f in all_feature_names])
-    return pd.DataFrame(np.array(rows), columns=pd.Index(all_feature_names))
+    col_index = {f: j for j, f in enumerate(all_feature_names)}
+    student_codes, name_codes, names = get_row_course_index(df, is_atomic)
+    name_cols = np.array([col_index.get(name, -1) for name in names], dtype=np.int64)
+    cols = np.where(name_codes >= 0, name_cols[name_codes], -1)
+    known = cols >= 0
+    pairs = np.unique(np.stack([student_codes[known], cols[known]], axis=1), axis=0)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.int64), (pairs[:, 0], pairs[:, 1])),
+        shape=(len(students), len(all_feature_names)),
+    )
+    return SparseFeatures(matrix, all_feature_names)
 
 def get_all_pm_feature_names(df, clf_dict):
     is_atomic = clf_dict["is_atomic"]
@@ -399,11 +609,11 @@ def get_all_pm_feature_names(df, clf_dict):
     label = clf_dict["label"]
     label_index = clf_dict["label_index"]
     if is_atomic:
-        dfg_node_names = df["course-index"].unique()
+        dfg_node_names = np.asarray(df["course-index"].unique(), dtype=object)
         right_course = dfg_node_names if label == "Overall GPA" else [f"{course}_{label_index}"]
     else:
         dfg_node_names = []
-        for c in df["Course"].unique():
+        for c in np.asarray(df["Course"].unique(), dtype=object):
             dfg_node_names.extend(["s_" + c, "e_" + c])
         right_course = dfg_node_names if label == "Overall GPA" else ["e_" + course]
     names = []
@@ -420,67 +630,96 @@ def get_all_pm_feature_names(df, clf_dict):
                 names.append(left + "->" + right)
     return names
 
-def student_pm_feature(student_df, clf_dict):
-    label = clf_dict["label"]; course = clf_dict["course"]
-    is_atomic = clf_dict["is_atomic"]; label_index = clf_dict["label_index"]
-    feature = clf_dict["feature"]
-    if is_atomic:
-        node_index_df = student_df[["course-index", "index"]]
-    else:
-        end_indices = student_df[["course-index", "index"]].dropna()
-        start_indices = student_df[["start-index", "index"]].dropna()
-        node_index_df = pd.concat([start_indices.rename(columns={"start-index": "course-index"}), end_indices], axis=0)
-    all_indices = sorted(node_index_df["index"].unique())
-    node_index_list = node_index_df.values
+def get_pm_nodes(df, is_atomic):
+    # one (student, node, index) entry per event; lifecycle students list their start events before their end events
+    students, uniques = pd.factorize(df["studentstudyid"])
+    index = df["index"].values
+    cols = ["course-index"] if is_atomic else ["start-index", "course-index"]
+    entries, node_names = [], []
+    for col in cols:
+        codes = df[col].cat.codes.values
+        keep = (codes >= 0) & pd.notna(index)
+        entries.append((students[keep], codes[keep].astype(np.int64) + len(node_names), index[keep]))
+        node_names.extend(df[col].cat.categories)
+    entry_students = np.concatenate([e[0] for e in entries])
+    order = np.argsort(entry_students, kind="stable")
+    nodes = np.concatenate([e[1] for e in entries])[order]
+    node_index = np.concatenate([e[2] for e in entries])[order]
+    bounds = np.searchsorted(entry_students[order], np.arange(len(uniques) + 1))
+    return nodes, node_index, bounds, np.asarray(node_names, dtype=object)
+
+def student_pm_feature(nodes, node_index, n_nodes, clf_dict, label_node=-1):
+    label = clf_dict["label"]; feature = clf_dict["feature"]
     if label == "Overall GPA":
-        right_list = node_index_list
-        index = 0
+        right_nodes, right_index = nodes, node_index
     else:
-        if is_atomic:
-            index_list = student_df.loc[student_df["course-index"] == f"{course}_{label_index}"].values
-            index = label_index if index_list.size > 0 else ""
-            right_list = [(f"{course}_{label_index}", index)]
-        else:
-            index_list = student_df.loc[student_df["course-index"] == "e_" + course]["index"].values
-            index = index_list[0] if index_list.size > 0 else ""
-            right_list = [("e_" + course, index)]
-    if index == "":
-        return [], []
-    pm_features, path_lengths = [], []
-    for left, idx1 in node_index_list:
-        for right, idx2 in right_list:
-            if feature == "Path Length":
-                if idx1 <= idx2:
-                    pl = all_indices.index(idx2) - all_indices.index(idx1)
-                    pm_features.append(left + "->" + right); path_lengths.append(pl)
-            elif feature == "Directly Follows":
-                if idx1 + 1 == idx2:
-                    pm_features.append(left + "->" + right)
-            else:
-                if idx1 < idx2:
-                    pm_features.append(left + "->" + right)
-    return pm_features, path_lengths
+        is_label = np.flatnonzero(nodes == label_node)
+        if is_label.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        label_index = clf_dict["label_index"] if clf_dict["is_atomic"] else node_index[is_label[0]]
+        right_nodes, right_index = np.array([label_node]), np.array([label_index])
+    left_index, right_index = node_index[:, None], right_index[None, :]
+    if feature == "Path Length":
+        related = left_index <= right_index
+    elif feature == "Directly Follows":
+        related = left_index + 1 == right_index
+    else:
+        related = left_index < right_index
+    # pairs come out left-major, the order the features were listed in before; a repeated pair keeps its first occurrence
+    left, right = np.nonzero(related)
+    pairs = nodes[left] * np.int64(n_nodes) + right_nodes[right]
+    _, first = np.unique(pairs, return_index=True)
+    first.sort()
+    pairs, left, right = pairs[first], left[first], right[first]
+    if feature != "Path Length":
+        return pairs, np.ones(len(pairs), dtype=np.int64)
+    all_indices = np.unique(node_index)
+    path_lengths = np.searchsorted(all_indices, right_index[0, right]) - np.searchsorted(all_indices, node_index[left])
+    return pairs, path_lengths.astype(np.int64)
 
 def feature_pm(df, clf_dict):
     students = df["studentstudyid"].unique()
-    all_feature_names = get_all_pm_feature_names(df, clf_dict)
-    feature = clf_dict["feature"]
-    rows = []
-    for s in students:
-        student_df = df.loc[(df["studentstudyid"] == s)]
-        student_features, path_lens = student_pm_feature(student_df, clf_dict)
-        l = []
-        for f_name in all_feature_names:
-            if feature == "Path Length":
-                if f_name in student_features:
-                    idx = student_features.index(f_name)
-                    l.append(path_lens[idx])
-                else:
-                    l.append(-1)
-            else:
-                l.append(1 if f_name in student_features else 0)
-        rows.append(l)
-    return pd.DataFrame(np.array(rows), columns=pd.Index(all_feature_names))
+    feature = clf_dict["feature"]; is_atomic = clf_dict["is_atomic"]
+    nodes, node_index, bounds, node_names = get_pm_nodes(df, is_atomic)
+    label_name = f"{clf_dict['course']}_{clf_dict['label_index']}" if is_atomic else f"e_{clf_dict['course']}"
+    label_node = -1
+    if clf_dict["label"] != "Overall GPA":
+        matches = np.flatnonzero(node_names == label_name)
+        label_node = matches[-1] if matches.size else -1
+
+    per_student = [
+        student_pm_feature(nodes[bounds[i]:bounds[i + 1]], node_index[bounds[i]:bounds[i + 1]], len(node_names), clf_dict, label_node)
+        for i in range(len(students))
+    ]
+    rows = np.repeat(np.arange(len(students), dtype=np.int32), [len(pairs) for pairs, _ in per_student])
+    pairs = np.concatenate([pairs for pairs, _ in per_student] + [np.empty(0, dtype=np.int64)])
+    values = np.concatenate([vals for _, vals in per_student] + [np.empty(0, dtype=np.int64)])
+    del per_student
+
+    # pairs are decoded to "left->right" names once per distinct pair
+    pair_codes, unique_pairs = pd.factorize(pairs)
+    n_nodes = np.int64(len(node_names))
+    pair_names = [f"{node_names[p // n_nodes]}->{node_names[p % n_nodes]}" for p in unique_pairs.tolist()]
+    if clf_dict.get("pm_vocabulary", "all") == "observed":
+        support = np.bincount(pair_codes, minlength=len(pair_names))
+        min_support = clf_dict.get("pm_min_support", 1)
+        all_feature_names = [name for name, count in zip(pair_names, support) if count >= min_support]
+    else:
+        all_feature_names = get_all_pm_feature_names(df, clf_dict)
+    col_index = {f: j for j, f in enumerate(all_feature_names)}
+    pair_cols = np.array([col_index.get(name, -1) for name in pair_names], dtype=np.int64)
+    cols = pair_cols[pair_codes]
+    known = cols >= 0
+    rows, cols, values = rows[known], cols[known], values[known]
+
+    shape = (len(students), len(all_feature_names))
+    if feature == "Path Length":
+        # -1 marks a missing pair, so Path Length cannot use an implicit zero
+        matrix = np.full(shape, -1, dtype=np.int64)
+        matrix[rows, cols] = values
+        return pd.DataFrame(matrix, columns=pd.Index(all_feature_names))
+    matrix = sparse.csr_matrix((values, (rows, cols)), shape=shape)
+    return SparseFeatures(matrix, all_feature_names)
 
 def get_behavioral_features(df, clf_dict):
     feature = clf_dict["feature"]; is_atomic = clf_dict["is_atomic"]
@@ -491,104 +730,74 @@ def get_behavioral_features(df, clf_dict):
     else:
         raise ValueError(f"Feature desconocida: {feature}")
 
-def get_exams_per_semester(df, s, max_sem):
-    ex_sem = []
-    ex_sem_dict = dict(df.loc[(df["studentstudyid"] == s)][["fachsemester"]].value_counts())
-    for i in range(1, max_sem + 1):
-        ex_sem.append(ex_sem_dict.get((i,), 0))
-    return ex_sem
+def get_exams_per_semester(df, max_sem):
+    codes, students = pd.factorize(df["studentstudyid"])
+    sem = df["fachsemester"].values
+    in_range = (sem >= 1) & (sem <= max_sem)
+    counts = np.zeros((len(students), max_sem), dtype=np.int64)
+    np.add.at(counts, (codes[in_range], sem[in_range] - 1), 1)
+    return pd.DataFrame(counts, index=students, columns=range(1, max_sem + 1))
+
+def get_label_index_rows(df, clf_dict):
+    course = clf_dict["course"]; label_index = clf_dict["label_index"]
+    index = df["index"].values
+    if not clf_dict["is_atomic"] and clf_dict["is_pm"]:
+        codes, students = pd.factorize(df["studentstudyid"])
+        label_rows = np.flatnonzero((df["course-index"] == "e_" + course).values)
+        student_rows, first = np.unique(codes[label_rows], return_index=True)
+        lab_idx = np.full(len(students), np.nan)
+        lab_idx[student_rows] = index[label_rows[first]]
+        return index == lab_idx[codes]
+    return index == label_index
 
 def get_numerical_features(df, clf_dict):
     max_sem = int(max(df["fachsemester"].values))
-    students = df["studentstudyid"].unique()
     label = clf_dict["label"]
 
     if label == "Overall GPA":
-        rows = []
-        for s in students:
-            exams_semester = get_exams_per_semester(df, s, max_sem)
-            exams = str(sum(exams_semester))
-            med_exams_per_sem = int(np.median(exams_semester))
-            non_zero_sems = int(np.count_nonzero(exams_semester))
-            rows.append([exams, med_exams_per_sem, non_zero_sems])
-        return pd.DataFrame(np.array(rows), columns=pd.Index(["exams", "med_exams_per_sem", "non_zero_sems"]))
+        exams_semester = get_exams_per_semester(df, max_sem).values
+        rows = pd.DataFrame({
+            "exams": exams_semester.sum(axis=1),
+            "med_exams_per_sem": np.median(exams_semester, axis=1).astype(int),
+            "non_zero_sems": np.count_nonzero(exams_semester, axis=1),
+        })
+        return rows.astype(str)
     else:
-        course = clf_dict["course"]; label_index = clf_dict["label_index"]; is_atomic = clf_dict["is_atomic"]; is_pm = clf_dict["is_pm"]
-        rows = []
-        for s in students:
-            lab_idx = label_index
-            if not is_atomic and is_pm:
-                lab_idx_arr = df.loc[(df["studentstudyid"] == s) & (df["course-index"] == "e_" + course)]["index"].values
-                lab_idx = lab_idx_arr[0] if lab_idx_arr.size > 0 else ""
-            exams = len(df.loc[(df["studentstudyid"] == s) & (df["index"] == lab_idx)])
-            rows.append([str(exams)])
-        return pd.DataFrame(np.array(rows), columns=pd.Index(["exams"]))
-
-def get_course_grade_dict(df, courses):
-    course_dict = {}
-    for c in courses:
-        grades = df.loc[df["Course"] == c]["course-grade"].values
-        grades = np.asarray([g for g in grades if ~np.isnan(g)])
-        course_dict[c] = {"grades": grades}
-        try:
-            course_dict[c]["median-grade"] = statistics.median(grades)
-        except Exception:
-            course_dict[c]["median-grade"] = np.nan
-    return course_dict
-
-def get_course_difficulties(course_dict, courses):
-    very_easy, easy, difficult, very_difficult = [], [], [], []
-    for c in courses:
-        g = course_dict[c]["median-grade"]
-        if pd.isna(g):
-            very_difficult.append(c)
-        elif g <= 1.5:
-            very_easy.append(c)
-        elif 1.6 <= g <= 2.5:
-            easy.append(c)
-        elif 2.6 <= g <= 3.5:
-            difficult.append(c)
-        else:
-            very_difficult.append(c)
-    return very_easy, easy, difficult, very_difficult
+        codes, students = pd.factorize(df["studentstudyid"])
+        in_label_index = get_label_index_rows(df, clf_dict)
+        exams = np.bincount(codes[in_label_index], minlength=len(students))
+        return pd.DataFrame({"exams": exams.astype(np.int64)}).astype(str)
+
+def get_course_difficulties(df):
+    courses = df["Course"].cat
+    if "course-median" in df.columns:
+        g = np.full(len(courses.categories), np.nan)
+        g[courses.codes.values] = df["course-median"].values
+    else:
+        g = (
+            pd.Series(df["course-grade"].values).groupby(courses.codes.values).median()
+            .reindex(range(len(courses.categories))).values
+        )
+    difficulty = np.select(
+        [g <= 1.5, (g >= 1.6) & (g <= 2.5), (g >= 2.6) & (g <= 3.5)],
+        [0, 1, 2],
+        default=3,
+    )
+    return pd.Series(difficulty, index=courses.categories)
 
 def get_difficulty_features(df, clf_dict):
-    courses = df["Course"].unique()
-    students = df["studentstudyid"].unique()
-    course_dict = get_course_grade_dict(df, courses)
-    very_easy, easy, difficult, very_difficult = get_course_difficulties(course_dict, courses)
+    codes, students = pd.factorize(df["studentstudyid"])
+    course_difficulty = get_course_difficulties(df).values
     cols = ["very easy exams", "easy exams", "difficult exams", "very difficult exams"]
-    rows = []
     label = clf_dict["label"]
 
     if label == "Overall GPA":
-        for s in students:
-            l = [0, 0, 0, 0]
-            s_courses = df.loc[df["studentstudyid"] == s]["Course"].values
-            for c in s_courses:
-                if c in very_easy: l[0] += 1
-                elif c in easy: l[1] += 1
-                elif c in difficult: l[2] += 1
-                else: l[3] += 1
-            rows.append(l)
+        exams = np.ones(len(df), dtype=bool)
     else:
-        course = clf_dict["course"]; label_index = clf_dict["label_index"]; is_atomic = clf_dict["is_atomic"]; is_pm = clf_dict["is_pm"]
-        for s in students:
-            lab_idx = label_index
-            if not is_atomic and is_pm:
-                lab_idx_arr = df.loc[(df["studentstudyid"] == s) & (df["course-index"] == "e_" + course)]["index"].values
-                lab_idx = lab_idx_arr[0] if lab_idx_arr.size > 0 else ""
-            l = [0, 0, 0, 0]
-            s_courses = df.loc[(df["studentstudyid"] == s) & (df["index"] == lab_idx)]["Course"].values
-            for c in s_courses:
-                if c == course:
-                    continue
-                if c in very_easy: l[0] += 1
-                elif c in easy: l[1] += 1
-                elif c in difficult: l[2] += 1
-                else: l[3] += 1
-            rows.append(l)
-    return pd.DataFrame(np.array(rows), columns=pd.Index(cols))
+        exams = get_label_index_rows(df, clf_dict) & (df["Course"] != clf_dict["course"]).values
+    counts = np.zeros((len(students), 4), dtype=np.int64)
+    np.add.at(counts, (codes[exams], course_difficulty[df["Course"].cat.codes.values[exams]]), 1)
+    return pd.DataFrame(counts, columns=pd.Index(cols))
 
 def get_features(df, clf_dict):
     features = []
@@ -610,15 +819,15 @@ def get_features(df, clf_dict):
         elif comb == "num":
             features.append(num_feature)
         elif comb == "diff+num":
-            features.append(pd.concat([diff_feature, num_feature], axis=1))
+            features.append(concat_features([diff_feature, num_feature]))
         elif comb == "diff+behav":
-            features.append(pd.concat([diff_feature, behav_feature], axis=1))
+            features.append(concat_features([diff_feature, behav_feature]))
         elif comb == "num+behav":
-            features.append(pd.concat([num_feature, behav_feature], axis=1))
+            features.append(concat_features([num_feature, behav_feature]))
         elif comb == "diff+num+behav":
-            features.append(pd.concat([diff_feature, num_feature, behav_feature], axis=1))
+            features.append(concat_features([diff_feature, num_feature, behav_feature]))
         elif comb == "all":
-            features.append(pd.concat([diff_feature, num_feature, behav_feature], axis=1))
+            features.append(concat_features([diff_feature, num_feature, behav_feature]))
         else:
             raise ValueError(f"Combinación desconocida: {comb}")
 
@@ -628,186 +837,354 @@ def is_leaf(inner_tree, index):
     return inner_tree.children_left[index] == -1 and inner_tree.children_right[index] == -1
 
 def prune_index(inner_tree, decisions, index=0):
-    if not is_leaf(inner_tree, inner_tree.children_left[index]):
-        prune_index(inner_tree, decisions, inner_tree.children_left[index])
-    if not is_leaf(inner_tree, inner_tree.children_right[index]):
-        prune_index(inner_tree, decisions, inner_tree.children_right[index])
-    if (is_leaf(inner_tree, inner_tree.children_left[index]) and
-        is_leaf(inner_tree, inner_tree.children_right[index]) and
-        (decisions[index] == decisions[inner_tree.children_left[index]]) and
-        (decisions[index] == decisions[inner_tree.children_right[index]])):
-        inner_tree.children_left[index] = -1
-        inner_tree.children_right[index] = -1
-        inner_tree.feature[index] = -2
+    # children are checked before their parent, as in a post-order walk, but without recursing once per level
+    order, stack = [], [index]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        for child in (inner_tree.children_left[node], inner_tree.children_right[node]):
+            if not is_leaf(inner_tree, child):
+                stack.append(child)
+    for index in reversed(order):
+        if (is_leaf(inner_tree, inner_tree.children_left[index]) and
+            is_leaf(inner_tree, inner_tree.children_right[index]) and
+            (decisions[index] == decisions[inner_tree.children_left[index]]) and
+            (decisions[index] == decisions[inner_tree.children_right[index]])):
+            inner_tree.children_left[index] = -1
+            inner_tree.children_right[index] = -1
+            inner_tree.feature[index] = -2
 
 def prune_duplicate_leaves(clf):
     decisions = clf.tree_.value.argmax(axis=2).flatten().tolist()
     prune_index(clf.tree_, decisions)
 
-def get_leaves(clf):
-    n_nodes = clf.tree_.node_count
-    children_left = clf.tree_.children_left
-    children_right = clf.tree_.children_right
-    return [nid for nid in range(n_nodes) if children_left[nid] == children_right[nid]]
-
-def prepare_DT(clf, X, label_values):
-    if not _GRAPHVIZ_OK:
-        return None
-    prune_duplicate_leaves(clf)
-    leaves = get_leaves(clf)
-    from sklearn import tree as _tree
-    dot_data = _tree.export_graphviz(
-        clf,
-        feature_names=list(X.columns),
-        class_names=label_values,
-        filled=True,
-        rounded=True,
-        out_file=None,
-    )
-    if dot_data is None:
-        return None
-    graph_source = graphviz.Source(dot_data)
-    graphs = pydot.graph_from_dot_data(graph_source.source)
-    if not graphs:
-        return None
-    graph = graphs[0]
-    colmap = {name: n for n, name in enumerate(set(label_values))}
+def get_tree_structure(clf, feature_names, class_names):
+    tree_ = clf.tree_
+    decisions = tree_.value.argmax(axis=2).flatten()
+    structure = {"classes": [str(c) for c in class_names], "feature": [], "threshold": [],
+                 "left": [], "right": [], "class": [], "samples": []}
+    stack = [(0, -1, None)]
+    # sklearn keeps orphaned nodes after pruning; only nodes reachable from the root are exported
+    while stack:
+        node, parent, side = stack.pop()
+        i = len(structure["feature"])
+        if parent != -1:
+            structure[side][parent] = i
+        leaf = is_leaf(tree_, node)
+        structure["feature"].append(None if leaf else feature_names[tree_.feature[node]])
+        structure["threshold"].append(None if leaf else float(np.round(tree_.threshold[node], 3)))
+        structure["class"].append(int(decisions[node]))
+        structure["samples"].append(int(tree_.n_node_samples[node]))
+        structure["left"].append(-1)
+        structure["right"].append(-1)
+        if not leaf:
+            stack.append((tree_.children_right[node], i, "right"))
+            stack.append((tree_.children_left[node], i, "left"))
+    return structure
+
+def get_tree_hash(structure, fmt):
+    content = json.dumps(structure, sort_keys=True) + fmt
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+def tree_to_dot(structure):
     color = ["PaleGreen", "plum", "khaki", "coral", "skyblue"]
-    for node in graph.get_nodes():
-        if hasattr(node, "get_name") and hasattr(node, "get_label"):
-            node_id = node.get_name()
-            if node_id in ("node", "edge"):
-                continue
-            old_label = node.get_label()
-            if old_label and old_label != "None" and node_id != '"\\n"':
-                if int(node_id) in leaves:
-                    new_label = old_label.split("class = ")[-1][:-1]
-                    if hasattr(node, "set_fillcolor"):
-                        node.set_fillcolor(color[colmap.get(new_label, 0)])
-                    if hasattr(node, "set_color"):
-                        node.set_color("black")
-                    if hasattr(node, "set_label"):
-                        node.set_label(new_label)
-                else:
-                    new_label = old_label.split("\\n", 1)[0][1:]
-                    if hasattr(node, "set_fillcolor"):
-                        node.set_fillcolor("white")
-                    if hasattr(node, "set_color"):
-                        node.set_color("black")
-                    if hasattr(node, "set_label"):
-                        node.set_label(new_label)
-    updated_source = graph.to_string()
-    updated_dot = graphviz.Source(updated_source)
-    updated_dot.format = "png"
-    return updated_dot
-
-def decision_tree_to_base64(dot_obj):
-    if (dot_obj is None) or (not _GRAPHVIZ_OK):
+    lines = [
+        "digraph Tree {",
+        'node [shape=box, style="filled, rounded", color="black", fontname="helvetica"] ;',
+        'edge [fontname="helvetica"] ;',
+    ]
+    for i, name in enumerate(structure["feature"]):
+        if name is None:
+            class_idx = structure["class"][i]
+            label = structure["classes"][class_idx]
+            fill = color[class_idx % len(color)]
+        else:
+            label = f"{name} <= {structure['threshold'][i]}"
+            fill = "white"
+        label = label.replace("\\", "\\\\").replace('"', '\\"')
+        lines.append(f'{i} [label="{label}", fillcolor="{fill}"] ;')
+    for i, (left, right) in enumerate(zip(structure["left"], structure["right"])):
+        if left != -1:
+            lines.append(f'{i} -> {left} [labeldistance=2.5, labelangle=45, headlabel="True"] ;')
+            lines.append(f'{i} -> {right} [labeldistance=2.5, labelangle=-45, headlabel="False"] ;')
+    lines.append("}")
+    return "\n".join(lines)
+
+def render_tree(structure, fmt="png"):
+    if fmt not in ("png", "svg"):
+        raise ValueError(f"Formato de imagen desconocido: {fmt}")
+    if not _GRAPHVIZ_OK:
         return None
-    png_bytes = dot_obj.pipe(format="png")
-    b64_str = base64.b64encode(png_bytes).decode("utf-8")
+    key = ("figure", get_tree_hash(structure, fmt))
+    b64_str = cache_get(key)
+    if b64_str is None:
+        img_bytes = graphviz.Source(tree_to_dot(structure)).pipe(format=fmt)
+        b64_str = base64.b64encode(img_bytes).decode("utf-8")
+        cache_put(key, b64_str)
     return b64_str
 
-def get_rules(tree, feature_names, class_names):
+def min_max_normalize(values):
+    spread = values.max() - values.min()
+    return np.ones_like(values) if spread == 0 else (values - values.min()) / spread
+
+def get_rules(tree, feature_names, class_names, structured=False):
     tree_ = tree.tree_
-    feature_name = [feature_names[i] if i != -2 else "undefined!" for i in tree_.feature]
+    feature, threshold = tree_.feature.tolist(), np.round(tree_.threshold, 3)
+    children_left, children_right = tree_.children_left.tolist(), tree_.children_right.tolist()
     N = tree_.n_node_samples[0]
-    paths, path = [], []
-
-    def recurse(node, path, paths):
-        if tree_.feature[node] != -2:
-            name = feature_name[node]
-            threshold = tree_.threshold[node]
-            p1, p2 = list(path), list(path)
-            p1 += [f"{name} <= {np.round(threshold, 3)}"]
-            recurse(tree_.children_left[node], p1, paths)
-            p2 += [f"{name} > {np.round(threshold, 3)}"]
-            recurse(tree_.children_right[node], p2, paths)
+
+    # iterative pre-order walk (left first); paths are shared linked tuples, so nothing is copied per split
+    leaves, paths = [], []
+    stack = [(0, None)]
+    while stack:
+        node, path = stack.pop()
+        if feature[node] == -2:
+            leaves.append(node)
+            paths.append(path)
+            continue
+        stack.append((children_right[node], ((node, False), path)))
+        stack.append((children_left[node], ((node, True), path)))
+
+    leaves = np.array(leaves)
+    values = tree_.value[leaves, 0]
+    labels = values.argmax(axis=1)
+    all_acc = np.round(100.0 * values[np.arange(len(leaves)), labels] / values.sum(axis=1), 2)
+    samples = tree_.n_node_samples[leaves]
+    all_sample_perc = np.round(100.0 * samples / N, 2)
+    scores = np.round(((min_max_normalize(all_acc) + min_max_normalize(all_sample_perc)) / 2) * 100, 2)
+
+    if structured:
+        conditions = {}
+    else:
+        conditions = {
+            node: (f"{feature_names[feature[node]]} <= {threshold[node]}", f"{feature_names[feature[node]]} > {threshold[node]}")
+            for node in range(len(feature)) if feature[node] != -2
+        }
+
+    rules = []
+    for i, path in enumerate(paths):
+        steps = []
+        while path is not None:
+            steps.append(path[0])
+            path = path[1]
+        steps.reverse()
+        class_name = class_names[labels[i]] if class_names else str(labels[i])
+        if structured:
+            rules.append({
+                "conditions": [
+                    {"feature": feature_names[feature[node]], "op": "<=" if left else ">", "threshold": float(threshold[node])}
+                    for node, left in steps
+                ],
+                "class": str(class_name),
+                "accuracy": float(all_acc[i]),
+                "samples_perc": float(all_sample_perc[i]),
+                "score": float(scores[i]),
+                "samples": int(samples[i]),
+                "total": int(N),
+            })
         else:
-            path += [(tree_.value[node], tree_.n_node_samples[node])]
-            paths += [path]
-
-    recurse(0, path, paths)
-
-    rules, all_sample_perc, all_acc = [], [], []
-    for p in paths:
-        rule_str = ", ".join(p[:-1])
-        classes = p[-1][0][0]
-        l = int(np.argmax(classes))
-        acc = float(np.round(100.0 * classes[l] / np.sum(classes), 2))
-        samples = int(p[-1][1])
-        samples_perc = float(np.round(100.0 * samples / N, 2))
-        rules.append([f"{rule_str}, class: {class_names[l] if class_names else str(l)}", acc, samples_perc, 0.0, (samples, N)])
-        all_acc.append(acc); all_sample_perc.append(samples_perc)
-
-    all_acc = np.array(all_acc); all_sample_perc = np.array(all_sample_perc)
-    acc_norm = np.ones_like(all_acc) if (all_acc.max() - all_acc.min()) == 0 else (all_acc - all_acc.min()) / (all_acc.max() - all_acc.min())
-    sp_norm = np.ones_like(all_sample_perc) if (all_sample_perc.max() - all_sample_perc.min()) == 0 else (all_sample_perc - all_sample_perc.min()) / (all_sample_perc.max() - all_sample_perc.min())
-    for i in range(len(rules)):
-        rules[i][3] = float(np.round(((acc_norm[i] + sp_norm[i]) / 2) * 100, 2))
+            rule_str = ", ".join(conditions[node][0 if left else 1] for node, left in steps)
+            rules.append([f"{rule_str}, class: {class_name}", float(all_acc[i]), float(all_sample_perc[i]), float(scores[i]), (int(samples[i]), N)])
     return rules
 
-def cross_val(model, X, y, cv, score_dict, combi, max_depth, feature_name):
+def get_text_rules(rules):
+    # same strings get_rules builds for the text format, from its structured output
+    text_rules = []
+    for rule in rules:
+        conditions = [f"{c['feature']} {c['op']} {c['threshold']}" for c in rule["conditions"]]
+        text_rules.append([
+            ", ".join(conditions) + f", class: {rule['class']}",
+            rule["accuracy"], rule["samples_perc"], rule["score"], (rule["samples"], rule["total"]),
+        ])
+    return text_rules
+
+def get_feature_matrix(X):
+    return X.matrix if isinstance(X, SparseFeatures) else X.values
+
+def get_executor(n_jobs):
+    try:
+        return ProcessPoolExecutor(max_workers=n_jobs)
+    except (OSError, NotImplementedError):
+        # Lambda has no /dev/shm for process pools; tree fitting releases the GIL, so threads still scale
+        return ThreadPoolExecutor(max_workers=n_jobs)
+
+def submit_job(executor, fn, *args):
+    if executor is not None:
+        return executor.submit(fn, *args)
+    future = Future()
+    future.set_result(fn(*args))
+    return future
+
+def fit_tree(X, y, max_depth):
+    clf = DecisionTreeClassifier(random_state=100, max_depth=max_depth, min_samples_leaf=1, min_samples_split=2)
+    clf.fit(X, np.ravel(y))
+    return clf
+
+def fit_fold(Xv, yv, train, test, max_depth):
+    clf = fit_tree(Xv[train], yv[train], max_depth)
+    y_pred = clf.predict(Xv[test])
+    return classification_report(yv[test], y_pred, output_dict=True)
+
+def add_fold_report(score_dict, combi, report):
+    if report and isinstance(report, dict):
+        acc = float(report.get("accuracy", 0.0))
+        score_dict[combi]["accuracy"].append(round(acc, 4))
+        labels = list(report.keys())[:-3]
+        for lab in labels:
+            if lab in report and isinstance(report[lab], dict):
+                prec = float(report[lab].get("precision", 0.0))
+                rec = float(report[lab].get("recall", 0.0))
+                if lab not in score_dict[combi]["class"]:
+                    score_dict[combi]["class"][lab] = {"precision": [], "recall": []}
+                score_dict[combi]["class"][lab]["precision"].append(round(prec, 4))
+                score_dict[combi]["class"][lab]["recall"].append(round(rec, 4))
+
+def report_progress(progress, stage, done=1, total=1):
+    if progress is not None:
+        progress(stage, done, total)
+
+def get_progress_counter(progress, stage, total):
+    # future callbacks run on pool threads, so the count is taken under a lock
+    if progress is None:
+        return None
+    lock = threading.Lock()
+    state = {"done": 0}
+    report_progress(progress, stage, 0, total)
+    def on_done(_):
+        with lock:
+            state["done"] += 1
+            done = state["done"]
+        report_progress(progress, stage, done, total)
+    return on_done
+
+def submit_cross_val(X, y, cv, max_depth, executor=None, on_done=None):
+    Xv = get_feature_matrix(X)
+    yv = y.values
+    kfold = KFold(n_splits=cv, shuffle=True, random_state=100)
+    fold_jobs = [submit_job(executor, fit_fold, Xv, yv, train, test, max_depth) for train, test in kfold.split(Xv, yv)]
+    tree_job = submit_job(executor, fit_tree, Xv, yv, max_depth)
+    if on_done is not None:
+        for job in fold_jobs + [tree_job]:
+            job.add_done_callback(on_done)
+    return fold_jobs, tree_job
+
+def collect_cross_val(jobs, score_dict, combi):
+    fold_jobs, tree_job = jobs
     score_dict[combi] = {"class": {}, "accuracy": []}
-    Xv = X.values
+    for job in fold_jobs:
+        add_fold_report(score_dict, combi, job.result())
+    return score_dict, tree_job.result()
+
+def cross_val(model, X, y, cv, score_dict, combi, max_depth, feature_name, executor=None):
+    return collect_cross_val(submit_cross_val(X, y, cv, max_depth, executor), score_dict, combi)
+
+def predict_by_depth(clf, X, depths):
+    # decision paths list nodes root first, so entry k of a row is the node the tree would stop at with max_depth=k
+    paths = clf.decision_path(X)
+    path_end = np.diff(paths.indptr) - 1
+    decisions = clf.classes_[clf.tree_.value[:, 0].argmax(axis=1)]
+    return [decisions[paths.indices[paths.indptr[:-1] + np.minimum(depth, path_end)]] for depth in depths]
+
+def fit_fold_depths(Xv, yv, train, test, max_depth, refit=False):
+    depths = range(1, max_depth + 1)
+    if refit:
+        # exact per-depth trees, at the cost of max_depth fits per fold
+        predictions = [fit_tree(Xv[train], yv[train], depth).predict(Xv[test]) for depth in depths]
+    else:
+        clf = fit_tree(Xv[train], yv[train], max_depth)
+        predictions = predict_by_depth(clf, Xv[test], depths)
+    return [classification_report(yv[test], y_pred, output_dict=True) for y_pred in predictions]
+
+def submit_depth_sweep(X, y, cv, max_depth, executor=None, refit=False):
+    Xv = get_feature_matrix(X)
     yv = y.values
     kfold = KFold(n_splits=cv, shuffle=True, random_state=100)
-    clf_all = DecisionTreeClassifier(random_state=100, max_depth=max_depth, min_samples_leaf=1, min_samples_split=2)
-    for _, (train, test) in enumerate(kfold.split(Xv, yv)):
-        X_train, X_test = Xv[train], Xv[test]
-        y_train, y_test = yv[train], yv[test]
-        clf = DecisionTreeClassifier(random_state=100, max_depth=max_depth, min_samples_leaf=1, min_samples_split=2)
-        clf.fit(X_train, np.ravel(y_train))
-        y_pred = clf.predict(X_test)
-        report = classification_report(y_test, y_pred, output_dict=True)
-        if report and isinstance(report, dict):
-            acc = float(report.get("accuracy", 0.0))
-            score_dict[combi]["accuracy"].append(round(acc, 4))
-            labels = list(report.keys())[:-3]
-            for lab in labels:
-                if lab in report and isinstance(report[lab], dict):
-                    prec = float(report[lab].get("precision", 0.0))
-                    rec = float(report[lab].get("recall", 0.0))
-                    if lab not in score_dict[combi]["class"]:
-                        score_dict[combi]["class"][lab] = {"precision": [], "recall": []}
-                    score_dict[combi]["class"][lab]["precision"].append(round(prec, 4))
-                    score_dict[combi]["class"][lab]["recall"].append(round(rec, 4))
-    clf_all.fit(Xv, np.ravel(yv))
-    return score_dict, clf_all
-
-def classify(features, labels, clf_dict):
-    model = clf_dict["model"]
+    return [submit_job(executor, fit_fold_depths, Xv, yv, train, test, max_depth, refit) for train, test in kfold.split(Xv, yv)]
+
+def collect_depth_sweep(jobs, max_depth):
+    curve = {depth: {"class": {}, "accuracy": []} for depth in range(1, max_depth + 1)}
+    for job in jobs:
+        for depth, report in enumerate(job.result(), start=1):
+            add_fold_report(curve, depth, report)
+    for scores in curve.values():
+        scores["mean_accuracy"] = round(float(np.mean(scores["accuracy"])), 4) if scores["accuracy"] else None
+    return curve
+
+def classify_depths(features, labels, clf_dict):
     combinations = clf_dict["combinations"]
     max_depth = clf_dict["max_depth"]
+    n_jobs = clf_dict.get("n_jobs", 1)
+    # depth k truncates the max_depth tree of each fold. A tree fitted at max_depth=k can differ where
+    # splits tie, since sklearn breaks ties with a random feature order the deeper subtrees also draw from.
+    # depth_refit fits every depth separately and matches cross_val exactly
+    refit = clf_dict.get("depth_refit", False)
 
-    label_values = sorted(labels[0]["label"].dropna().unique())
-
-    score_dict = {}
-    DT_names, figures, parsed = [], [], []
+    curves = {}
     error_msg = ""
 
+    executor = get_executor(n_jobs) if n_jobs and n_jobs > 1 else None
+    try:
+        jobs = []
+        for i, feature in enumerate(features):
+            if len(feature) < 4:
+                error_msg = f"4-fold CV requiere >= 4 muestras. Recibidas: {len(feature)}"
+                break
+            jobs.append(submit_depth_sweep(feature, labels[i].astype(str), 4, max_depth, executor, refit))
+        for i, job in enumerate(jobs):
+            curves[combinations[i]] = collect_depth_sweep(job, max_depth)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return curves, error_msg
+
+def submit_classify(features, labels, clf_dict, executor=None, progress=None):
+    jobs = []
+    # 4 folds plus the final tree per combination
+    on_done = get_progress_counter(progress, "cv", 5 * len(features))
     for i, feature in enumerate(features):
-        X = feature
-        y = labels[i].astype(str)
+        if len(feature) < 4:
+            return jobs, f"4-fold CV requiere >= 4 muestras. Recibidas: {len(feature)}"
+        jobs.append(submit_cross_val(feature, labels[i].astype(str), 4, clf_dict["max_depth"], executor, on_done))
+    return jobs, ""
+
+def collect_classify(jobs, error_msg, features, labels, clf_dict):
+    combinations = clf_dict["combinations"]
+    render = clf_dict.get("render")
+
+    label_values = sorted(labels[0]["label"].dropna().unique())
 
-        if len(X) < 4:
-            error_msg = f"4-fold CV requiere >= 4 muestras. Recibidas: {len(X)}"
-            return score_dict, DT_names, figures, parsed, error_msg
+    score_dict = {}
+    DT_names, figures, parsed, trees = [], [], [], []
 
-        score_dict, clf = cross_val(model, X, y, 4, score_dict, combinations[i], max_depth, clf_dict["feature"])
+    for i, job in enumerate(jobs):
+        X = features[i]
+        score_dict, clf = collect_cross_val(job, score_dict, combinations[i])
 
-        DT_dot = prepare_DT(clf, X, label_values)
-        b64_img = decision_tree_to_base64(DT_dot)
-        figures.append(b64_img)
+        prune_duplicate_leaves(clf)
+        tree = get_tree_structure(clf, list(X.columns), label_values)
+        trees.append(tree)
+        if render:
+            figures.append(render_tree(tree, render))
         DT_names.append(combinations[i])
 
         try:
-            rules = get_rules(clf, list(X.columns), label_values)
+            rules = get_rules(clf, list(X.columns), label_values, clf_dict.get("rules_format") == "structured")
         except Exception as e:
             rules = f"Error generando reglas: {e}"
         parsed.append(rules)
 
-    return score_dict, DT_names, figures, parsed, error_msg
+    return score_dict, DT_names, figures, parsed, error_msg, trees
+
+def classify(features, labels, clf_dict, progress=None):
+    n_jobs = clf_dict.get("n_jobs", 1)
+    executor = get_executor(n_jobs) if n_jobs and n_jobs > 1 else None
+    try:
+        jobs, error_msg = submit_classify(features, labels, clf_dict, executor, progress)
+        return collect_classify(jobs, error_msg, features, labels, clf_dict)
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
 def drop_rows(features, label_df):
     new_features = []
@@ -816,15 +1193,13 @@ def drop_rows(features, label_df):
         new_features.append(feature[mask])
     return new_features, label_df[mask]
 
-def get_features_label_from_dataframe(df, config):
+def get_features_label_from_dataframe(df, config, label=None, progress=None):
     try:
-        feature = config["feature"]
-        is_atomic = config["is_atomic"]
-        pm_index_type = config["index_type"]
-
-        add_course_index(df, feature, is_atomic, pm_index_type)
-
-        label = get_label(df, config)
+        if label is None:
+            add_course_index(df, config["feature"], config["is_atomic"], config["index_type"])
+            report_progress(progress, "index")
+            label = get_label(df, config)
+            report_progress(progress, "labels")
 
         unique_labels = label["label"].dropna().unique()
         count_labels = label["label"].value_counts()
@@ -852,6 +1227,7 @@ def get_features_label_from_dataframe(df, config):
                 return [], [], f"Extreme class imbalance detected:\n\nClass '{class_val}' has only {count} samples ({percentage:.1f}%), which is below the minimum threshold of {min_percentage}%.\n\nThis may lead to poor recall performance as reported in the paper (Section 6.1).\nConsider:\n- Increasing sample size\n- Adjusting class thresholds\n- Using different labeling strategy\n\nClass distribution:\n{count_labels}"
 
         features = get_features(df, config)
+        report_progress(progress, "features")
 
         features, label = drop_rows(features, label)
 
@@ -860,20 +1236,401 @@ def get_features_label_from_dataframe(df, config):
     except Exception as e:
         return [], [], f"Error procesando DataFrame: {str(e)}"
 
-def submit_handler_standalone_with_dataframe(df, config):
-    score_dict, DT_names, figures, parsed, error_msg = {}, [], [], [], ""
+def get_data_version(degree_id, table_name):
+    dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+    item = dynamodb.Table(table_name).get_item(Key={"PK": f"DEGREE#{degree_id}", "SK": "DATA-VERSION"}).get("Item")
+    if not item or "data_version" not in item:
+        return None
+    return str(item["data_version"])
+
+def get_analysis_config(analysis_config):
+    config = {f: analysis_config.get(f, default) for f, default in CONFIG_DEFAULTS.items()}
+    config["model"] = "DT"
+    return config
+
+def get_model_key(config):
+    # combinations are left out: a trained config answers any subset of its combinations
+    return json.dumps([config.get(f) for f in MODEL_FIELDS], default=str)
+
+def get_features_cache_key(table_name, degree_id, data_version, config, sample_size=None):
+    # the table is part of the key: stages share FEATURE_CACHE_DIR and their data versions can collide
+    return ("features", str(table_name), str(degree_id), data_version, str(sample_size)) + tuple(str(config.get(f)) for f in FEATURE_CACHE_FIELDS)
+
+def is_cacheable(data_version, sample_size, seed):
+    # unseeded samples differ on every call, so they are never cached
+    return data_version is not None and (not sample_size or seed is not None)
+
+def cache_path(key):
+    return os.path.join(FEATURE_CACHE_DIR, hashlib.sha1(repr(key).encode("utf-8")).hexdigest() + ".joblib")
+
+def get_cache_stats():
+    with _cache_lock:
+        return dict(cache_stats)
+
+def cache_get(key):
+    cache = _caches[key[0]]
+    with _cache_lock:
+        if key in cache:
+            cache.move_to_end(key)
+            cache_stats["hits"] += 1
+            return cache[key]
+    path = cache_path(key)
+    if key[0] in DISK_CACHE_KINDS and os.path.exists(path):
+        try:
+            value = joblib.load(path)
+            os.utime(path)
+        except Exception:
+            value = None
+        if value is not None:
+            with _cache_lock:
+                cache_stats["disk_hits"] += 1
+            cache_put(key, value, write_disk=False)
+            return value
+    with _cache_lock:
+        cache_stats["misses"] += 1
+    return None
+
+def cache_put(key, value, write_disk=True):
+    cache = _caches[key[0]]
+    with _cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > CACHE_SIZES[key[0]]:
+            cache.popitem(last=False)
+            cache_stats["evictions"] += 1
+    if not write_disk or key[0] not in DISK_CACHE_KINDS:
+        return
+    try:
+        os.makedirs(FEATURE_CACHE_DIR, exist_ok=True)
+        # written under a per-thread name and renamed, so a concurrent reader never loads half a file
+        path = cache_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        joblib.dump(value, tmp_path)
+        os.replace(tmp_path, path)
+        cached_files = []
+        for f in os.listdir(FEATURE_CACHE_DIR):
+            try:
+                cached_files.append((os.path.getmtime(os.path.join(FEATURE_CACHE_DIR, f)), f))
+            except OSError:
+                continue
+        cached_files = [f for _, f in sorted(cached_files) if f.endswith(".joblib")]
+        for f in cached_files[:max(0, len(cached_files) - FEATURE_CACHE_DISK_SIZE)]:
+            try:
+                os.remove(os.path.join(FEATURE_CACHE_DIR, f))
+            except FileNotFoundError:
+                pass
+    except OSError as e:
+        print(f"No se pudo escribir la caché en disco: {e}")
+
+def get_features_label_cached(df, config, cache_key=None, progress=None):
+    if cache_key is None:
+        return get_features_label_from_dataframe(df, config, progress=progress)
+    cached = cache_get(cache_key)
+    if cached is not None:
+        for stage in ["index", "labels", "features"]:
+            report_progress(progress, stage)
+        return cached
+    features, labels, error_msg = get_features_label_from_dataframe(df, config, progress=progress)
+    if features != []:
+        cache_put(cache_key, (features, labels, error_msg))
+    return features, labels, error_msg
+
+def submit_handler_standalone_with_dataframe(df, config, cache_key=None, progress=None):
+    score_dict, DT_names, figures, parsed, error_msg, trees = {}, [], [], [], "", []
+    try:
+        features, labels, error_msg = get_features_label_cached(df, config, cache_key, progress)
+        if features != []:
+            score_dict, DT_names, figures, parsed, error_msg, trees = classify(features, labels, config, progress)
+    except Exception as e:
+        error_msg = f"Error en análisis: {str(e)}"
+    return score_dict, DT_names, figures, parsed, error_msg, trees
+
+def get_sweep_label_key(config):
+    return (config["feature"], config["is_atomic"], config["index_type"]) + tuple(str(config.get(f)) for f in LABEL_FIELDS)
+
+def get_sweep_labels(indexed, config, configs, shared):
+    label_key = get_sweep_label_key(config)
+    if label_key in shared["label"]:
+        return shared["label"][label_key]
+    if config["label"] == "Overall GPA":
+        shared["label"][label_key] = get_label(indexed, config)
+        return shared["label"][label_key]
+    # course labels for every label_index the sweep asks for on this course come from one label engine
+    label_indices = list(dict.fromkeys(
+        c["label_index"] for c in configs
+        if get_sweep_label_key(dict(c, label_index=config["label_index"])) == label_key
+    ))
+    labels = get_course_grade_labels(
+        indexed, config["course"], config["is_binary_label"], config["is_atomic"], label_indices, config["is_pm"]
+    )
+    for label_index, label in labels.items():
+        shared["label"][get_sweep_label_key(dict(config, label_index=label_index))] = label
+    return shared["label"][label_key]
+
+def get_sweep_features_label(df, config, shared, cache_key=None, configs=None):
+    feature_key = tuple(str(config.get(f)) for f in FEATURE_CACHE_FIELDS)
+    if feature_key in shared["features"]:
+        return shared["features"][feature_key]
+    result = cache_get(cache_key) if cache_key is not None else None
+    if result is None:
+        index_key = (config["feature"], config["is_atomic"], config["index_type"])
+        try:
+            if index_key not in shared["index"]:
+                indexed = df.copy()
+                add_course_index(indexed, *index_key)
+                shared["index"][index_key] = indexed
+            label = get_sweep_labels(shared["index"][index_key], config, configs or [config], shared)
+            result = get_features_label_from_dataframe(shared["index"][index_key], config, label)
+        except Exception as e:
+            result = [], [], f"Error procesando DataFrame: {str(e)}"
+        if cache_key is not None and result[0] != []:
+            cache_put(cache_key, result)
+    shared["features"][feature_key] = result
+    return result
+
+def get_sweep_table(configs, results):
+    rows = []
+    for i, (config, result) in enumerate(zip(configs, results)):
+        score_dict, error_msg = result[0], result[4]
+        row = {"config": i}
+        row.update({f: config.get(f) for f in SWEEP_FIELDS})
+        if not score_dict:
+            rows.append(dict(row, combination=None, mean_accuracy=np.nan, std_accuracy=np.nan, error_msg=error_msg))
+        for combi, scores in score_dict.items():
+            acc = scores["accuracy"]
+            rows.append(dict(
+                row, combination=combi,
+                mean_accuracy=float(np.mean(acc)) if acc else np.nan,
+                std_accuracy=float(np.std(acc)) if acc else np.nan,
+                error_msg=error_msg,
+            ))
+    # object columns keep config values as given (e.g. label_index 2 next to None)
+    table = pd.DataFrame(rows, columns=["config"] + SWEEP_FIELDS + ["combination", "mean_accuracy", "std_accuracy", "error_msg"], dtype=object)
+    table = table.astype({"config": np.int64, "mean_accuracy": np.float64, "std_accuracy": np.float64})
+    return table.sort_values("mean_accuracy", ascending=False, kind="stable", na_position="last").reset_index(drop=True)
+
+def submit_sweep_with_dataframe(df, configs, n_jobs=1, cache_keys=None):
+    cache_keys = cache_keys or [None] * len(configs)
+    shared = {"index": {}, "label": {}, "features": {}}
+    executor = get_executor(n_jobs) if n_jobs and n_jobs > 1 else None
+    try:
+        # features are built once per distinct config; all CV fits go to a single pool before collecting
+        pending = []
+        for config, cache_key in zip(configs, cache_keys):
+            features, labels, error_msg = get_sweep_features_label(df, config, shared, cache_key, configs)
+            jobs = []
+            if features != []:
+                try:
+                    jobs, error_msg = submit_classify(features, labels, config, executor)
+                except Exception as e:
+                    features, error_msg = [], f"Error en análisis: {str(e)}"
+            pending.append((features, labels, jobs, error_msg))
+
+        results = []
+        for config, (features, labels, jobs, error_msg) in zip(configs, pending):
+            result = {}, [], [], [], error_msg, []
+            if features != []:
+                try:
+                    result = collect_classify(jobs, error_msg, features, labels, config)
+                except Exception as e:
+                    result = {}, [], [], [], f"Error en análisis: {str(e)}", []
+            results.append(result)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return get_sweep_table(configs, results), results
+
+def submit_depth_sweep_with_dataframe(df, config, cache_key=None):
+    curves, error_msg = {}, ""
     try:
-        features, labels, error_msg = get_features_label_from_dataframe(df, config)
+        features, labels, error_msg = get_features_label_cached(df, config, cache_key)
         if features != []:
-            score_dict, DT_names, figures, parsed, error_msg = classify(features, labels, config)
+            curves, error_msg = classify_depths(features, labels, config)
     except Exception as e:
         error_msg = f"Error en análisis: {str(e)}"
-    return score_dict, DT_names, figures, parsed, error_msg
+    return curves, error_msg
+
+def add_student_columns(df):
+    # per-student columns kept in the persisted frame; df must hold every row of its students
+    sem = df["fachsemester"]
+    by_student = df.groupby("studentstudyid", sort=False, observed=True)["fachsemester"]
+    df["order-index"] = by_student.rank(method="dense").astype("int64")
+    df["distance-index"] = sem - by_student.transform("min")
+    first_attempt_sem = df.groupby(["studentstudyid", "Course"], sort=False, observed=True)["fachsemester"].transform("min")
+    df["first-attempt"] = (sem == first_attempt_sem).values
+    students = df["studentstudyid"].values
+    for GPA_grades in ["passed+failed last attempt", "passed", ""]:
+        _, student_GPAs = get_GPA_rows(df, GPA_grades)
+        df[get_GPA_column(GPA_grades)] = student_GPAs["GPA"].reindex(students).values
+
+def get_course_grade_counts(df):
+    if df.empty:
+        return pd.DataFrame(dtype=np.int64)
+    counts = df.groupby([df["Course"].astype(object), "course-grade"], sort=False).size().unstack(fill_value=0)
+    counts.index.name, counts.columns.name = None, None
+    return counts
+
+def set_course_medians(df, counts):
+    # medians come from the per-course grade counts, so an update only has to adjust the counts of its rows
+    counts = counts.reindex(columns=sorted(counts.columns))
+    values, c = counts.columns.values.astype(np.float64), counts.values
+    n, cum = c.sum(axis=1), c.cumsum(axis=1)
+    lower = values[(cum <= ((n - 1) // 2)[:, None]).sum(axis=1)]
+    upper = values[(cum <= (n // 2)[:, None]).sum(axis=1)]
+    medians = pd.Series((lower + upper) / 2, index=counts.index)
+    courses = df["Course"].cat
+    df["course-median"] = medians.reindex(courses.categories).values[courses.codes.values]
+
+def get_student_names(items):
+    return {f"student_{item.get('id', '')}": item["SK"] for item in items}
+
+def build_degree_state(items, version):
+    df = convert_dynamodb_to_asb_format(items)
+    if df.empty:
+        raise ValueError("No se pudieron obtener datos de DynamoDB")
+    add_student_columns(df)
+    counts = get_course_grade_counts(df)
+    set_course_medians(df, counts)
+    return {"version": version, "frame": df, "keys": get_student_names(items), "course_grades": counts}
+
+def update_degree_state(state, items, changed, version):
+    frame = state["frame"]
+    changed = set(changed)
+    changed_names = [name for name, sk in state["keys"].items() if sk in changed]
+    removed = frame["studentstudyid"].isin(changed_names).values
+    kept = frame[~removed]
+    delta = convert_dynamodb_to_asb_format(items) if items else pd.DataFrame()
+    if not delta.empty:
+        add_student_columns(delta)
+
+    counts = state["course_grades"].sub(get_course_grade_counts(frame[removed]), fill_value=0)
+    counts = counts.add(get_course_grade_counts(delta), fill_value=0).fillna(0).astype(np.int64)
+    counts = counts[counts.sum(axis=1) > 0]
+
+    keys = {name: sk for name, sk in state["keys"].items() if sk not in changed}
+    keys.update(get_student_names(items))
+
+    columns = [c for c in frame.columns if c != "course-median"]
+    parts = [kept] if delta.empty else [kept, delta]
+    categories, codes = {}, {}
+    for col in ("studentstudyid", "Course"):
+        cats = kept[col].cat.categories
+        col_codes = [kept[col].cat.codes.values]
+        if not delta.empty:
+            cats = cats.append(delta[col].cat.categories[~delta[col].cat.categories.isin(cats)])
+            col_codes.append(cats.get_indexer(delta[col].cat.categories)[delta[col].cat.codes.values])
+        categories[col], codes[col] = cats, np.concatenate(col_codes)
+    rest = pd.concat([p[[c for c in columns if c not in codes]] for p in parts], ignore_index=True)
+
+    # rows follow the SK order of a full query, so the frame matches a rebuild from scratch
+    # categories of removed students have no rows left, so their missing keys do not matter
+    sk = pd.Series(keys, dtype=object).reindex(categories["studentstudyid"]).fillna("").values
+    student_rank = np.argsort(np.argsort(sk, kind="stable"), kind="stable")
+    order = np.argsort(student_rank[codes["studentstudyid"]], kind="stable")
+    df = rest.iloc[order].reset_index(drop=True)
+    for col in ("studentstudyid", "Course"):
+        # categories go back to first-appearance order, as the converter emits them
+        col_codes, uniques = pd.factorize(codes[col][order])
+        df[col] = pd.Categorical.from_codes(col_codes, categories=categories[col][uniques])
+    df = df[columns]
+    set_course_medians(df, counts)
+    return {"version": version, "frame": df, "keys": keys, "course_grades": counts}
+
+def get_changed_student_keys(degree_id, table_name, since, version, page_limit=1000):
+    dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+    table = dynamodb.Table(table_name)
+    key_cond = Key("PK").eq(f"DEGREE#{degree_id}") & Key("SK").between(
+        f"DATA-CHANGE#{since + 1:010d}", f"DATA-CHANGE#{version:010d}")
+
+    changes = []
+    start_key = None
+    while True:
+        params = {"KeyConditionExpression": key_cond, "Limit": page_limit}
+        if start_key:
+            params["ExclusiveStartKey"] = start_key
+        resp = table.query(**params)
+        changes.extend(resp.get("Items", []))
+        start_key = resp.get("LastEvaluatedKey")
+        if not start_key:
+            break
 
-def main(degree_id, table_name, sample_size, config):
+    # every version bump writes one change record; a gap means the delta is unknown
+    if len(changes) != version - since:
+        return None
+    return [{"PK": f"DEGREE#{degree_id}", "SK": sk} for sk in sorted({f"STUDENTS#{c['student_id']}" for c in changes})]
+
+def get_state_s3_key(degree_id, table_name):
+    return f"{os.environ.get('S3_PREFIX', 'recommenders')}/asb-frames/{table_name}/{degree_id}.joblib"
+
+def get_persisted_state(degree_id, table_name):
+    bucket = os.environ.get("S3_BUCKET")
+    if not bucket:
+        return None
+    try:
+        obj = boto3.client("s3").get_object(Bucket=bucket, Key=get_state_s3_key(degree_id, table_name))
+        return joblib.load(io.BytesIO(obj["Body"].read()))
+    except Exception as e:
+        print(f"No se pudo leer el frame ASB persistido: {e}")
+        return None
+
+def persist_state(degree_id, table_name, state):
+    bucket = os.environ.get("S3_BUCKET")
+    if not bucket:
+        return
+    try:
+        buffer = io.BytesIO()
+        joblib.dump(state, buffer)
+        boto3.client("s3").put_object(Bucket=bucket, Key=get_state_s3_key(degree_id, table_name), Body=buffer.getvalue())
+    except Exception as e:
+        print(f"No se pudo persistir el frame ASB: {e}")
+
+def load_degree_state(degree_id, table_name, data_version):
+    key = ("degree-state", str(degree_id), table_name)
+    version = int(data_version)
+    state = cache_get(key)
+    if state is None or state["version"] != version:
+        # another instance may have persisted a newer state than the one cached here
+        candidates = [s for s in (state, get_persisted_state(degree_id, table_name)) if s is not None and s["version"] <= version]
+        state = max(candidates, key=lambda s: s["version"]) if candidates else None
+    if state is not None and state["version"] == version:
+        cache_put(key, state, write_disk=False)
+        return state
+
+    changed = None
+    if state is not None and state["version"] < version:
+        changed = get_changed_student_keys(degree_id, table_name, state["version"], version)
+    if changed is None:
+        print(f"Reconstruyendo el frame ASB completo (versión {version})")
+        state = build_degree_state(get_training_data(degree_id, table_name), version)
+    else:
+        print(f"Actualizando el frame ASB de la versión {state['version']} a la {version}: {len(changed)} estudiantes modificados")
+        items = get_student_items(table_name, changed) if changed else []
+        state = update_degree_state(state, items, [k["SK"] for k in changed], version)
+    cache_put(key, state)
+    persist_state(degree_id, table_name, state)
+    return state
+
+def load_degree_frame(degree_id, table_name, sample_size, data_version, seed=None, sample_by=None):
+    if not is_cacheable(data_version, sample_size, seed):
+        return format_from_dynamodb(degree_id, table_name, sample_size, seed, sample_by)
+    if not sample_size:
+        return load_degree_state(degree_id, table_name, data_version)["frame"]
+    key = ("frame", str(degree_id), table_name, data_version, sample_size, seed, sample_by)
+    df = cache_get(key)
+    if df is None:
+        df = format_from_dynamodb(degree_id, table_name, sample_size, seed, sample_by)
+        cache_put(key, df)
+    return df
+
+def main(degree_id, table_name, sample_size, config, progress=None):
     try:
         print(f"Obteniendo datos para degree_id: {degree_id}")
-        df_asb = format_from_dynamodb(degree_id=degree_id, table_name=table_name, sample_size=sample_size)
+        report_progress(progress, "fetch", 0, 1)
+        data_version = get_data_version(degree_id, table_name)
+        seed, sample_by = config.get("sample_seed"), config.get("sample_by")
+        df_asb = load_degree_frame(degree_id, table_name, sample_size, data_version, seed, sample_by)
+        report_progress(progress, "fetch")
 
         print("\n=== Data Statistics ===")
         print(f"Total records: {len(df_asb)}")
@@ -885,7 +1642,10 @@ def main(degree_id, table_name, sample_size, config):
         print(df_asb.head(10).to_string())
         print(f"\nSuccessfully formatted data for degree {degree_id}")
 
-        score_dict, DT_names, figures, parsed, error_msg = submit_handler_standalone_with_dataframe(df_asb.copy(), config)
+        cache_key = None
+        if is_cacheable(data_version, sample_size, seed):
+            cache_key = get_features_cache_key(table_name, degree_id, data_version, config, sample_size)
+        score_dict, DT_names, figures, parsed, error_msg, trees = submit_handler_standalone_with_dataframe(df_asb.copy(), config, cache_key, progress)
         if error_msg:
             print(f"Error: {error_msg}")
         else:
@@ -894,14 +1654,59 @@ def main(degree_id, table_name, sample_size, config):
             print(f"Scores: {score_dict}")
             if figures and figures[0]:
                 print(f"Base64 image length (first): {len(figures[0])} chars")
+        print(f"Feature cache: {get_cache_stats()}")
+        print(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+        return score_dict, DT_names, figures, parsed, error_msg, trees
 
-        return score_dict, DT_names, figures, parsed, error_msg
+    except Exception as e:
+        print(f"Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return {}, [], [], [], f"Error en main_with_params: {str(e)}", []
+
+def sweep(degree_id, table_name, sample_size, configs, n_jobs=1, seed=None, sample_by=None):
+    try:
+        print(f"Obteniendo datos para degree_id: {degree_id} ({len(configs)} configuraciones)")
+        data_version = get_data_version(degree_id, table_name)
+        df_asb = load_degree_frame(degree_id, table_name, sample_size, data_version, seed, sample_by)
+
+        cache_keys = None
+        if is_cacheable(data_version, sample_size, seed):
+            cache_keys = [get_features_cache_key(table_name, degree_id, data_version, dict(c, sample_seed=seed, sample_by=sample_by), sample_size) for c in configs]
+        table, results = submit_sweep_with_dataframe(df_asb, configs, n_jobs, cache_keys)
+        print(table.head(10).to_string())
+        print(f"Feature cache: {get_cache_stats()}")
+        return table, results
+
+    except Exception as e:
+        print(f"Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return get_sweep_table([], []), []
+
+def depth_sweep(degree_id, table_name, sample_size, config):
+    try:
+        print(f"Obteniendo datos para degree_id: {degree_id} (profundidades 1-{config['max_depth']})")
+        data_version = get_data_version(degree_id, table_name)
+        seed, sample_by = config.get("sample_seed"), config.get("sample_by")
+        df_asb = load_degree_frame(degree_id, table_name, sample_size, data_version, seed, sample_by)
+
+        cache_key = None
+        if is_cacheable(data_version, sample_size, seed):
+            cache_key = get_features_cache_key(table_name, degree_id, data_version, config, sample_size)
+        curves, error_msg = submit_depth_sweep_with_dataframe(df_asb.copy(), config, cache_key)
+        if error_msg:
+            print(f"Error: {error_msg}")
+        for combi, curve in curves.items():
+            print(f"{combi}: {[(depth, scores['mean_accuracy']) for depth, scores in curve.items()]}")
+        return curves, error_msg
 
     except Exception as e:
         print(f"Error: {e}")
         import traceback
         traceback.print_exc()
-        return {}, [], [], [], f"Error en main_with_params: {str(e)}"
+        return {}, f"Error en depth_sweep: {str(e)}"
 
 if __name__ == "__main__":
     degree_id = "2491"
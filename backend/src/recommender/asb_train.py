@@ -0,0 +1,149 @@
+import os
+import sys
+import json
+import joblib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+sys.path.append('/opt/ml/code')
+from asb_recommender import (
+    format_from_dynamodb,
+    get_analysis_config,
+    get_data_version,
+    get_model_key,
+    submit_sweep_with_dataframe,
+)
+
+
+def env_bool(name: str, default: bool) -> bool:
+    return os.environ.get(name, str(default)).strip().lower() in ("true", "1", "yes")
+
+def env_optional_int(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.environ.get(name, "").strip()
+    if value.lower() in ("", "none", "null"):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        return default
+
+def get_env_config() -> Dict[str, Any]:
+    # the train handler also sends ASB_CRITERION, ASB_RANDOM_STATE, ASB_MIN_SAMPLES_LEAF/SPLIT, ASB_USE_SMOTE and
+    # ASB_BINARY_THRESHOLD; ASB trees and labels are fixed (gini, random_state 100, 2.5 cut), so those are ignored
+    return {
+        "label": os.environ.get("ASB_LABEL", "Overall GPA"),
+        "GPA_grades": os.environ.get("ASB_GPA_GRADES", "passed+failed last attempt"),
+        "course": os.environ.get("ASB_COURSE") or None,
+        "is_binary_label": env_bool("ASB_IS_BINARY", False),
+        "max_depth": env_optional_int("ASB_MAX_DEPTH", 3),
+        "is_atomic": env_bool("ASB_IS_ATOMIC", True),
+        "is_pm": env_bool("ASB_IS_PM", False),
+        "index_type": os.environ.get("ASB_INDEX_TYPE", "fachsemester"),
+        "feature": os.environ.get("ASB_FEATURE", "Course-Semester"),
+        "combinations": [c.strip() for c in os.environ.get("ASB_COMBINATIONS", "behav").split(",") if c.strip()],
+        "label_index": env_optional_int("ASB_LABEL_INDEX", None),
+        "pm_vocabulary": os.environ.get("ASB_PM_VOCABULARY", "all"),
+        "pm_min_support": env_optional_int("ASB_PM_MIN_SUPPORT", 1),
+    }
+
+def get_train_configs() -> List[Dict[str, Any]]:
+    # ASB_CONFIGS is a JSON list of analysis configs; each one overrides the ASB_* values
+    env_config = get_env_config()
+    raw = os.environ.get("ASB_CONFIGS", "").strip()
+    overrides = json.loads(raw) if raw else []
+    if not overrides:
+        overrides = [{}]
+    return [get_analysis_config(dict(env_config, **o)) for o in overrides]
+
+def build_models(configs: List[Dict[str, Any]], results: List[tuple]) -> Dict[str, Dict[str, Any]]:
+    models = {}
+    for config, (score_dict, DT_names, _, parsed, error_msg, trees) in zip(configs, results):
+        models[get_model_key(config)] = {
+            "config": config,
+            "error_msg": error_msg,
+            "combinations": {
+                combi: {"scores": score_dict[combi], "tree": trees[i], "rules": parsed[i]}
+                for i, combi in enumerate(DT_names)
+            }
+        }
+    return models
+
+
+def train(model_dir: str = "/opt/ml/model"):
+    print("Iniciando entrenamiento ASB")
+
+    degree_id = os.environ.get("DEGREE_ID", "2491")
+    table_name = os.environ.get("DDB_TABLE", "AdaProjectTable")
+    n_jobs = env_optional_int("ASB_WORKERS", os.cpu_count() or 1)
+    configs = get_train_configs()
+
+    print(f"Config: DEGREE_ID={degree_id}, DDB_TABLE={table_name}, configuraciones={len(configs)}, n_jobs={n_jobs}")
+
+    print("Cargando datos de DynamoDB…")
+    data_version = get_data_version(degree_id, table_name)
+    df = format_from_dynamodb(degree_id, table_name)
+    if df.empty:
+        raise ValueError(f"No se encontraron items para DEGREE#{degree_id}")
+    print(f"Registros: {len(df)}, estudiantes: {df['studentstudyid'].nunique()}, materias: {df['Course'].nunique()}")
+
+    # rules are kept structured; inference derives the text format from them
+    train_configs = [dict(c, rules_format="structured", n_jobs=n_jobs) for c in configs]
+    table, results = submit_sweep_with_dataframe(df, train_configs, n_jobs)
+    print("===== ASB SWEEP =====")
+    print(table.to_string())
+
+    models = build_models(configs, results)
+    trained = sum(1 for m in models.values() if m["combinations"])
+    if not trained:
+        errors = [m["error_msg"] for m in models.values()]
+        raise ValueError(f"Ninguna configuración ASB pudo entrenarse: {errors}")
+
+    artifact = {
+        "schema_version": 1,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "degree_id": degree_id,
+        "data_version": data_version,
+        "models": models,
+        "counts": {
+            "records": int(len(df)),
+            "students": int(df["studentstudyid"].nunique()),
+            "courses": int(df["Course"].nunique()),
+            "configs": len(configs),
+            "configs_trained": trained
+        }
+    }
+
+    os.makedirs(model_dir, exist_ok=True)
+
+    model_path = os.path.join(model_dir, "model.joblib")
+    joblib.dump(artifact, model_path)
+
+    report_path = os.path.join(model_dir, "report.csv")
+    table.to_csv(report_path, index=False)
+
+    metadata_path = os.path.join(model_dir, "metadata.json")
+    metadata = {
+        "algorithm": "asb",
+        "model_type": "DecisionTreeSweep",
+        "export_time": datetime.now(timezone.utc).isoformat(),
+        "model_files": ["model.joblib", "report.csv"],
+        "training_info": {
+            "degree_id": degree_id,
+            "ddb_table": table_name,
+            "data_version": data_version,
+            "training_date": datetime.now(timezone.utc).isoformat(),
+            **artifact["counts"]
+        },
+        "configs": configs,
+        "sweep": table.astype(object).where(table.notna(), None).to_dict(orient="records")
+    }
+    with open(metadata_path, "w") as f:
+        json.dump(metadata, f, indent=2, default=str)
+
+    print("Entrenamiento completado.")
+    print(f"   - model.joblib: {os.path.getsize(model_path)} bytes")
+    print(f"   - metadata.json: {os.path.getsize(metadata_path)} bytes")
+    print(f"   - report.csv: {os.path.getsize(report_path)} bytes")
+
+if __name__ == "__main__":
+    train()
@@ -29,10 +29,12 @@ def main():
     print(f"Algoritmo final: '{algorithm}'")
     print("=== FIN DEBUGGING ===")
 
-    if algorithm in ['rf', 'pm', 'spm']:
+    if algorithm in ['asb', 'rf', 'pm', 'spm']:
         print(f"Iniciando entrenamiento de {algorithm.upper()}...")
 
-        if algorithm == 'rf':
+        if algorithm == 'asb':
+            script = 'asb_train.py'
+        elif algorithm == 'rf':
             script = 'rf_train.py'
         elif algorithm == 'pm':
             script = 'pm_train.py'
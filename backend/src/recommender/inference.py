@@ -8,8 +8,9 @@ from flask import Flask, request, jsonify
 sys.path.append('/opt/ml/code')
 
 from rf_inference import predict_rf
-from pm_inference import predict_pm
+from pm_inference import predict_pm, load_peer_index, load_peer_lsh
 from spm_inference import predict_spm
+from asb_inference import predict_asb
 
 
 def get_model(model_dir):
@@ -21,7 +22,15 @@ def get_model(model_dir):
     model_path = os.path.join(model_dir, 'model.joblib')
     model = joblib.load(model_path)
 
-    return {'model': model, 'metadata': metadata}
+    model_dict = {'model': model, 'metadata': metadata}
+    if metadata.get('algorithm') == 'pm':
+        peer_index = load_peer_index(model_dir)
+        if peer_index is not None:
+            model_dict['peer_index'] = peer_index
+        peer_lsh = load_peer_lsh(model_dir)
+        if peer_lsh is not None:
+            model_dict['peer_lsh'] = peer_lsh
+    return model_dict
 
 def get_prediction(input_data, model_dict):
     algorithm = input_data.get('algorithm', '').lower()
@@ -32,6 +41,8 @@ def get_prediction(input_data, model_dict):
         return predict_pm(input_data, model_dict)
     elif algorithm == 'spm':
         return predict_spm(input_data, model_dict)
+    elif algorithm == 'asb':
+        return predict_asb(input_data, model_dict)
     else:
         raise ValueError(f"Algoritmo '{algorithm}' no soportado")
 
@@ -3,9 +3,20 @@ import sys
 import json
 import boto3
 import joblib
+import numpy as np
 from datetime import datetime, timezone
 from typing import Dict, Any, List, Tuple, Set, Optional
 
+from pm_peers import (
+    build_peer_index,
+    peer_student_id,
+    new_retrieval_stats,
+    retrieval_summary,
+    retrieve_similar_peers,
+    next_term_occurrences,
+)
+from pm_lsh import lsh_candidates
+
 def ddb_table():
     region = os.getenv("AWS_REGION") or os.getenv("AWS_DEFAULT_REGION") or "us-east-1"
     ddb = boto3.resource("dynamodb", region_name=region)
@@ -191,75 +202,6 @@ def build_target_terms(item: Dict[str, Any]) -> List[List[str]]:
     return [sorted(subjects_by_term[k]) for k in sorted(subjects_by_term.keys())]
 
 
-REL_DIRECT = "->"
-REL_INDIRECT = "->>"
-REL_REV_DIRECT = "<-"
-REL_REV_INDIRECT = "<<-"
-REL_SAME = "||"
-REL_OTHER = "#"
-
-def index_terms_by_course(sequence_of_terms: List[List[str]]) -> Dict[str, Tuple[int, int]]:
-    index: Dict[str, Tuple[int, int]] = {}
-    for term_index, term_courses in enumerate(sequence_of_terms):
-        for position_in_term, course_code in enumerate(term_courses):
-            index[course_code] = (term_index, position_in_term)
-    return index
-
-def relation_between_courses(a: str, b: str, index_map: Dict[str, Tuple[int, int]]) -> str:
-    if a == b or a not in index_map or b not in index_map:
-        return REL_OTHER
-
-    term_a, _ = index_map[a]
-    term_b, _ = index_map[b]
-
-    if term_a == term_b:
-        return REL_SAME
-    if term_b == term_a + 1:
-        return REL_DIRECT
-    if term_b > term_a + 1:
-        return REL_INDIRECT
-    if term_a == term_b + 1:
-        return REL_REV_DIRECT
-    if term_a > term_b + 1:
-        return REL_REV_INDIRECT
-    return REL_OTHER
-
-def build_footprint_map(sequence_of_terms: List[List[str]], universe: Set[str]) -> Dict[Tuple[str, str], str]:
-    index_map = index_terms_by_course(sequence_of_terms)
-    footprint: Dict[Tuple[str, str], str] = {}
-    for course_a in universe:
-        for course_b in universe:
-            if course_a == course_b:
-                continue
-            footprint[(course_a, course_b)] = relation_between_courses(course_a, course_b, index_map)
-    return footprint
-
-def similarity_of_footprints(seq_a: List[List[str]], seq_b: List[List[str]]) -> float:
-    length = min(len(seq_a), len(seq_b))
-    if length == 0:
-        return 0.0
-
-    truncated_a = seq_a[:length]
-    truncated_b = seq_b[:length]
-
-    universe: Set[str] = set([c for term in truncated_a for c in term] + [c for term in truncated_b for c in term])
-    if len(universe) <= 1:
-        return 1.0
-
-    fp_a = build_footprint_map(truncated_a, universe)
-    fp_b = build_footprint_map(truncated_b, universe)
-
-    total_pairs = len(fp_a)
-    differences = sum(1 for key, value in fp_a.items() if value != fp_b.get(key))
-    return 1.0 - (differences / max(1, total_pairs))
-
-
-def candidates_from_peer(peer_terms: List[List[str]], target_last_term: int) -> List[str]:
-    idx = target_last_term
-    if idx < len(peer_terms):
-        return list(peer_terms[idx])
-    return []
-
 def rank_candidates(candidates: Dict[str, Dict[str, Any]],
                     course_stats: Dict[str, Dict[str, float]]) -> List[Dict[str, Any]]:
     ranked = []
@@ -288,7 +230,35 @@ def load_model(model_dir: str = "/opt/ml/model") -> Dict[str, Any]:
     if os.path.exists(metadata_path):
         with open(metadata_path, "r") as f:
             metadata = json.load(f)
-    return {"model": model, "metadata": metadata}
+    model_pack = {"model": model, "metadata": metadata}
+    peer_index = load_peer_index(model_dir)
+    if peer_index is not None:
+        model_pack["peer_index"] = peer_index
+    peer_lsh = load_peer_lsh(model_dir)
+    if peer_lsh is not None:
+        model_pack["peer_lsh"] = peer_lsh
+    return model_pack
+
+def load_peer_index(model_dir: str = "/opt/ml/model") -> Optional[Dict[str, Any]]:
+    # memory-mapped: startup only reads the vocabulary and every worker shares the page cache copy
+    peer_index_path = os.path.join(model_dir, "peer_index.joblib")
+    if not os.path.exists(peer_index_path):
+        return None
+    return joblib.load(peer_index_path, mmap_mode="r")
+
+def load_peer_lsh(model_dir: str = "/opt/ml/model") -> Optional[Dict[str, Any]]:
+    # only present when the model was trained with PM_LSH_BANDS > 0
+    peer_lsh_path = os.path.join(model_dir, "peer_lsh.joblib")
+    if not os.path.exists(peer_lsh_path):
+        return None
+    return joblib.load(peer_lsh_path, mmap_mode="r")
+
+def approximate_by_default(peer_lsh: Optional[Dict[str, Any]]) -> bool:
+    # opt-in for the whole endpoint (PM_RETRIEVAL=approximate), and only with an index whose recall
+    # against exact retrieval, measured at training, reaches PM_LSH_MIN_RECALL
+    if peer_lsh is None or os.getenv("PM_RETRIEVAL", "exact").lower() != "approximate":
+        return False
+    return float(peer_lsh.get("recall", 0.0)) >= float(os.getenv("PM_LSH_MIN_RECALL", "0.95"))
 
 def predict_pm(input_data: Dict[str, Any], model_pack: Dict[str, Any]) -> Dict[str, Any]:
     model = model_pack["model"]
@@ -307,6 +277,15 @@ def predict_pm(input_data: Dict[str, Any], model_pack: Dict[str, Any]) -> Dict[s
         min_sim = float(input_data.get("min_sim", similarity_threshold))
     except Exception:
         min_sim = similarity_threshold
+    peer_lsh = model_pack.get("peer_lsh")
+    retrieval_mode = str(input_data.get("retrieval", "exact")).lower()
+    if retrieval_mode not in ("exact", "approximate"):
+        return {"error": "retrieval debe ser 'exact' o 'approximate'"}
+    if "retrieval" not in input_data and approximate_by_default(peer_lsh):
+        retrieval_mode = "approximate"
+    if peer_lsh is None or min_sim < float(peer_lsh["min_sim"]):
+        # below the threshold the index was validated at, buckets stop tracking footprint similarity
+        retrieval_mode = "exact"
 
     student_id = input_data.get("student_id") or input_data.get("studentId")
     if student_id is None:
@@ -324,35 +303,46 @@ def predict_pm(input_data: Dict[str, Any], model_pack: Dict[str, Any]) -> Dict[s
     if not target_terms:
         return {"error": "El estudiante no tiene materias APR válidas para analizar."}
 
-    successful_students = model.get("successful_students", [])
-    if not successful_students:
+    peer_index = model_pack.get("peer_index")
+    if peer_index is None:
+        # artifacts before schema 4 carry the successful students as lists; the index is built once per loaded model
+        peer_index = model_pack["peer_index"] = build_peer_index(model.get("successful_students", []))
+    n_peers = len(peer_index["lengths"])
+    if not n_peers:
         return {"error": f"No hay estudiantes exitosos en el modelo (gpa ≥ {gpa_success_threshold})"}
 
-    L_target = len(target_terms)
+    retrieval_stats = new_retrieval_stats()
+    lsh_peers = lsh_candidates(target_terms, peer_index, peer_lsh) if retrieval_mode == "approximate" else None
+    peers, similarities = retrieve_similar_peers(target_terms, peer_index, min_sim, retrieval_stats, lsh_peers)
+    retrieval_stats["mode"] = retrieval_mode
+    non_empty = peer_index["lengths"][peers] > 0
+    peers, similarities = peers[non_empty], similarities[non_empty]
     similar_peers = []
-    for peer in successful_students:
-        peer_terms = peer.get("subjects_by_term", [])
-        if not peer_terms:
-            continue
-        sim = similarity_of_footprints(target_terms, peer_terms)
-        if sim >= min_sim:
-            similar_peers.append({
-                "student_id": peer.get("student_id"),
-                "gpa": float(peer.get("gpa", 0.0)),
-                "sim": float(round(sim, 6)),
-                "terms": peer_terms
-            })
+    for i, sim in zip(peers, similarities):
+        similar_peers.append({
+            "student_id": peer_student_id(peer_index, i),
+            "gpa": float(peer_index["gpas"][i]),
+            "sim": float(round(float(sim), 6)),
+            "peer": int(i)
+        })
     similar_peers.sort(key=lambda x: x["sim"], reverse=True)
 
-    completed_courses = set([c for term in target_terms for c in term])
-    candidates: Dict[str, Dict[str, Any]] = {}
-    for sp in similar_peers:
-        for c in candidates_from_peer(sp["terms"], L_target):
-            if c in completed_courses:
-                continue
-            agg = candidates.setdefault(c, {"support": 0, "sim_sum": 0.0})
-            agg["support"] += 1
-            agg["sim_sum"] += sp["sim"]
+    # candidates are accumulated in similar_peers order so sim_sum adds up exactly as a per-peer loop
+    ranked_peers = np.array([sp["peer"] for sp in similar_peers], dtype=np.int64)
+    peer_sims = np.array([sp["sim"] for sp in similar_peers], dtype=np.float64)
+    next_owners, next_courses = next_term_occurrences(peer_index, ranked_peers, len(target_terms))
+    vocabulary = peer_index["vocabulary"]
+    completed = np.zeros(len(vocabulary), dtype=bool)
+    completed[[vocabulary[c] for term in target_terms for c in term if c in vocabulary]] = True
+    keep = ~completed[next_courses]
+    next_owners, next_courses = next_owners[keep], next_courses[keep]
+    support = np.bincount(next_courses, minlength=len(vocabulary))
+    sim_sum = np.bincount(next_courses, weights=peer_sims[next_owners], minlength=len(vocabulary))
+    courses = peer_index["courses"]
+    candidates: Dict[str, Dict[str, Any]] = {
+        courses[c]: {"support": int(support[c]), "sim_sum": float(sim_sum[c])}
+        for c in np.flatnonzero(support)
+    }
 
     if not candidates:
         return {
@@ -363,6 +353,7 @@ def predict_pm(input_data: Dict[str, Any], model_pack: Dict[str, Any]) -> Dict[s
             "student_id": student_id,
             "params": {"k": k, "min_sim": min_sim, "gpa_success_threshold": gpa_success_threshold},
             "similar_peers": [{"student_id": s["student_id"], "sim": round(s["sim"], 4)} for s in similar_peers[:20]],
+            "retrieval": retrieval_summary(retrieval_stats),
             "recommendations": [],
             "message": "No se encontraron candidatos (el próximo término de pares similares coincide con cursos ya completados)."
         }
@@ -385,6 +376,7 @@ def predict_pm(input_data: Dict[str, Any], model_pack: Dict[str, Any]) -> Dict[s
         "student_id": student_id,
         "params": {"k": k, "min_sim": min_sim, "gpa_success_threshold": gpa_success_threshold},
         "similar_peers": [{"student_id": s["student_id"], "sim": round(s["sim"], 4)} for s in similar_peers[:20]],
+        "retrieval": retrieval_summary(retrieval_stats),
         "recommendations": topk
     }
 
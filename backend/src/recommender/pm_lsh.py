@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import joblib
+import numpy as np
+from typing import Dict, Any, List, Optional, Tuple
+
+sys.path.append('/opt/ml/code')
+
+from pm_peers import concat_ranges, retrieve_similar_peers
+
+# Approximate PM peer retrieval. A trajectory truncated to l terms is sketched as the MinHash of its
+# (course a, course b, relation) pairs; peers are banded per prefix length, so a target only meets
+# peers under the same truncation similarity_of_footprints applies. Candidates are re-scored exactly.
+# Relation-set Jaccard only tracks footprint similarity at high thresholds: two disjoint trajectories
+# already score ~0.5 on shared '#' pairs, so an index is only used at or above its own min_sim.
+
+LSH_SEED = 0x5EED
+
+def mix64(x: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer; uint64 arithmetic wraps
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+def hash_seeds(n_hashes: int) -> np.ndarray:
+    return mix64(np.arange(1, n_hashes + 1, dtype=np.uint64) + np.uint64(LSH_SEED))
+
+def relation_tokens(last_terms: Dict[int, int]) -> np.ndarray:
+    # one token per unordered course pair and its relation, clipped like relation_matrix
+    courses = np.array(sorted(last_terms), dtype=np.int64)
+    terms = np.array([last_terms[c] for c in courses.tolist()], dtype=np.int64)
+    i, j = np.triu_indices(len(courses), k=1)
+    relation = np.clip(terms[j] - terms[i], -2, 2) + 2
+    pairs = (courses[i].astype(np.uint64) << np.uint64(24)) | courses[j].astype(np.uint64)
+    return pairs * np.uint64(5) + relation.astype(np.uint64)
+
+def minhash_signature(tokens: np.ndarray, seeds: np.ndarray) -> np.ndarray:
+    # trajectories with fewer than two courses all share the empty-set signature
+    if len(tokens) == 0:
+        return np.full(len(seeds), np.iinfo(np.uint64).max, dtype=np.uint64)
+    return mix64(tokens[None, :] ^ seeds[:, None]).min(axis=1)
+
+def band_keys(signatures: np.ndarray, bands: int, rows: int) -> np.ndarray:
+    # (..., bands * rows or more) signatures -> (..., bands) bucket keys, tagged with the band so
+    # all bands of a prefix length share one sorted array
+    banded = signatures[..., :bands * rows].reshape(signatures.shape[:-1] + (bands, rows))
+    keys = np.broadcast_to(np.arange(bands, dtype=np.uint64), banded.shape[:-1])
+    for row in range(rows):
+        keys = mix64(keys ^ banded[..., row])
+    return keys
+
+def prefix_last_terms(courses: List[int], terms: List[int], length: int) -> Dict[int, int]:
+    # course -> last term among the first `length` terms, as index_terms_by_course keeps it
+    return {c: t for c, t in zip(courses, terms) if t < length}
+
+def peer_signatures(peer_index: Dict[str, Any], n_hashes: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    # per prefix length l: (peers with at least l terms, their signatures truncated to l)
+    seeds = hash_seeds(n_hashes)
+    lengths = peer_index["lengths"]
+    offsets = peer_index["offsets"]
+    by_length: List[Tuple[List[int], List[np.ndarray]]] = [([], []) for _ in range(int(lengths.max(initial=0)))]
+    for peer in range(len(lengths)):
+        courses = peer_index["occ_course"][offsets[peer]:offsets[peer + 1]].tolist()
+        terms = peer_index["occ_term"][offsets[peer]:offsets[peer + 1]].tolist()
+        for length in range(1, int(lengths[peer]) + 1):
+            by_length[length - 1][0].append(peer)
+            by_length[length - 1][1].append(minhash_signature(relation_tokens(prefix_last_terms(courses, terms, length)), seeds))
+    return [(np.array(peers, dtype=np.int32), np.array(sigs, dtype=np.uint64).reshape(len(peers), n_hashes))
+            for peers, sigs in by_length]
+
+def build_peer_lsh(peer_index: Dict[str, Any],
+                   bands: int = 16,
+                   rows: int = 4,
+                   signatures: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None,
+                   min_sim: float = 0.6) -> Dict[str, Any]:
+    if signatures is None:
+        signatures = peer_signatures(peer_index, bands * rows)
+    # per length l, "prefixes" holds every peer truncated to l (targets of exactly l terms) and
+    # "complete" only the peers of l terms (longer targets, compared against the whole peer)
+    prefixes, complete = [], []
+    for length, (peers, sigs) in enumerate(signatures, start=1):
+        keys = band_keys(sigs, bands, rows)
+        prefixes.append(band_table(keys, peers))
+        whole = peer_index["lengths"][peers] == length
+        complete.append(band_table(keys[whole], peers[whole]))
+    return {"bands": bands, "rows": rows, "seed": LSH_SEED, "min_sim": min_sim,
+            "prefixes": prefixes, "complete": complete}
+
+def band_table(keys: np.ndarray, peers: np.ndarray) -> Dict[str, np.ndarray]:
+    # all band keys in one sorted array, looked up with searchsorted
+    flat = keys.ravel()
+    order = np.argsort(flat, kind="stable")
+    return {"keys": flat[order], "peers": np.repeat(peers, keys.shape[1])[order]}
+
+def lsh_candidates(target_terms: List[List[str]], peer_index: Dict[str, Any], lsh: Dict[str, Any]) -> np.ndarray:
+    # peers sharing a band bucket with the target, each under its own truncation length
+    vocabulary = peer_index["vocabulary"]
+    extra: Dict[str, int] = {}
+    courses, terms = [], []
+    for term_index, term_courses in enumerate(target_terms):
+        for c in term_courses:
+            courses.append(vocabulary[c] if c in vocabulary else extra.setdefault(c, len(vocabulary) + len(extra)))
+            terms.append(term_index)
+
+    seeds = hash_seeds(lsh["bands"] * lsh["rows"])
+    target_length = len(target_terms)
+    found = []
+    for length in range(1, min(target_length, len(lsh["prefixes"])) + 1):
+        table = lsh["prefixes" if length == target_length else "complete"][length - 1]
+        signature = minhash_signature(relation_tokens(prefix_last_terms(courses, terms, length)), seeds)
+        keys = band_keys(signature, lsh["bands"], lsh["rows"])
+        lo = np.searchsorted(table["keys"], keys, side="left")
+        hi = np.searchsorted(table["keys"], keys, side="right")
+        found.append(table["peers"][concat_ranges(lo, hi - lo)])
+    if not found:
+        return np.zeros(0, dtype=np.int64)
+    return np.unique(np.concatenate(found)).astype(np.int64)
+
+
+def lsh_recall(peer_index: Dict[str, Any],
+               queries: List[List[List[str]]],
+               configs: List[Tuple[int, int]],
+               min_sim: float,
+               exclude: Optional[List[int]] = None,
+               signatures: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None) -> List[Dict[str, Any]]:
+    # recall of each (bands, rows) against exact retrieval, plus the share of peers re-scored and
+    # latency of both paths
+    n_peers = len(peer_index["lengths"])
+    exact_sets, exact_seconds = [], 0.0
+    for q, target in enumerate(queries):
+        start = time.perf_counter()
+        similar = set(retrieve_similar_peers(target, peer_index, min_sim)[0].tolist())
+        exact_seconds += time.perf_counter() - start
+        if exclude is not None:
+            similar.discard(exclude[q])
+        exact_sets.append(similar)
+
+    if signatures is None:
+        signatures = peer_signatures(peer_index, max(b * r for b, r in configs))
+    report = []
+    for bands, rows in configs:
+        lsh = build_peer_lsh(peer_index, bands, rows, signatures)
+        found = relevant = scored = 0
+        approx_seconds = 0.0
+        for q, target in enumerate(queries):
+            start = time.perf_counter()
+            candidates = lsh_candidates(target, peer_index, lsh)
+            similar = set(retrieve_similar_peers(target, peer_index, min_sim, candidates=candidates)[0].tolist())
+            approx_seconds += time.perf_counter() - start
+            if exclude is not None:
+                similar.discard(exclude[q])
+            found += len(similar & exact_sets[q])
+            relevant += len(exact_sets[q])
+            scored += len(candidates)
+        report.append({
+            "bands": bands,
+            "rows": rows,
+            "min_sim": min_sim,
+            "queries": len(queries),
+            "recall": round(found / relevant, 4) if relevant else 1.0,
+            "similar_exact": relevant,
+            "candidate_rate": round(scored / max(1, n_peers * len(queries)), 4),
+            "ms_exact": round(exact_seconds * 1000 / max(1, len(queries)), 3),
+            "ms_lsh": round(approx_seconds * 1000 / max(1, len(queries)), 3),
+        })
+    return report
+
+def parse_configs(value: str) -> List[Tuple[int, int]]:
+    # "16x4,32x2" -> [(16, 4), (32, 2)]
+    configs = []
+    for token in value.split(","):
+        if token.strip():
+            bands, rows = token.lower().split("x")
+            configs.append((int(bands), int(rows)))
+    return configs
+
+def sample_peer_queries(peer_index: Dict[str, Any], n_queries: int, seed: int) -> Tuple[List[List[List[str]]], List[int]]:
+    # histories cut from the peers themselves at a random length; the source peer is excluded from both sides
+    rng = random.Random(seed)
+    courses = peer_index["courses"]
+    offsets = peer_index["offsets"]
+    candidates = np.flatnonzero(peer_index["lengths"] > 0).tolist()
+    peers = rng.sample(candidates, min(n_queries, len(candidates)))
+    queries = []
+    for peer in peers:
+        cut = rng.randint(1, int(peer_index["lengths"][peer]))
+        terms: List[List[str]] = [[] for _ in range(cut)]
+        for c, t in zip(peer_index["occ_course"][offsets[peer]:offsets[peer + 1]].tolist(),
+                        peer_index["occ_term"][offsets[peer]:offsets[peer + 1]].tolist()):
+            if t < cut:
+                terms[t].append(courses[c])
+        queries.append(terms)
+    return queries, peers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall del modo aproximado (LSH) de PM contra la similitud exacta")
+    parser.add_argument("--model-dir", default=os.environ.get("MODEL_DIR", "/opt/ml/model"))
+    parser.add_argument("--configs", default="8x4,16x4,32x4,16x2,32x2")
+    parser.add_argument("--min-sim", type=float, default=None)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    peer_index = joblib.load(os.path.join(args.model_dir, "peer_index.joblib"), mmap_mode="r")
+    min_sim = args.min_sim
+    if min_sim is None:
+        model = joblib.load(os.path.join(args.model_dir, "model.joblib"))
+        min_sim = float(model.get("params", {}).get("similarity_threshold", 0.7))
+    queries, sources = sample_peer_queries(peer_index, args.queries, args.seed)
+    print(json.dumps(lsh_recall(peer_index, queries, parse_configs(args.configs), min_sim, sources), indent=2))
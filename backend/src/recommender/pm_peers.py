@@ -0,0 +1,289 @@
+import numpy as np
+from typing import Dict, Any, List, Tuple, Set, Optional
+
+# Footprint similarity and peer retrieval shared by pm_train.py and pm_inference.py, so training
+# and serving score peers with the same code.
+
+REL_DIRECT = "->"
+REL_INDIRECT = "->>"
+REL_REV_DIRECT = "<-"
+REL_REV_INDIRECT = "<<-"
+REL_SAME = "||"
+REL_OTHER = "#"
+
+def index_terms_by_course(sequence_of_terms: List[List[str]]) -> Dict[str, Tuple[int, int]]:
+    index: Dict[str, Tuple[int, int]] = {}
+    for term_index, term_courses in enumerate(sequence_of_terms):
+        for position_in_term, course_code in enumerate(term_courses):
+            index[course_code] = (term_index, position_in_term)
+    return index
+
+def relation_between_courses(a: str, b: str, index_map: Dict[str, Tuple[int, int]]) -> str:
+    if a == b or a not in index_map or b not in index_map:
+        return REL_OTHER
+
+    term_a, _ = index_map[a]
+    term_b, _ = index_map[b]
+
+    if term_a == term_b:
+        return REL_SAME
+    if term_b == term_a + 1:
+        return REL_DIRECT
+    if term_b > term_a + 1:
+        return REL_INDIRECT
+    if term_a == term_b + 1:
+        return REL_REV_DIRECT
+    if term_a > term_b + 1:
+        return REL_REV_INDIRECT
+    return REL_OTHER
+
+def build_footprint_map(sequence_of_terms: List[List[str]], universe: Set[str]) -> Dict[Tuple[str, str], str]:
+    index_map = index_terms_by_course(sequence_of_terms)
+    footprint: Dict[Tuple[str, str], str] = {}
+    for course_a in universe:
+        for course_b in universe:
+            if course_a == course_b:
+                continue
+            footprint[(course_a, course_b)] = relation_between_courses(course_a, course_b, index_map)
+    return footprint
+
+# relation_matrix codes; the position in this list is the code stored in the matrix
+RELATION_CODES = [REL_OTHER, REL_REV_INDIRECT, REL_REV_DIRECT, REL_SAME, REL_DIRECT, REL_INDIRECT]
+
+def build_vocabulary(courses) -> Dict[str, int]:
+    return {course: i for i, course in enumerate(sorted(set(courses)))}
+
+def term_index_vector(sequence_of_terms: List[List[str]], vocabulary: Dict[str, int]) -> np.ndarray:
+    # term of each vocabulary course (last one when repeated, as in index_terms_by_course), -1 if absent
+    vector = np.full(len(vocabulary), -1, dtype=np.int32)
+    for term_index, term_courses in enumerate(sequence_of_terms):
+        for course_code in term_courses:
+            vector[vocabulary[course_code]] = term_index
+    return vector
+
+def relation_matrix(term_vector: np.ndarray) -> np.ndarray:
+    # [a, b] holds the RELATION_CODES index of relation_between_courses(a, b)
+    present = term_vector >= 0
+    relations = (np.clip(term_vector[None, :] - term_vector[:, None], -2, 2) + 3).astype(np.int8)
+    relations[~(present[:, None] & present[None, :])] = 0
+    return relations
+
+def similarity_of_footprints(seq_a: List[List[str]], seq_b: List[List[str]]) -> float:
+    length = min(len(seq_a), len(seq_b))
+    if length == 0:
+        return 0.0
+
+    truncated_a = seq_a[:length]
+    truncated_b = seq_b[:length]
+
+    vocabulary = build_vocabulary([c for term in truncated_a for c in term] + [c for term in truncated_b for c in term])
+    size = len(vocabulary)
+    if size <= 1:
+        return 1.0
+
+    differs = relation_matrix(term_index_vector(truncated_a, vocabulary)) != relation_matrix(term_index_vector(truncated_b, vocabulary))
+    # the footprint only covers pairs of distinct courses
+    np.fill_diagonal(differs, False)
+    total_pairs = size * (size - 1)
+    differences = int(np.count_nonzero(differs))
+    return 1.0 - (differences / max(1, total_pairs))
+
+def build_peer_index(peers: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # every (peer, course, term) occurrence as flat int arrays over a shared course vocabulary,
+    # plus a course -> (peer, first term) inverted index for retrieval
+    vocabulary: Dict[str, int] = {}
+    student_ids, gpas, lengths, offsets, prefix_sizes = [], [], [], [0], []
+    occ_peer, occ_course, occ_term = [], [], []
+    first_peer, first_course, first_term = [], [], []
+    for position, peer in enumerate(peers):
+        peer_terms = peer.get("subjects_by_term", [])
+        student_ids.append(peer.get("student_id"))
+        gpas.append(float(peer.get("gpa", 0.0)))
+        lengths.append(len(peer_terms))
+        seen: Set[int] = set()
+        sizes = [0]
+        for term_index, term_courses in enumerate(peer_terms):
+            for course_code in term_courses:
+                code = vocabulary.setdefault(course_code, len(vocabulary))
+                occ_peer.append(position)
+                occ_course.append(code)
+                occ_term.append(term_index)
+                if code not in seen:
+                    seen.add(code)
+                    first_peer.append(position)
+                    first_course.append(code)
+                    first_term.append(term_index)
+            sizes.append(len(seen))
+        offsets.append(len(occ_peer))
+        prefix_sizes.append(sizes)
+
+    # prefix_sizes[p, l]: distinct courses in the first l terms of peer p
+    max_length = max(lengths, default=0)
+    prefix_matrix = np.zeros((len(peers), max_length + 1), dtype=np.int32)
+    for position, sizes in enumerate(prefix_sizes):
+        prefix_matrix[position, :len(sizes)] = sizes
+        prefix_matrix[position, len(sizes):] = sizes[-1]
+
+    first_course = np.array(first_course, dtype=np.int32)
+    order = np.argsort(first_course, kind="stable")
+    post_offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    post_offsets[1:] = np.cumsum(np.bincount(first_course, minlength=len(vocabulary)))
+    return {
+        "courses": list(vocabulary),
+        "vocabulary": vocabulary,
+        "student_ids": student_id_array(student_ids),
+        "gpas": np.array(gpas, dtype=np.float64),
+        "lengths": np.array(lengths, dtype=np.int32),
+        "offsets": np.array(offsets, dtype=np.int64),
+        "prefix_sizes": prefix_matrix,
+        "occ_peer": np.array(occ_peer, dtype=np.int32),
+        "occ_course": np.array(occ_course, dtype=np.int32),
+        "occ_term": np.array(occ_term, dtype=np.int32),
+        "post_offsets": post_offsets,
+        "post_peer": np.array(first_peer, dtype=np.int32)[order],
+        "post_term": np.array(first_term, dtype=np.int32)[order],
+    }
+
+def student_id_array(student_ids: List[Any]) -> np.ndarray:
+    # int64 when every id is an int (as pm_train produces); ids of older artifacts are kept as they are
+    if all(isinstance(i, (int, np.integer)) and not isinstance(i, bool) for i in student_ids):
+        return np.array(student_ids, dtype=np.int64)
+    ids = np.empty(len(student_ids), dtype=object)
+    ids[:] = student_ids
+    return ids
+
+def peer_student_id(peer_index: Dict[str, Any], peer: int) -> Any:
+    student_id = peer_index["student_ids"][peer]
+    return student_id.item() if isinstance(student_id, np.generic) else student_id
+
+def concat_ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    # positions of the concatenated [start, start + count) ranges
+    return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+def similarity_to_peers(target_terms: List[List[str]],
+                        peer_index: Dict[str, Any],
+                        peers: Optional[np.ndarray] = None) -> np.ndarray:
+    # similarity_of_footprints(target_terms, peer) for every indexed peer (or only `peers`), same values
+    if peers is None:
+        lengths = peer_index["lengths"]
+        occ_peer, occ_course, occ_term = peer_index["occ_peer"], peer_index["occ_course"], peer_index["occ_term"]
+    else:
+        lengths = peer_index["lengths"][peers]
+        starts = peer_index["offsets"][peers]
+        counts = peer_index["offsets"][peers + 1] - starts
+        positions = concat_ranges(starts, counts)
+        occ_peer = np.repeat(np.arange(len(peers), dtype=np.int32), counts)
+        occ_course, occ_term = peer_index["occ_course"][positions], peer_index["occ_term"][positions]
+    n_peers = len(lengths)
+    target_length = len(target_terms)
+    if target_length == 0 or n_peers == 0:
+        return np.zeros(n_peers)
+
+    vocabulary = peer_index["vocabulary"]
+    extra: Dict[str, int] = {}
+    target_codes = [[vocabulary[c] if c in vocabulary else extra.setdefault(c, len(vocabulary) + len(extra)) for c in term]
+                    for term in target_terms]
+    size = len(vocabulary) + len(extra)
+
+    # row l - 1 is the target truncated to its first l terms
+    target_vectors = np.full((target_length, size), -1, dtype=np.int32)
+    for term_index, term_codes in enumerate(target_codes):
+        target_vectors[term_index:, term_codes] = term_index
+
+    truncation = np.minimum(lengths, target_length)
+    keep = occ_term < truncation[occ_peer]
+    peer_vectors = np.full((n_peers, size), -1, dtype=np.int32)
+    np.maximum.at(peer_vectors, (occ_peer[keep], occ_course[keep]), occ_term[keep])
+
+    # a course pair's relations only depend on the (target term, peer term) state of each course,
+    # so differing pairs are counted from per-peer state histograms
+    width = target_length + 1
+    n_states = width * width
+    states = (target_vectors[np.maximum(truncation, 1) - 1] + 1) * width + (peer_vectors + 1)
+    states += (np.arange(n_peers, dtype=np.int32) * n_states)[:, None]
+    counts = np.bincount(states.ravel(), minlength=n_peers * n_states).reshape(n_peers, n_states).astype(np.float64)
+    # courses in neither truncated trajectory are outside the universe
+    counts[:, 0] = 0
+
+    relations = relation_matrix(np.arange(-1, target_length, dtype=np.int32))
+    differs = (relations[:, None, :, None] != relations[None, :, None, :]).reshape(n_states, n_states).astype(np.float64)
+    differences = ((counts @ differs) * counts).sum(axis=1) - counts @ np.diag(differs)
+
+    universe = counts.sum(axis=1)
+    similarities = 1.0 - (np.rint(differences) / np.maximum(1, universe * (universe - 1)))
+    similarities[universe <= 1] = 1.0
+    similarities[truncation == 0] = 0.0
+    return similarities
+
+def similarity_upper_bounds(target_terms: List[List[str]], peer_index: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    # with a and b courses in the truncated target and peer and s shared, every ordered pair inside
+    # one trajectory that is not inside both differs (one side has a relation, the other #), so at
+    # least a(a-1) + b(b-1) - 2s(s-1) of the u(u-1) pairs differ
+    lengths = peer_index["lengths"]
+    n_peers = len(lengths)
+    truncation = np.minimum(lengths, len(target_terms))
+
+    first_seen: Dict[str, int] = {}
+    target_sizes = [0]
+    for term_index, term_courses in enumerate(target_terms):
+        for course_code in term_courses:
+            first_seen.setdefault(course_code, term_index)
+        target_sizes.append(len(first_seen))
+    a = np.array(target_sizes, dtype=np.int64)[truncation]
+    b = peer_index["prefix_sizes"][np.arange(n_peers), truncation].astype(np.int64)
+
+    # shared courses only read the postings of the target's courses
+    vocabulary = peer_index["vocabulary"]
+    codes = np.array([vocabulary[c] for c in first_seen if c in vocabulary], dtype=np.int64)
+    target_first = np.array([t for c, t in first_seen.items() if c in vocabulary], dtype=np.int64)
+    starts = peer_index["post_offsets"][codes]
+    counts = peer_index["post_offsets"][codes + 1] - starts
+    positions = concat_ranges(starts, counts)
+    post_peer = peer_index["post_peer"][positions]
+    limit = truncation[post_peer]
+    hit = (peer_index["post_term"][positions] < limit) & (np.repeat(target_first, counts) < limit)
+    shared = np.bincount(post_peer[hit], minlength=n_peers).astype(np.int64)
+
+    universe = a + b - shared
+    min_differences = a * (a - 1) + b * (b - 1) - 2 * shared * (shared - 1)
+    bounds = 1.0 - (min_differences / np.maximum(1, universe * (universe - 1)))
+    bounds[universe <= 1] = 1.0
+    bounds[truncation == 0] = 0.0
+    return bounds, shared
+
+def new_retrieval_stats() -> Dict[str, int]:
+    return {"queries": 0, "peers": 0, "overlapping": 0, "scored": 0, "similar": 0}
+
+def retrieval_summary(stats: Dict[str, int]) -> Dict[str, Any]:
+    return dict(stats, pruning_rate=round(1.0 - stats["scored"] / max(1, stats["peers"]), 4))
+
+def retrieve_similar_peers(target_terms: List[List[str]],
+                           peer_index: Dict[str, Any],
+                           min_sim: float,
+                           stats: Optional[Dict[str, int]] = None,
+                           candidates: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    # peers with similarity >= min_sim; peers whose upper bound is already below it are never scored.
+    # Given candidates (e.g. from an LSH index) only those are scored and similar peers outside them are missed
+    shared = None
+    if candidates is None:
+        bounds, shared = similarity_upper_bounds(target_terms, peer_index)
+        candidates = np.flatnonzero(bounds >= min_sim)
+    similarities = similarity_to_peers(target_terms, peer_index, candidates)
+    keep = similarities >= min_sim
+    if stats is not None:
+        stats["queries"] += 1
+        stats["peers"] += len(peer_index["lengths"])
+        if shared is not None:
+            stats["overlapping"] += int(np.count_nonzero(shared))
+        stats["scored"] += len(candidates)
+        stats["similar"] += int(np.count_nonzero(keep))
+    return candidates[keep], similarities[keep]
+
+def next_term_occurrences(peer_index: Dict[str, Any], peers: np.ndarray, next_term: int) -> Tuple[np.ndarray, np.ndarray]:
+    # (position in peers, course) of every course the given peers took in term next_term, in peers order
+    starts = peer_index["offsets"][peers]
+    counts = peer_index["offsets"][peers + 1] - starts
+    positions = concat_ranges(starts, counts)
+    owners = np.repeat(np.arange(len(peers)), counts)
+    mask = peer_index["occ_term"][positions] == next_term
+    return owners[mask], peer_index["occ_course"][positions][mask]
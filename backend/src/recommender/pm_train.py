@@ -1,13 +1,28 @@
 import os
+import sys
 import json
 import random
+import tempfile
 import boto3
 import joblib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from statistics import mean
 from datetime import datetime, timezone
 from typing import Dict, Any, List, Tuple, Set, Optional
 from boto3.dynamodb.conditions import Key, Attr
 
+sys.path.append('/opt/ml/code')
+
+from pm_peers import (
+    build_peer_index,
+    new_retrieval_stats,
+    retrieval_summary,
+    retrieve_similar_peers,
+    next_term_occurrences,
+)
+from pm_lsh import peer_signatures, build_peer_lsh, lsh_recall
+
 
 def ddb_table():
     aws_region = os.getenv("AWS_REGION") or "us-east-1"
@@ -279,93 +294,184 @@ def items_to_terms(student_items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     return transformed_students
 
 
-REL_DIRECT = "->"
-REL_INDIRECT = "->>"
-REL_REV_DIRECT = "<-"
-REL_REV_INDIRECT = "<<-"
-REL_SAME = "||"
-REL_OTHER = "#"
-
-def index_terms_by_course(sequence_of_terms: List[List[str]]) -> Dict[str, Tuple[int, int]]:
-    index: Dict[str, Tuple[int, int]] = {}
-    for term_index, term_courses in enumerate(sequence_of_terms):
-        for position_in_term, course_code in enumerate(term_courses):
-            index[course_code] = (term_index, position_in_term)
-    return index
-
-def relation_between_courses(a: str, b: str, index_map: Dict[str, Tuple[int, int]]) -> str:
-    if a == b or a not in index_map or b not in index_map:
-        return REL_OTHER
-
-    term_a, _ = index_map[a]
-    term_b, _ = index_map[b]
-
-    if term_a == term_b:
-        return REL_SAME
-    if term_b == term_a + 1:
-        return REL_DIRECT
-    if term_b > term_a + 1:
-        return REL_INDIRECT
-    if term_a == term_b + 1:
-        return REL_REV_DIRECT
-    if term_a > term_b + 1:
-        return REL_REV_INDIRECT
-    return REL_OTHER
-
-def build_footprint_map(sequence_of_terms: List[List[str]], universe: Set[str]) -> Dict[Tuple[str, str], str]:
-    index_map = index_terms_by_course(sequence_of_terms)
-    footprint: Dict[Tuple[str, str], str] = {}
-    for course_a in universe:
-        for course_b in universe:
-            if course_a == course_b:
-                continue
-            footprint[(course_a, course_b)] = relation_between_courses(course_a, course_b, index_map)
-    return footprint
-
-def similarity_of_footprints(seq_a: List[List[str]], seq_b: List[List[str]]) -> float:
-    length = min(len(seq_a), len(seq_b))
-    if length == 0:
-        return 0.0
+def rank_next_term_courses(target_terms: List[List[str]],
+                           similar_peers: np.ndarray,
+                           peer_index: Dict[str, Any]) -> List[Tuple[str, int]]:
+    _, next_courses = next_term_occurrences(peer_index, similar_peers, len(target_terms))
+    frequency = np.bincount(next_courses, minlength=len(peer_index["courses"]))
+    vocabulary = peer_index["vocabulary"]
+    frequency[[vocabulary[c] for term in target_terms for c in term if c in vocabulary]] = 0
+    courses = peer_index["courses"]
+    return sorted(((courses[i], int(frequency[i])) for i in np.flatnonzero(frequency)), key=lambda x: (-x[1], x[0]))
 
-    truncated_a = seq_a[:length]
-    truncated_b = seq_b[:length]
-
-    universe: Set[str] = set([c for term in truncated_a for c in term] + [c for term in truncated_b for c in term])
-    if len(universe) <= 1:
-        return 1.0
-
-    fp_a = build_footprint_map(truncated_a, universe)
-    fp_b = build_footprint_map(truncated_b, universe)
+def recommend_by_pm(target_student: Dict[str, Any],
+                    successful_students: List[Dict[str, Any]],
+                    similarity_threshold: float = 0.7,
+                    peer_index: Optional[Dict[str, Any]] = None) -> List[Tuple[str, int]]:
+    if peer_index is None:
+        peer_index = build_peer_index(successful_students)
+    target_terms = target_student["subjects_by_term"]
+    similar_peers, _ = retrieve_similar_peers(target_terms, peer_index, similarity_threshold)
+    return rank_next_term_courses(target_terms, similar_peers, peer_index)
 
-    total_pairs = len(fp_a)
-    differences = sum(1 for key, value in fp_a.items() if value != fp_b.get(key))
-    return 1.0 - (differences / max(1, total_pairs))
+def get_pm_workers() -> int:
+    # unset or 1 runs serially; <= 0 uses every core
+    try:
+        workers = int(os.getenv("PM_WORKERS", "1"))
+    except Exception:
+        workers = 1
+    return workers if workers > 0 else (os.cpu_count() or 1)
 
-def next_term_courses_of(success_terms: List[List[str]], target_length: int) -> List[str]:
-    next_index = target_length
-    if next_index < len(success_terms):
-        return list(success_terms[next_index])
-    return []
+def get_lsh_params() -> Tuple[int, int]:
+    # PM_LSH_BANDS=0 (default) ships no LSH index and the endpoint keeps exact retrieval
+    try:
+        bands = int(os.getenv("PM_LSH_BANDS", "0"))
+    except Exception:
+        bands = 0
+    try:
+        rows = int(os.getenv("PM_LSH_ROWS", "4"))
+    except Exception:
+        rows = 4
+    return max(0, bands), max(1, rows)
 
+def open_worker_pool(workers: int) -> Optional[Dict[str, Any]]:
+    if workers <= 1:
+        return None
+    try:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    except (OSError, NotImplementedError) as e:
+        print(f"Sin pool de procesos ({e}), se entrena en serie")
+        return None
+    # arrays handed to workers are dumped here once and memory-mapped by each worker
+    return {"executor": executor, "workers": workers, "dir": tempfile.TemporaryDirectory(prefix="pm_train_")}
+
+def close_worker_pool(pool: Optional[Dict[str, Any]]):
+    if pool is not None:
+        pool["executor"].shutdown(cancel_futures=True)
+        pool["dir"].cleanup()
+
+def chunk_bounds(n_items: int, n_chunks: int) -> List[Tuple[int, int]]:
+    n_chunks = max(1, min(n_items, n_chunks))
+    edges = [round(i * n_items / n_chunks) for i in range(n_chunks + 1)]
+    return [(a, b) for a, b in zip(edges, edges[1:])]
+
+def share_with_workers(pool: Dict[str, Any], name: str, value: Any) -> str:
+    path = os.path.join(pool["dir"].name, f"{name}.joblib")
+    joblib.dump(value, path)
+    return path
+
+_shared_cache: Dict[str, Any] = {}
+
+def load_shared(path: str) -> Any:
+    # once per worker and file; the mapped pages are shared by every worker
+    if path not in _shared_cache:
+        _shared_cache[path] = joblib.load(path, mmap_mode="r")
+    return _shared_cache[path]
+
+def items_to_terms_parallel(student_items: List[Dict[str, Any]], pool: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if pool is None:
+        return items_to_terms(student_items)
+    futures = [pool["executor"].submit(items_to_terms, student_items[a:b])
+               for a, b in chunk_bounds(len(student_items), pool["workers"] * 4)]
+    return [student for future in futures for student in future.result()]
+
+def holdout_histories(all_students: List[Dict[str, Any]]) -> Tuple[List[int], List[List[List[str]]]]:
+    # row of each student in the pairwise similarities (-1 without a next term to hold out) and the histories
+    rows, histories = [], []
+    for student in all_students:
+        terms = student["subjects_by_term"]
+        if len(terms) < 2:
+            rows.append(-1)
+            continue
+        rows.append(len(histories))
+        histories.append(terms[:-1])
+    return rows, histories
+
+def similarity_block(histories: List[List[List[str]]],
+                     peer_index: Dict[str, Any],
+                     min_sim: float) -> Tuple[Dict[str, np.ndarray], Dict[str, int]]:
+    # only the (peer, similarity) pairs that pass min_sim, per history, peers ascending
+    counts, peers, similarities = [], [], []
+    stats = new_retrieval_stats()
+    for history in histories:
+        row_peers, row_similarities = retrieve_similar_peers(history, peer_index, min_sim, stats)
+        counts.append(len(row_peers))
+        peers.append(row_peers.astype(np.int32))
+        similarities.append(row_similarities)
+    block = {
+        "counts": np.array(counts, dtype=np.int64),
+        "peers": np.concatenate(peers) if peers else np.zeros(0, dtype=np.int32),
+        "sims": np.concatenate(similarities) if similarities else np.zeros(0),
+    }
+    return block, stats
+
+def similarity_block_shared(histories: List[List[List[str]]], peer_index_path: str, min_sim: float) -> Tuple[Dict[str, np.ndarray], Dict[str, int]]:
+    return similarity_block(histories, load_shared(peer_index_path), min_sim)
+
+def build_pairwise_similarity(all_students: List[Dict[str, Any]],
+                              peer_pool: List[Dict[str, Any]],
+                              min_sim: float,
+                              block_size: int = 256,
+                              pool: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    # holdout history x peer similarities, computed once for every threshold >= min_sim and kept
+    # as CSR rows: the peers and similarities of row r are peers/sims[offsets[r]:offsets[r + 1]]
+    rows, histories = holdout_histories(all_students)
+    peer_index = build_peer_index(peer_pool)
+    bounds = [(start, min(start + block_size, len(histories))) for start in range(0, len(histories), block_size)]
+    if pool is None:
+        blocks = [similarity_block(histories[a:b], peer_index, min_sim) for a, b in bounds]
+    else:
+        peer_index_path = share_with_workers(pool, "peer_index", peer_index)
+        futures = [pool["executor"].submit(similarity_block_shared, histories[a:b], peer_index_path, min_sim) for a, b in bounds]
+        blocks = [future.result() for future in futures]
+
+    offsets = np.zeros(len(histories) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.concatenate([block["counts"] for block, _ in blocks] + [np.zeros(0, dtype=np.int64)]))
+    stats = new_retrieval_stats()
+    for _, block_stats in blocks:
+        for key, value in block_stats.items():
+            stats[key] += value
+    return {
+        "rows": rows,
+        "offsets": offsets,
+        "peers": np.concatenate([block["peers"] for block, _ in blocks] + [np.zeros(0, dtype=np.int32)]),
+        "sims": np.concatenate([block["sims"] for block, _ in blocks] + [np.zeros(0)]),
+        "peer_index": peer_index,
+        "min_sim": min_sim,
+        "stats": stats,
+    }
 
-def recommend_by_pm(target_student: Dict[str, Any],
-                    successful_students: List[Dict[str, Any]],
-                    similarity_threshold: float = 0.7) -> List[Tuple[str, int]]:
-    target_terms = target_student["subjects_by_term"]
-    num_completed_terms = len(target_terms)
-    completed_courses = set([c for term in target_terms for c in term])
-    frequency_counter: Dict[str, int] = {}
-
-    for successful in successful_students:
-        sim = similarity_of_footprints(target_terms, successful["subjects_by_term"])
-        if sim >= similarity_threshold:
-            for course in next_term_courses_of(successful["subjects_by_term"], num_completed_terms):
-                if course in completed_courses:
-                    continue
-                frequency_counter[course] = frequency_counter.get(course, 0) + 1
+def map_student_chunks(fn, students: List[Dict[str, Any]], pairwise: Dict[str, Any],
+                       pool: Optional[Dict[str, Any]], *args) -> List[Any]:
+    # fn(students, rows, pairwise, *args) over contiguous chunks, results in chunk order
+    rows = pairwise["rows"]
+    if pool is None:
+        return [fn(students, rows, pairwise, *args)]
+    if "shared_path" not in pairwise:
+        pairwise["shared_path"] = share_with_workers(pool, f"pairwise_{id(pairwise)}",
+                                                     {k: pairwise[k] for k in ("rows", "offsets", "peers", "sims", "peer_index", "min_sim", "stats")})
+    futures = [pool["executor"].submit(run_with_shared_pairwise, fn, students[a:b], rows[a:b], pairwise["shared_path"], *args)
+               for a, b in chunk_bounds(len(students), pool["workers"] * 4)]
+    return [future.result() for future in futures]
+
+def run_with_shared_pairwise(fn, students: List[Dict[str, Any]], rows: List[int], pairwise_path: str, *args) -> Any:
+    return fn(students, rows, load_shared(pairwise_path), *args)
+
+def successful_peer_mask(pairwise: Dict[str, Any],
+                         successful_students: List[Dict[str, Any]],
+                         similarity_threshold: float) -> np.ndarray:
+    if similarity_threshold < pairwise["min_sim"]:
+        raise ValueError(f"Umbral de similitud {similarity_threshold} menor al de las similitudes precalculadas ({pairwise['min_sim']})")
+    gpas = pairwise["peer_index"]["gpas"]
+    if not successful_students:
+        return np.zeros(len(gpas), dtype=bool)
+    # successful sets are "gpa >= threshold" over the pool's students, so the lowest gpa picks them out
+    return gpas >= min(s["gpa"] for s in successful_students)
 
-    ranked = sorted(frequency_counter.items(), key=lambda x: (-x[1], x[0]))
-    return ranked
+def pairwise_similar_peers(pairwise: Dict[str, Any], row: int, peer_mask: np.ndarray, similarity_threshold: float) -> np.ndarray:
+    start, end = pairwise["offsets"][row], pairwise["offsets"][row + 1]
+    peers = pairwise["peers"][start:end]
+    return peers[peer_mask[peers] & (pairwise["sims"][start:end] >= similarity_threshold)]
 
 def compute_course_stats(successful_students: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
     count_by_course: Dict[str, int] = {}
@@ -399,7 +505,54 @@ def evaluate_holdout_last_term(all_students: List[Dict[str, Any]],
                                successful_students: List[Dict[str, Any]],
                                similarity_threshold: float,
                                k: int,
-                               gpa_success_threshold: float) -> Dict[str, float]:
+                               gpa_success_threshold: float,
+                               pairwise: Optional[Dict[str, Any]] = None,
+                               pool: Optional[Dict[str, Any]] = None) -> Dict[str, float]:
+    if pairwise is None:
+        pairwise = build_pairwise_similarity(all_students, successful_students, similarity_threshold, pool=pool)
+    peer_mask = successful_peer_mask(pairwise, successful_students, similarity_threshold)
+
+    counts: Dict[str, int] = {}
+    for chunk_counts in map_student_chunks(evaluate_students, all_students, pairwise, pool,
+                                           peer_mask, similarity_threshold, k, gpa_success_threshold):
+        for key, value in chunk_counts.items():
+            counts[key] = counts.get(key, 0) + value
+    hits, num_with_label = counts["hits"], counts["num_with_label"]
+    tp, fp, tn, fn = counts["tp"], counts["fp"], counts["tn"], counts["fn"]
+    students_with_recommendations = counts["students_with_recommendations"]
+    students_with_similar_peers = counts["students_with_similar_peers"]
+
+    total = tp + tn + fp + fn
+    hit_rate = hits / max(1, num_with_label)
+    accuracy = (tp + tn) / max(1, total)
+    precision = tp / max(1, tp + fp)
+    recall = tp / max(1, tp + fn)
+    f1 = 2 * precision * recall / max(1e-12, (precision + recall))
+
+    print(f"Students with recommendations: {students_with_recommendations}/{num_with_label}")
+    print(f"Students with similar peers: {students_with_similar_peers}/{num_with_label}")
+    print(f"Students with next term data: {num_with_label}/{len(all_students)}")
+    retrieval = retrieval_summary(pairwise["stats"])
+    print(f"Peers descartados por cota: {retrieval['pruning_rate']:.2%} "
+          f"(comparten materias: {retrieval['overlapping']}, puntuados: {retrieval['scored']} de {retrieval['peers']})")
+
+    return {
+        "hit_rate_at_k": round(hit_rate, 4),
+        "accuracy": round(accuracy, 4),
+        "precision": round(precision, 4),
+        "recall": round(recall, 4),
+        "f1": round(f1, 4),
+        "tp": tp, "fp": fp, "tn": tn, "fn": fn,
+        "retrieval": retrieval
+    }
+
+def evaluate_students(students: List[Dict[str, Any]],
+                      rows: List[int],
+                      pairwise: Dict[str, Any],
+                      peer_mask: np.ndarray,
+                      similarity_threshold: float,
+                      k: int,
+                      gpa_success_threshold: float) -> Dict[str, int]:
     hits = 0
     num_with_label = 0
     tp = fp = tn = fn = 0
@@ -407,30 +560,19 @@ def evaluate_holdout_last_term(all_students: List[Dict[str, Any]],
     students_with_recommendations = 0
     students_with_similar_peers = 0
 
-    for student in all_students:
-        full_terms = student["subjects_by_term"]
-        if len(full_terms) < 2:
+    for student, row in zip(students, rows):
+        if row < 0:
             continue
 
+        full_terms = student["subjects_by_term"]
         history_terms = full_terms[:-1]
         label_next_term = set(full_terms[-1])
 
-        hist_target = {
-            "student_id": student["student_id"],
-            "subjects_by_term": history_terms,
-            "grades_by_subject": student.get("grades_by_subject", {}),
-            "gpa": student["gpa"],
-        }
-
-        similar = False
-        for s in successful_students:
-            if similarity_of_footprints(history_terms, s["subjects_by_term"]) >= similarity_threshold:
-                similar = True
-                break
-        if similar:
+        similar_peers = pairwise_similar_peers(pairwise, row, peer_mask, similarity_threshold)
+        if len(similar_peers):
             students_with_similar_peers += 1
 
-        recs = recommend_by_pm(hist_target, successful_students, similarity_threshold)[:k]
+        recs = rank_next_term_courses(history_terms, similar_peers, pairwise["peer_index"])[:k]
         if recs:
             students_with_recommendations += 1
 
@@ -450,24 +592,11 @@ def evaluate_holdout_last_term(all_students: List[Dict[str, Any]],
         else:
             fn += 1
 
-    total = tp + tn + fp + fn
-    hit_rate = hits / max(1, num_with_label)
-    accuracy = (tp + tn) / max(1, total)
-    precision = tp / max(1, tp + fp)
-    recall = tp / max(1, tp + fn)
-    f1 = 2 * precision * recall / max(1e-12, (precision + recall))
-
-    print(f"Students with recommendations: {students_with_recommendations}/{num_with_label}")
-    print(f"Students with similar peers: {students_with_similar_peers}/{num_with_label}")
-    print(f"Students with next term data: {num_with_label}/{len(all_students)}")
-
     return {
-        "hit_rate_at_k": round(hit_rate, 4),
-        "accuracy": round(accuracy, 4),
-        "precision": round(precision, 4),
-        "recall": round(recall, 4),
-        "f1": round(f1, 4),
-        "tp": tp, "fp": fp, "tn": tn, "fn": fn
+        "hits": hits, "num_with_label": num_with_label,
+        "tp": tp, "fp": fp, "tn": tn, "fn": fn,
+        "students_with_recommendations": students_with_recommendations,
+        "students_with_similar_peers": students_with_similar_peers
     }
 
 
@@ -491,19 +620,12 @@ def recommend_for_history(history_terms: List[List[str]],
                           successful_students: List[Dict[str, Any]],
                           similarity_threshold: float,
                           grades_by_subject: Dict[str, float],
-                          top_k: int) -> List[str]:
-    completed = set([c for term in history_terms for c in term])
-    freq: Dict[str, int] = {}
-    L = len(history_terms)
-    for s in successful_students:
-        sim = similarity_of_footprints(history_terms, s["subjects_by_term"])
-        if sim >= similarity_threshold:
-            next_courses = next_term_courses_of(s["subjects_by_term"], L)
-            for c in next_courses:
-                if c in completed:
-                    continue
-                freq[c] = freq.get(c, 0) + 1
-    ranked = sorted(freq.items(), key=lambda x: (-x[1], x[0]))
+                          top_k: int,
+                          peer_index: Optional[Dict[str, Any]] = None) -> List[str]:
+    if peer_index is None:
+        peer_index = build_peer_index(successful_students)
+    similar_peers, _ = retrieve_similar_peers(history_terms, peer_index, similarity_threshold)
+    ranked = rank_next_term_courses(history_terms, similar_peers, peer_index)
     return [c for c, _ in ranked[:top_k]]
 
 def simulate_cohort_next_term_gpa(all_students: List[Dict[str, Any]],
@@ -512,17 +634,60 @@ def simulate_cohort_next_term_gpa(all_students: List[Dict[str, Any]],
                                   similarity_threshold: float,
                                   top_k: int,
                                   cohort_size: int = 200,
-                                  seed: int = 42) -> Dict[str, Any]:
+                                  seed: int = 42,
+                                  pairwise: Optional[Dict[str, Any]] = None,
+                                  pool: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     random.seed(seed)
     avg_pool = [v.get("avg_grade", 0.0) for v in course_stats.values()]
     overall_avg = mean(avg_pool) if avg_pool else 0.0
+    if pairwise is None:
+        pairwise = build_pairwise_similarity(all_students, successful_students, similarity_threshold, pool=pool)
+    peer_mask = successful_peer_mask(pairwise, successful_students, similarity_threshold)
 
+    # chunks come back in student order, so the cohort sample is the serial one
     eligible: List[Dict[str, Any]] = []
-    for s in all_students:
-        terms = s["subjects_by_term"]
-        if len(terms) < 2:
+    for chunk in map_student_chunks(simulate_students, all_students, pairwise, pool,
+                                    peer_mask, course_stats, overall_avg, similarity_threshold, top_k):
+        eligible.extend(chunk)
+
+    if len(eligible) > cohort_size:
+        eligible = random.sample(eligible, cohort_size)
+
+    if not eligible:
+        return {
+            "cohort_size": 0,
+            "baseline_avg_gpa": 0.0,
+            "simulated_avg_gpa": 0.0,
+            "delta_avg": 0.0,
+            "details": []
+        }
+
+    baseline_avg = round(mean([e["baseline_next_gpa"] for e in eligible]), 3)
+    simulated_avg = round(mean([e["simulated_next_gpa"] for e in eligible]), 3)
+    delta_avg = round(simulated_avg - baseline_avg, 3)
+
+    return {
+        "cohort_size": len(eligible),
+        "baseline_avg_gpa": baseline_avg,
+        "simulated_avg_gpa": simulated_avg,
+        "delta_avg": delta_avg,
+        "details": eligible[:20]
+    }
+
+def simulate_students(students: List[Dict[str, Any]],
+                      rows: List[int],
+                      pairwise: Dict[str, Any],
+                      peer_mask: np.ndarray,
+                      course_stats: Dict[str, Dict[str, float]],
+                      overall_avg: float,
+                      similarity_threshold: float,
+                      top_k: int) -> List[Dict[str, Any]]:
+    eligible: List[Dict[str, Any]] = []
+    for s, row in zip(students, rows):
+        if row < 0:
             continue
 
+        terms = s["subjects_by_term"]
         history_terms = terms[:-1]
         real_next = list(terms[-1])
 
@@ -530,8 +695,9 @@ def simulate_cohort_next_term_gpa(all_students: List[Dict[str, Any]],
         if baseline_gpa is None:
             continue
 
-        top_recs = recommend_for_history(history_terms, successful_students,
-                                         similarity_threshold, s.get("grades_by_subject", {}), top_k)
+        similar_peers = pairwise_similar_peers(pairwise, row, peer_mask, similarity_threshold)
+        ranked = rank_next_term_courses(history_terms, similar_peers, pairwise["peer_index"])
+        top_recs = [c for c, _ in ranked[:top_k]]
         if not top_recs:
             continue
 
@@ -552,30 +718,7 @@ def simulate_cohort_next_term_gpa(all_students: List[Dict[str, Any]],
             "simulated_next_gpa": simulated_gpa,
             "delta": round(simulated_gpa - baseline_gpa, 3)
         })
-
-    if len(eligible) > cohort_size:
-        eligible = random.sample(eligible, cohort_size)
-
-    if not eligible:
-        return {
-            "cohort_size": 0,
-            "baseline_avg_gpa": 0.0,
-            "simulated_avg_gpa": 0.0,
-            "delta_avg": 0.0,
-            "details": []
-        }
-
-    baseline_avg = round(mean([e["baseline_next_gpa"] for e in eligible]), 3)
-    simulated_avg = round(mean([e["simulated_next_gpa"] for e in eligible]), 3)
-    delta_avg = round(simulated_avg - baseline_avg, 3)
-
-    return {
-        "cohort_size": len(eligible),
-        "baseline_avg_gpa": baseline_avg,
-        "simulated_avg_gpa": simulated_avg,
-        "delta_avg": delta_avg,
-        "details": eligible[:20]
-    }
+    return eligible
 
 def _parse_float_list_env(var_name: str, default_values: List[float]) -> List[float]:
     raw = os.getenv(var_name, "")
@@ -593,11 +736,17 @@ def _parse_float_list_env(var_name: str, default_values: List[float]) -> List[fl
     return out or default_values
 
 def tune_parameters_with_simulation(all_students: List[Dict[str, Any]],
-                                    top_k: int) -> List[Dict[str, Any]]:
+                                    top_k: int,
+                                    pairwise: Optional[Dict[str, Any]] = None,
+                                    pool: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
     gpa_grid = _parse_float_list_env("TUNING_GPA_GRID", [3.4, 3.6, 3.8])
     sim_grid = _parse_float_list_env("TUNING_SIM_GRID", [0.6, 0.7, 0.8])
     cohort_size = int(os.getenv("TUNING_COHORT_SIZE", "200"))
     seed = int(os.getenv("TUNING_SEED", "42"))
+    if pairwise is None:
+        pairwise = build_pairwise_similarity(all_students,
+                                             [s for s in all_students if s["gpa"] >= min(gpa_grid)],
+                                             min(sim_grid), pool=pool)
 
     results: List[Dict[str, Any]] = []
     for gpa_thr in gpa_grid:
@@ -615,7 +764,9 @@ def tune_parameters_with_simulation(all_students: List[Dict[str, Any]],
                 similarity_threshold=sim_thr,
                 top_k=top_k,
                 cohort_size=cohort_size,
-                seed=seed
+                seed=seed,
+                pairwise=pairwise,
+                pool=pool
             )
             row = {
                 "gpa_threshold": round(gpa_thr, 3),
@@ -658,59 +809,93 @@ def train():
         top_k = int(os.getenv("TOP_K", "5"))
     except Exception:
         top_k = 5
+    workers = get_pm_workers()
+    lsh_bands, lsh_rows = get_lsh_params()
 
     print(f"Config: DEGREE_ID={degree_id}, GPA_SUCCESS_THRESHOLD={gpa_success_threshold}, "
-          f"SIMILARITY_THRESHOLD={similarity_threshold}, TOP_K={top_k}")
+          f"SIMILARITY_THRESHOLD={similarity_threshold}, TOP_K={top_k}, PM_WORKERS={workers}, "
+          f"PM_LSH={lsh_bands}x{lsh_rows}")
 
     print("Cargando datos de DynamoDB…")
     student_items = query_students_with_subjects(degree_id)
     if not student_items:
         raise ValueError(f"No se encontraron items para DEGREE#{degree_id}")
 
-    transformed_students = items_to_terms(student_items)
-    print(f"Estudiantes con trayectoria APR: {len(transformed_students)}")
+    pool = open_worker_pool(workers)
+    try:
+        transformed_students = items_to_terms_parallel(student_items, pool)
+        print(f"Estudiantes con trayectoria APR: {len(transformed_students)}")
+
+        successful_students = [s for s in transformed_students if s["gpa"] >= gpa_success_threshold]
+        if not successful_students:
+            raise ValueError("No hay estudiantes exitosos según el umbral de GPA")
+        print(f"Estudiantes exitosos (gpa ≥ {gpa_success_threshold}): {len(successful_students)}")
+
+        course_stats = compute_course_stats(successful_students)
+        peer_index = build_peer_index(successful_students)
+
+        # one holdout x peer similarity pass serves the metrics and the whole tuning grid
+        gpa_grid = _parse_float_list_env("TUNING_GPA_GRID", [3.4, 3.6, 3.8])
+        sim_grid = _parse_float_list_env("TUNING_SIM_GRID", [0.6, 0.7, 0.8])
+        peer_pool = [s for s in transformed_students if s["gpa"] >= min(gpa_grid + [gpa_success_threshold])]
+        print(f"Calculando similitudes: {sum(1 for s in transformed_students if len(s['subjects_by_term']) >= 2)} historias x {len(peer_pool)} pares")
+        pairwise = build_pairwise_similarity(transformed_students, peer_pool, min(sim_grid + [similarity_threshold]), pool=pool)
+
+        print("===== PM RECOMMENDER METRICS =====")
+        metrics = evaluate_holdout_last_term(
+            all_students=transformed_students,
+            successful_students=successful_students,
+            similarity_threshold=similarity_threshold,
+            k=top_k,
+            gpa_success_threshold=gpa_success_threshold,
+            pairwise=pairwise,
+            pool=pool
+        )
 
-    successful_students = [s for s in transformed_students if s["gpa"] >= gpa_success_threshold]
-    if not successful_students:
-        raise ValueError("No hay estudiantes exitosos según el umbral de GPA")
-    print(f"Estudiantes exitosos (gpa ≥ {gpa_success_threshold}): {len(successful_students)}")
-
-    course_stats = compute_course_stats(successful_students)
-
-    print("===== PM RECOMMENDER METRICS =====")
-    metrics = evaluate_holdout_last_term(
-        all_students=transformed_students,
-        successful_students=successful_students,
-        similarity_threshold=similarity_threshold,
-        k=top_k,
-        gpa_success_threshold=gpa_success_threshold
-    )
-
-    print(f"Hit-Rate@{top_k}: {metrics['hit_rate_at_k']:.4f}")
-    print(f"Accuracy: {metrics['accuracy']:.4f}")
-    print(f"Precision: {metrics['precision']:.4f}")
-    print(f"Recall: {metrics['recall']:.4f}")
-    print(f"F1 Score: {metrics['f1']:.4f}")
-    print(f"TP={metrics['tp']} FP={metrics['fp']} TN={metrics['tn']} FN={metrics['fn']}")
-
-    print("===== PM COHORT SIMULATION =====")
-    tuning_results = tune_parameters_with_simulation(
-        all_students=transformed_students,
-        top_k=top_k
-    )
+        print(f"Hit-Rate@{top_k}: {metrics['hit_rate_at_k']:.4f}")
+        print(f"Accuracy: {metrics['accuracy']:.4f}")
+        print(f"Precision: {metrics['precision']:.4f}")
+        print(f"Recall: {metrics['recall']:.4f}")
+        print(f"F1 Score: {metrics['f1']:.4f}")
+        print(f"TP={metrics['tp']} FP={metrics['fp']} TN={metrics['tn']} FN={metrics['fn']}")
+
+        print("===== PM COHORT SIMULATION =====")
+        tuning_results = tune_parameters_with_simulation(
+            all_students=transformed_students,
+            top_k=top_k,
+            pairwise=pairwise,
+            pool=pool
+        )
+    finally:
+        # also on failure, so no worker outlives the job
+        close_worker_pool(pool)
+
+    peer_lsh, lsh_metrics = None, None
+    if lsh_bands:
+        print("===== PM LSH =====")
+        signatures = peer_signatures(peer_index, lsh_bands * lsh_rows)
+        peer_lsh = build_peer_lsh(peer_index, lsh_bands, lsh_rows, signatures, min_sim=similarity_threshold)
+        # holdout histories of a sample of students, not counting the student itself among its peers
+        peer_rows = {sid: i for i, sid in enumerate(peer_index["student_ids"].tolist())}
+        eligible = [s for s in transformed_students if len(s["subjects_by_term"]) >= 2]
+        rng = random.Random(int(os.getenv("TUNING_SEED", "42")))
+        sample = rng.sample(eligible, min(len(eligible), int(os.getenv("PM_LSH_RECALL_QUERIES", "200"))))
+        lsh_metrics = lsh_recall(peer_index, [s["subjects_by_term"][:-1] for s in sample],
+                                 [(lsh_bands, lsh_rows)], similarity_threshold,
+                                 exclude=[peer_rows.get(s["student_id"], -1) for s in sample],
+                                 signatures=signatures)[0]
+        peer_lsh["recall"] = lsh_metrics["recall"]
+        print(f"Recall LSH {lsh_bands}x{lsh_rows} @ sim ≥ {similarity_threshold}: {lsh_metrics['recall']:.4f} "
+              f"(pares re-puntuados {lsh_metrics['candidate_rate']:.2%}, "
+              f"{lsh_metrics['ms_lsh']} ms vs {lsh_metrics['ms_exact']} ms exacto)")
 
     artifact = {
-        "schema_version": 3,
+        "schema_version": 4,
         "created_at": datetime.now(timezone.utc).isoformat(),
         "degree_id": degree_id,
-        "successful_students": [
-            {
-                "student_id": s["student_id"],
-                "gpa": s["gpa"],
-                "subjects_by_term": s["subjects_by_term"],
-                "grades_by_subject": s["grades_by_subject"]
-            } for s in successful_students
-        ],
+        # successful students live in peer_index.joblib as integer arrays
+        "peer_index_file": "peer_index.joblib",
+        "peer_lsh_file": "peer_lsh.joblib" if peer_lsh is not None else None,
         "course_stats": course_stats,
         "params": {
             "gpa_success_threshold": gpa_success_threshold,
@@ -732,12 +917,21 @@ def train():
     model_path = os.path.join(model_dir, "model.joblib")
     joblib.dump(artifact, model_path)
 
+    # left uncompressed so inference can memory-map the arrays
+    peer_index_path = os.path.join(model_dir, "peer_index.joblib")
+    joblib.dump(peer_index, peer_index_path)
+    model_files = ["model.joblib", "peer_index.joblib"]
+    if peer_lsh is not None:
+        peer_lsh_path = os.path.join(model_dir, "peer_lsh.joblib")
+        joblib.dump(peer_lsh, peer_lsh_path)
+        model_files.append("peer_lsh.joblib")
+
     metadata_path = os.path.join(model_dir, "metadata.json")
     metadata = {
         "algorithm": "pm",
         "model_type": "SimilarityFootprint",
         "export_time": datetime.now(timezone.utc).isoformat(),
-        "model_files": ["model.joblib"],
+        "model_files": model_files,
         "training_info": {
             "degree_id": degree_id,
             "training_date": datetime.now(timezone.utc).isoformat(),
@@ -748,6 +942,7 @@ def train():
             "top_k": top_k
         },
         "recommender_metrics": metrics,
+        "lsh": lsh_metrics,
         "tuning": {
             "grid": {
                 "GPA": os.getenv("TUNING_GPA_GRID", "3.4,3.6,3.8"),
@@ -762,6 +957,9 @@ def train():
 
     print("Entrenamiento completado.")
     print(f"   - model.joblib: {os.path.getsize(model_path)} bytes")
+    print(f"   - peer_index.joblib: {os.path.getsize(peer_index_path)} bytes")
+    if peer_lsh is not None:
+        print(f"   - peer_lsh.joblib: {os.path.getsize(peer_lsh_path)} bytes")
     print(f"   - metadata.json: {os.path.getsize(metadata_path)} bytes")
 
 if __name__ == "__main__":
@@ -10,11 +10,14 @@ def setup_environment():
 
     files_to_copy = [
         "asb_train.py",
+        "asb_recommender.py",
         "rf_train.py",
         "pm_train.py",
+        "pm_peers.py",
+        "pm_lsh.py",
         "spm_train.py",
         "subjects.py"
-    ]o
+    ]
 
 
 
@@ -1,3 +1,5 @@
+import os
+import time
 from typing import List
 
 import boto3
@@ -5,6 +7,8 @@ import boto3
 from src.model.records.student_record import StudentRecord
 from src.model.records.student_subject_record import StudentSubjectRecord
 
+# change records expire through the table TTL; a state older than this window is rebuilt in full
+DATA_CHANGE_TTL_DAYS = int(os.environ.get("DATA_CHANGE_TTL_DAYS", "30"))
 
 class DynamoStudentsRepository():
     def __init__(self):
@@ -20,6 +24,7 @@ class DynamoStudentsRepository():
             **record_dict
         }
         self.table.put_item(Item=item)
+        self.bump_data_version(student_record.degreeId, student_record.id)
 
         plan_key = {
             "PK": f"DEGREE#{student_record.degreeId}",
@@ -51,6 +56,29 @@ class DynamoStudentsRepository():
         else:
             self.add_student_plan(student_record)
 
+    def bump_data_version(self, degree_id: str, student_id: str = None) -> None:
+        response = self.table.update_item(
+            Key={
+            "PK": f"DEGREE#{degree_id}",
+            "SK": "DATA-VERSION",
+            },
+            UpdateExpression="ADD data_version :one",
+            ExpressionAttributeValues={":one": 1},
+            ReturnValues="UPDATED_NEW"
+        )
+        if student_id is None:
+            return
+
+        # one change record per version lets the ASB frame fetch only the students that changed
+        version = int(response["Attributes"]["data_version"])
+        self.table.put_item(Item={
+            "PK": f"DEGREE#{degree_id}",
+            "SK": f"DATA-CHANGE#{version:010d}",
+            "student_id": str(student_id),
+            "data_version": version,
+            "expires_at": int(time.time()) + DATA_CHANGE_TTL_DAYS * 86400
+        })
+
     def get_schooling(self, degree_id: str, student_id: str) -> StudentRecord:
         response = self.table.get_item(
             Key={
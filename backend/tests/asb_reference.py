@@ -0,0 +1,553 @@
+import math
+import statistics
+
+import numpy as np
+import pandas as pd
+
+# Row-by-row ASB feature and label builders as they were before they were vectorized, kept as the
+# oracle for tests/test_asb_equivalence.py. They are quadratic in the number of rows; only use
+# them on small synthetic cohorts.
+
+def as_reference_frame(df):
+    # the original builders predate categorical student and course columns
+    return df.astype({"studentstudyid": object, "Course": object})
+
+def add_course_index(df, feature, is_atomic, pm_index_type):
+    def order(row):
+        s_id = row["studentstudyid"]; c = row["Course"]; sem = row["fachsemester"]; status = row["Final Course Status"]
+        student = df.loc[df["studentstudyid"] == s_id]
+        semesters = sorted(student["fachsemester"].unique())
+        idx = semesters.index(sem)
+        if is_atomic:
+            return c + "_" + str(idx + 1), idx + 1, None
+        else:
+            first_attempt_sem = sorted(student.loc[student["Course"] == c]["fachsemester"].values)[0]
+            if first_attempt_sem == sem:
+                if status == "PASSED":
+                    return "e_" + c, idx + 1, "s_" + c
+                return None, idx + 1, "s_" + c
+            else:
+                if status == "PASSED":
+                    return "e_" + c, idx + 1, None
+                return None, None, None
+
+    def distance(row):
+        s_id = row["studentstudyid"]; c = row["Course"]; sem = row["fachsemester"]; status = row["Final Course Status"]
+        student = df.loc[df["studentstudyid"] == s_id]
+        semesters = sorted(student["fachsemester"].unique())
+        first_sem = semesters[0]
+        if is_atomic:
+            return c + "_" + str(sem - first_sem), sem - first_sem, None
+        else:
+            first_attempt_sem = sorted(student.loc[student["Course"] == c]["fachsemester"].values)[0]
+            if first_attempt_sem == sem:
+                if status == "PASSED":
+                    return "e_" + c, sem - first_sem, "s_" + c
+                return None, sem - first_sem, "s_" + c
+            else:
+                if status == "PASSED":
+                    return "e_" + c, sem - first_sem, None
+                return None, None, None
+
+    def semester(row):
+        s_id = row["studentstudyid"]; c = row["Course"]; sem = row["fachsemester"]; status = row["Final Course Status"]
+        student = df.loc[df["studentstudyid"] == s_id]
+        if is_atomic:
+            return c + "_" + str(sem), sem, None
+        else:
+            first_attempt_sem = sorted(student.loc[student["Course"] == c]["fachsemester"].values)[0]
+            if first_attempt_sem == sem:
+                if status == "PASSED":
+                    return "e_" + c, sem, "s_" + c
+                return None, sem, "s_" + c
+            else:
+                if status == "PASSED":
+                    return "e_" + c, sem, None
+                return None, None, None
+
+    if feature == "Course-Order":
+        df["course-index"], df["index"], df["start-index"] = zip(*df.apply(lambda r: order(r), axis=1))
+    elif feature == "Course-Distance":
+        df["course-index"], df["index"], df["start-index"] = zip(*df.apply(lambda r: distance(r), axis=1))
+    elif feature == "Course-Semester":
+        df["course-index"], df["index"], df["start-index"] = zip(*df.apply(lambda r: semester(r), axis=1))
+    else:
+        if pm_index_type == "fachsemester":
+            df["course-index"], df["index"], df["start-index"] = zip(*df.apply(lambda r: semester(r), axis=1))
+        elif pm_index_type == "order":
+            df["course-index"], df["index"], df["start-index"] = zip(*df.apply(lambda r: order(r), axis=1))
+        else:
+            df["course-index"], df["index"], df["start-index"] = zip(*df.apply(lambda r: distance(r), axis=1))
+
+def get_2_label(label, number):
+    if number <= 2.5:
+        return label + " <= 2.5"
+    elif number > 2.5:
+        return label + " > 2.5"
+    return None
+
+def get_5_label(label, number):
+    if number <= 1.5: return label + " Excellent"
+    elif number <= 2.5: return label + " Good"
+    elif number <= 3.5: return label + " Satisfactory"
+    elif number <= 4.0: return label + " Sufficient"
+    elif number > 4.0: return label + " Failed"
+    return None
+
+def get_GPA(row, df, incl_fail):
+    s = row["studentstudyid"]
+    credit_grades = df.loc[(df["studentstudyid"] == s)][["Credit", "course-grade"]].values
+    c_g = [[c, g] for c, g in credit_grades if not pd.isna(g)]
+    if not incl_fail:
+        c_g = [[c, g] for c, g in c_g if g != 5.0]
+    weighted_grade = sum([c * g for c, g in c_g])
+    total_credits = sum([c for c, g in c_g])
+    GPA = None
+    if total_credits > 0:
+        GPA = weighted_grade / total_credits
+        GPA = math.floor(GPA * 10) / 10.0
+    gpa_2 = get_2_label("GPA", GPA) if (GPA is not None and not pd.isna(GPA)) else None
+    gpa_5 = get_5_label("GPA", GPA) if (GPA is not None and not pd.isna(GPA)) else None
+    return GPA, gpa_2, gpa_5
+
+def compute_exact_GPA(df, GPA_grades):
+    incl_fail = True
+    if GPA_grades == "passed+failed last attempt":
+        df = df.drop_duplicates(subset=["studentstudyid", "Course", "fachsemester"], keep="last")
+    elif GPA_grades == "passed":
+        incl_fail = False
+    df["GPA"], df["GPA-2level"], df["GPA-5level"] = zip(*df.apply(lambda row: get_GPA(row, df, incl_fail), axis=1))
+    return df
+
+def get_GPA_label(df, is_binary, GPA_grades):
+    students = df["studentstudyid"].unique()
+    df = compute_exact_GPA(df, GPA_grades)
+    GPAs = []
+    for s in students:
+        label_GPA = df.loc[df["studentstudyid"] == s]["GPA-2level" if is_binary else "GPA-5level"].values[0]
+        GPAs.append(label_GPA)
+    return pd.DataFrame(GPAs, columns=pd.Index(["label"])), df
+
+def get_lifecycle_course_index(df, label_index):
+    end_indices = df[["course-index", "index"]].values
+    start_indices = df[["start-index", "index"]].values
+    if pd.isna(label_index):
+        all_start_features = list(set([e[0] + "_" + str(int(e[1])) for e in start_indices if pd.notna(e[0])]))
+        all_end_features = list(set([e[0] + "_" + str(int(e[1])) for e in end_indices if pd.notna(e[0])]))
+    else:
+        all_start_features = list(set([e[0] + "_" + str(int(e[1])) for e in start_indices if (pd.notna(e[0]) and e[1] <= int(label_index))]))
+        all_end_features = list(set([e[0] + "_" + str(int(e[1])) for e in end_indices if (pd.notna(e[0]) and e[1] <= int(label_index))]))
+    return all_start_features + all_end_features
+
+def feature_non_pm(df, clf_dict):
+    students = df["studentstudyid"].unique()
+    is_atomic = clf_dict["is_atomic"]
+    label = clf_dict["label"]
+    label_index = clf_dict["label_index"]
+    if label == "Overall GPA":
+        all_feature_names = df["course-index"].unique() if is_atomic else get_lifecycle_course_index(df, None)
+    else:
+        if is_atomic:
+            all_feature_names = df.loc[(df["index"] <= label_index)]["course-index"].unique()
+        else:
+            all_feature_names = get_lifecycle_course_index(df, label_index)
+    rows = []
+    for s in students:
+        student_df = df.loc[(df["studentstudyid"] == s)]
+        student_features = student_df["course-index"].values if is_atomic else get_lifecycle_course_index(student_df, None)
+        rows.append([1 if f in student_features else 0 for f in all_feature_names])
+    return pd.DataFrame(np.array(rows), columns=pd.Index(all_feature_names))
+
+def get_all_pm_feature_names(df, clf_dict):
+    is_atomic = clf_dict["is_atomic"]
+    course = clf_dict["course"]
+    label = clf_dict["label"]
+    label_index = clf_dict["label_index"]
+    if is_atomic:
+        dfg_node_names = df["course-index"].unique()
+        right_course = dfg_node_names if label == "Overall GPA" else [f"{course}_{label_index}"]
+    else:
+        dfg_node_names = []
+        for c in df["Course"].unique():
+            dfg_node_names.extend(["s_" + c, "e_" + c])
+        right_course = dfg_node_names if label == "Overall GPA" else ["e_" + course]
+    names = []
+    for left in dfg_node_names:
+        for right in right_course:
+            if is_atomic:
+                try:
+                    i = int(str(left).split("_")[-1]); j = int(str(right).split("_")[-1])
+                except Exception:
+                    continue
+                if i <= j:
+                    names.append(left + "->" + right)
+            else:
+                names.append(left + "->" + right)
+    return names
+
+def student_pm_feature(student_df, clf_dict):
+    label = clf_dict["label"]; course = clf_dict["course"]
+    is_atomic = clf_dict["is_atomic"]; label_index = clf_dict["label_index"]
+    feature = clf_dict["feature"]
+    if is_atomic:
+        node_index_df = student_df[["course-index", "index"]]
+    else:
+        end_indices = student_df[["course-index", "index"]].dropna()
+        start_indices = student_df[["start-index", "index"]].dropna()
+        node_index_df = pd.concat([start_indices.rename(columns={"start-index": "course-index"}), end_indices], axis=0)
+    all_indices = sorted(node_index_df["index"].unique())
+    node_index_list = node_index_df.values
+    if label == "Overall GPA":
+        right_list = node_index_list
+        index = 0
+    else:
+        if is_atomic:
+            index_list = student_df.loc[student_df["course-index"] == f"{course}_{label_index}"].values
+            index = label_index if index_list.size > 0 else ""
+            right_list = [(f"{course}_{label_index}", index)]
+        else:
+            index_list = student_df.loc[student_df["course-index"] == "e_" + course]["index"].values
+            index = index_list[0] if index_list.size > 0 else ""
+            right_list = [("e_" + course, index)]
+    if index == "":
+        return [], []
+    pm_features, path_lengths = [], []
+    for left, idx1 in node_index_list:
+        for right, idx2 in right_list:
+            if feature == "Path Length":
+                if idx1 <= idx2:
+                    pl = all_indices.index(idx2) - all_indices.index(idx1)
+                    pm_features.append(left + "->" + right); path_lengths.append(pl)
+            elif feature == "Directly Follows":
+                if idx1 + 1 == idx2:
+                    pm_features.append(left + "->" + right)
+            else:
+                if idx1 < idx2:
+                    pm_features.append(left + "->" + right)
+    return pm_features, path_lengths
+
+def feature_pm(df, clf_dict):
+    students = df["studentstudyid"].unique()
+    all_feature_names = get_all_pm_feature_names(df, clf_dict)
+    feature = clf_dict["feature"]
+    rows = []
+    for s in students:
+        student_df = df.loc[(df["studentstudyid"] == s)]
+        student_features, path_lens = student_pm_feature(student_df, clf_dict)
+        l = []
+        for f_name in all_feature_names:
+            if feature == "Path Length":
+                if f_name in student_features:
+                    idx = student_features.index(f_name)
+                    l.append(path_lens[idx])
+                else:
+                    l.append(-1)
+            else:
+                l.append(1 if f_name in student_features else 0)
+        rows.append(l)
+    return pd.DataFrame(np.array(rows), columns=pd.Index(all_feature_names))
+
+def get_behavioral_features(df, clf_dict):
+    feature = clf_dict["feature"]; is_atomic = clf_dict["is_atomic"]
+    if feature in ["Course-Order", "Course-Semester", "Course-Distance"]:
+        return feature_non_pm(df, clf_dict)
+    elif feature in ["Path Length", "Directly Follows", "Eventually Follows"]:
+        return feature_pm(df, clf_dict)
+    else:
+        raise ValueError(f"Feature desconocida: {feature}")
+
+def get_exams_per_semester(df, s, max_sem):
+    ex_sem = []
+    ex_sem_dict = dict(df.loc[(df["studentstudyid"] == s)][["fachsemester"]].value_counts())
+    for i in range(1, max_sem + 1):
+        ex_sem.append(ex_sem_dict.get((i,), 0))
+    return ex_sem
+
+def get_numerical_features(df, clf_dict):
+    max_sem = int(max(df["fachsemester"].values))
+    students = df["studentstudyid"].unique()
+    label = clf_dict["label"]
+
+    if label == "Overall GPA":
+        rows = []
+        for s in students:
+            exams_semester = get_exams_per_semester(df, s, max_sem)
+            exams = str(sum(exams_semester))
+            med_exams_per_sem = int(np.median(exams_semester))
+            non_zero_sems = int(np.count_nonzero(exams_semester))
+            rows.append([exams, med_exams_per_sem, non_zero_sems])
+        return pd.DataFrame(np.array(rows), columns=pd.Index(["exams", "med_exams_per_sem", "non_zero_sems"]))
+    else:
+        course = clf_dict["course"]; label_index = clf_dict["label_index"]; is_atomic = clf_dict["is_atomic"]; is_pm = clf_dict["is_pm"]
+        rows = []
+        for s in students:
+            lab_idx = label_index
+            if not is_atomic and is_pm:
+                lab_idx_arr = df.loc[(df["studentstudyid"] == s) & (df["course-index"] == "e_" + course)]["index"].values
+                lab_idx = lab_idx_arr[0] if lab_idx_arr.size > 0 else ""
+            exams = len(df.loc[(df["studentstudyid"] == s) & (df["index"] == lab_idx)])
+            rows.append([str(exams)])
+        return pd.DataFrame(np.array(rows), columns=pd.Index(["exams"]))
+
+def get_course_grade_dict(df, courses):
+    course_dict = {}
+    for c in courses:
+        grades = df.loc[df["Course"] == c]["course-grade"].values
+        grades = np.asarray([g for g in grades if ~np.isnan(g)])
+        course_dict[c] = {"grades": grades}
+        try:
+            course_dict[c]["median-grade"] = statistics.median(grades)
+        except Exception:
+            course_dict[c]["median-grade"] = np.nan
+    return course_dict
+
+def get_course_difficulties(course_dict, courses):
+    very_easy, easy, difficult, very_difficult = [], [], [], []
+    for c in courses:
+        g = course_dict[c]["median-grade"]
+        if pd.isna(g):
+            very_difficult.append(c)
+        elif g <= 1.5:
+            very_easy.append(c)
+        elif 1.6 <= g <= 2.5:
+            easy.append(c)
+        elif 2.6 <= g <= 3.5:
+            difficult.append(c)
+        else:
+            very_difficult.append(c)
+    return very_easy, easy, difficult, very_difficult
+
+def get_difficulty_features(df, clf_dict):
+    courses = df["Course"].unique()
+    students = df["studentstudyid"].unique()
+    course_dict = get_course_grade_dict(df, courses)
+    very_easy, easy, difficult, very_difficult = get_course_difficulties(course_dict, courses)
+    cols = ["very easy exams", "easy exams", "difficult exams", "very difficult exams"]
+    rows = []
+    label = clf_dict["label"]
+
+    if label == "Overall GPA":
+        for s in students:
+            l = [0, 0, 0, 0]
+            s_courses = df.loc[df["studentstudyid"] == s]["Course"].values
+            for c in s_courses:
+                if c in very_easy: l[0] += 1
+                elif c in easy: l[1] += 1
+                elif c in difficult: l[2] += 1
+                else: l[3] += 1
+            rows.append(l)
+    else:
+        course = clf_dict["course"]; label_index = clf_dict["label_index"]; is_atomic = clf_dict["is_atomic"]; is_pm = clf_dict["is_pm"]
+        for s in students:
+            lab_idx = label_index
+            if not is_atomic and is_pm:
+                lab_idx_arr = df.loc[(df["studentstudyid"] == s) & (df["course-index"] == "e_" + course)]["index"].values
+                lab_idx = lab_idx_arr[0] if lab_idx_arr.size > 0 else ""
+            l = [0, 0, 0, 0]
+            s_courses = df.loc[(df["studentstudyid"] == s) & (df["index"] == lab_idx)]["Course"].values
+            for c in s_courses:
+                if c == course:
+                    continue
+                if c in very_easy: l[0] += 1
+                elif c in easy: l[1] += 1
+                elif c in difficult: l[2] += 1
+                else: l[3] += 1
+            rows.append(l)
+    return pd.DataFrame(np.array(rows), columns=pd.Index(cols))
+
+def get_passfail_label(df, course, is_atomic, label_index, is_pm):
+    students = df["studentstudyid"].unique()
+    pass_fail = []
+    if is_atomic:
+        for s in students:
+            status = list(df.loc[
+                (df["studentstudyid"] == s) & (df["course-index"] == f"{course}_{label_index}")
+            ]["Final Course Status"])
+            pass_fail.append(str(status[0]) if status else None)
+    else:
+        pass_fail = [None for _ in students]
+    return pd.DataFrame(pass_fail, columns=pd.Index(["label"]))
+
+def get_course_grade_label(df, course, is_binary, is_atomic, label_index, is_pm):
+    students = df["studentstudyid"].unique()
+    grades = []
+    for s in students:
+        if is_atomic:
+            label_index_name = f"{course}_{label_index}"
+            grade = list(df.loc[
+                (df["studentstudyid"] == s) & (df["course-index"] == label_index_name)
+            ]["course-grade"])
+        else:
+            if is_pm:
+                label_index_name = "e_" + course
+                grade = list(df.loc[(df["studentstudyid"] == s) & (df["course-index"] == label_index_name)]["course-grade"])
+            else:
+                label_index_name = f"e_{course}_{label_index}"
+                grade = list(df.loc[
+                    (df["studentstudyid"] == s) &
+                    (df["course-index"] == "e_" + course) &
+                    (df["index"] == label_index)
+                ]["course-grade"])
+        if grade:
+            exact = grade[0]
+            grades.append(get_2_label(label_index_name, exact) if is_binary else get_5_label(label_index_name, exact))
+        else:
+            grades.append(None)
+    return pd.DataFrame(np.array(grades), columns=pd.Index(["label"]))
+
+def get_label(df, clf_dict):
+    label_name = clf_dict["label"]
+    if label_name == "Overall GPA":
+        return get_GPA_label(df, clf_dict["is_binary_label"], clf_dict["GPA_grades"])[0]
+    else:
+        return get_course_grade_label(
+            df, clf_dict["course"], clf_dict["is_binary_label"],
+            clf_dict["is_atomic"], clf_dict["label_index"], clf_dict["is_pm"]
+        )
+
+def get_features(df, clf_dict):
+    features = []
+    combinations = clf_dict["combinations"]
+    behav_feature = diff_feature = num_feature = None
+
+    if set(combinations) & {"behav", "diff+behav", "num+behav", "diff+num+behav", "all"}:
+        behav_feature = get_behavioral_features(df, clf_dict)
+    if set(combinations) & {"diff", "diff+num", "diff+behav", "diff+num+behav", "all"}:
+        diff_feature = get_difficulty_features(df, clf_dict)
+    if set(combinations) & {"num", "diff+num", "num+behav", "diff+num+behav", "all"}:
+        num_feature = get_numerical_features(df, clf_dict)
+
+    for comb in combinations:
+        if comb == "diff":
+            features.append(diff_feature)
+        elif comb == "behav":
+            features.append(behav_feature)
+        elif comb == "num":
+            features.append(num_feature)
+        elif comb == "diff+num":
+            features.append(pd.concat([diff_feature, num_feature], axis=1))
+        elif comb == "diff+behav":
+            features.append(pd.concat([diff_feature, behav_feature], axis=1))
+        elif comb == "num+behav":
+            features.append(pd.concat([num_feature, behav_feature], axis=1))
+        elif comb == "diff+num+behav":
+            features.append(pd.concat([diff_feature, num_feature, behav_feature], axis=1))
+        elif comb == "all":
+            features.append(pd.concat([diff_feature, num_feature, behav_feature], axis=1))
+        else:
+            raise ValueError(f"Combinación desconocida: {comb}")
+
+    return features
+
+def drop_rows(features, label_df):
+    new_features = []
+    mask = label_df["label"].notnull()
+    for feature in features:
+        new_features.append(feature[mask])
+    return new_features, label_df[mask]
+
+def get_features_label_from_dataframe(df, config):
+    try:
+        feature = config["feature"]
+        is_atomic = config["is_atomic"]
+        pm_index_type = config["index_type"]
+
+        add_course_index(df, feature, is_atomic, pm_index_type)
+
+        label = get_label(df, config)
+
+        unique_labels = label["label"].dropna().unique()
+        count_labels = label["label"].value_counts()
+        num_labels = len(unique_labels)
+        total_samples = len(label["label"].dropna())
+
+        print(f"\n=== Class Distribution Analysis ===")
+        print(f"Total samples: {total_samples}")
+        print(f"Number of classes: {num_labels}")
+        print("Class counts:")
+        for class_val, count in count_labels.items():
+            percentage = (count / total_samples) * 100
+            print(f"  - Class {class_val}: {count} samples ({percentage:.1f}%)")
+
+        if num_labels < 2:
+            if num_labels > 0:
+                return [], [], f"Classification not helpful:\n\nLabel needs >1 class. Got {num_labels}: {unique_labels[0]}\n{count_labels}"
+            else:
+                return [], [], "Classification not helpful:\n\nLabel needs >1 class. Got 0 classes."
+
+        min_percentage = 5.0
+        for class_val, count in count_labels.items():
+            percentage = (count / total_samples) * 100
+            if percentage < min_percentage:
+                return [], [], f"Extreme class imbalance detected:\n\nClass '{class_val}' has only {count} samples ({percentage:.1f}%), which is below the minimum threshold of {min_percentage}%.\n\nThis may lead to poor recall performance as reported in the paper (Section 6.1).\nConsider:\n- Increasing sample size\n- Adjusting class thresholds\n- Using different labeling strategy\n\nClass distribution:\n{count_labels}"
+
+        features = get_features(df, config)
+
+        features, label = drop_rows(features, label)
+
+        labels = [label] * len(features)
+        return features, labels, ""
+    except Exception as e:
+        return [], [], f"Error procesando DataFrame: {str(e)}"
+
+
+# tree pruning and rule extraction as they were before they became iterative; both recurse once per tree level
+
+def is_leaf(inner_tree, index):
+    return inner_tree.children_left[index] == -1 and inner_tree.children_right[index] == -1
+
+def prune_index(inner_tree, decisions, index=0):
+    if not is_leaf(inner_tree, inner_tree.children_left[index]):
+        prune_index(inner_tree, decisions, inner_tree.children_left[index])
+    if not is_leaf(inner_tree, inner_tree.children_right[index]):
+        prune_index(inner_tree, decisions, inner_tree.children_right[index])
+    if (is_leaf(inner_tree, inner_tree.children_left[index]) and
+        is_leaf(inner_tree, inner_tree.children_right[index]) and
+        (decisions[index] == decisions[inner_tree.children_left[index]]) and
+        (decisions[index] == decisions[inner_tree.children_right[index]])):
+        inner_tree.children_left[index] = -1
+        inner_tree.children_right[index] = -1
+        inner_tree.feature[index] = -2
+
+def prune_duplicate_leaves(clf):
+    decisions = clf.tree_.value.argmax(axis=2).flatten().tolist()
+    prune_index(clf.tree_, decisions)
+
+def get_rules(tree, feature_names, class_names):
+    tree_ = tree.tree_
+    feature_name = [feature_names[i] if i != -2 else "undefined!" for i in tree_.feature]
+    N = tree_.n_node_samples[0]
+    paths, path = [], []
+
+    def recurse(node, path, paths):
+        if tree_.feature[node] != -2:
+            name = feature_name[node]
+            threshold = tree_.threshold[node]
+            p1, p2 = list(path), list(path)
+            p1 += [f"{name} <= {np.round(threshold, 3)}"]
+            recurse(tree_.children_left[node], p1, paths)
+            p2 += [f"{name} > {np.round(threshold, 3)}"]
+            recurse(tree_.children_right[node], p2, paths)
+        else:
+            path += [(tree_.value[node], tree_.n_node_samples[node])]
+            paths += [path]
+
+    recurse(0, path, paths)
+
+    rules, all_sample_perc, all_acc = [], [], []
+    for p in paths:
+        rule_str = ", ".join(p[:-1])
+        classes = p[-1][0][0]
+        l = int(np.argmax(classes))
+        acc = float(np.round(100.0 * classes[l] / np.sum(classes), 2))
+        samples = int(p[-1][1])
+        samples_perc = float(np.round(100.0 * samples / N, 2))
+        rules.append([f"{rule_str}, class: {class_names[l] if class_names else str(l)}", acc, samples_perc, 0.0, (samples, N)])
+        all_acc.append(acc); all_sample_perc.append(samples_perc)
+
+    all_acc = np.array(all_acc); all_sample_perc = np.array(all_sample_perc)
+    acc_norm = np.ones_like(all_acc) if (all_acc.max() - all_acc.min()) == 0 else (all_acc - all_acc.min()) / (all_acc.max() - all_acc.min())
+    sp_norm = np.ones_like(all_sample_perc) if (all_sample_perc.max() - all_sample_perc.min()) == 0 else (all_sample_perc - all_sample_perc.min()) / (all_sample_perc.max() - all_sample_perc.min())
+    for i in range(len(rules)):
+        rules[i][3] = float(np.round(((acc_norm[i] + sp_norm[i]) / 2) * 100, 2))
+    return rules
@@ -0,0 +1,46 @@
+import os
+import random
+import sys
+
+import pytest
+
+# handlers import src.*, the recommender scripts import each other by module name
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (BACKEND_DIR, os.path.join(BACKEND_DIR, "src", "recommender")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def make_degree_items(n_students=60, n_courses=12, seed=0):
+    # DynamoDB student items with gaps between terms, retakes, REV rows and missing grades
+    rnd = random.Random(seed)
+    items = []
+    for s in range(n_students):
+        subjects = []
+        start = rnd.choice([1, 1, 2, 3])
+        for sem in range(start, start + rnd.randint(1, 6)):
+            if rnd.random() < 0.15:
+                continue
+            for c in rnd.sample(range(n_courses), rnd.randint(1, 4)):
+                subjects.append({
+                    "code": f"course-{c}",
+                    "semester": str(sem),
+                    "status": rnd.choice(["APR", "APR", "APR", "REP", "REV"]),
+                    "grade": rnd.choice([0, 55, 72, 81, 95, 100, 88, 67, None, ""]),
+                    "result_source": rnd.choice(["por dictado", "por examen"]),
+                    "result_type": rnd.choice(["T", "P"]),
+                })
+        if subjects and rnd.random() < 0.6:
+            retake = dict(rnd.choice(subjects))
+            retake["semester"] = str(int(retake["semester"]) + rnd.randint(0, 2))
+            retake["status"] = rnd.choice(["APR", "REP"])
+            subjects.append(retake)
+        items.append({"PK": "DEGREE#1", "SK": f"STUDENTS#{s}", "id": s, "subjects": subjects,
+                      "start_date": f"01/03/{2015 + s % 5}"})
+    return items
+
+
+@pytest.fixture(scope="session")
+def asb_frame():
+    from src.recommender.asb_recommender import convert_dynamodb_to_asb_format
+    return convert_dynamodb_to_asb_format(make_degree_items())
@@ -0,0 +1,80 @@
+import os
+import threading
+
+import pytest
+
+import src.recommender.asb_recommender as asb
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(asb, "FEATURE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(asb, "FEATURE_CACHE_DISK_SIZE", 3)
+    monkeypatch.setattr(asb, "CACHE_SIZES", {"features": 2, "frame": 2, "degree-state": 1, "figure": 3})
+    monkeypatch.setattr(asb, "_caches", {kind: asb.OrderedDict() for kind in asb.CACHE_SIZES})
+    monkeypatch.setattr(asb, "cache_stats", {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0})
+    return asb
+
+
+def disk_files(cache):
+    return sorted(f for f in os.listdir(cache.FEATURE_CACHE_DIR) if f.endswith(".joblib"))
+
+
+def test_lru_evicts_least_recently_used(cache):
+    cache.cache_put(("features", "a"), 1, write_disk=False)
+    cache.cache_put(("features", "b"), 2, write_disk=False)
+    assert cache.cache_get(("features", "a")) == 1
+    cache.cache_put(("features", "c"), 3, write_disk=False)
+    assert list(cache._caches["features"]) == [("features", "a"), ("features", "c")]
+    assert cache.cache_get(("features", "b")) is None
+    assert cache.get_cache_stats() == {"hits": 1, "disk_hits": 0, "misses": 1, "evictions": 1}
+
+
+def test_figures_do_not_evict_other_kinds(cache):
+    cache.cache_put(("degree-state", "1", "table"), {"version": 1}, write_disk=False)
+    cache.cache_put(("features", "a"), 1, write_disk=False)
+    for i in range(10):
+        cache.cache_put(("figure", str(i)), f"png-{i}")
+    assert cache.cache_get(("degree-state", "1", "table")) == {"version": 1}
+    assert cache.cache_get(("features", "a")) == 1
+    assert list(cache._caches["figure"]) == [("figure", "7"), ("figure", "8"), ("figure", "9")]
+    # figures are memory only
+    assert disk_files(cache) == []
+
+
+def test_disk_tier_serves_a_cold_process(cache):
+    key = ("features", "1", "3")
+    cache.cache_put(key, {"matrix": [1, 2, 3]})
+    assert disk_files(cache) == [os.path.basename(cache.cache_path(key))]
+    cache._caches["features"].clear()
+    assert cache.cache_get(key) == {"matrix": [1, 2, 3]}
+    assert cache.cache_get(key) == {"matrix": [1, 2, 3]}
+    assert cache.get_cache_stats() == {"hits": 1, "disk_hits": 1, "misses": 0, "evictions": 0}
+
+
+def test_disk_tier_keeps_the_newest_files(cache):
+    keys = [("features", str(i)) for i in range(5)]
+    for i, key in enumerate(keys):
+        cache.cache_put(key, i)
+        # distinct modification times, oldest first
+        os.utime(cache.cache_path(key), (1000 + i, 1000 + i))
+    assert disk_files(cache) == sorted(os.path.basename(cache.cache_path(k)) for k in keys[-3:])
+
+
+def test_concurrent_access_keeps_counters_and_bounds(cache):
+    def worker(t):
+        for i in range(200):
+            key = ("features", str((t + i) % 5))
+            if cache.cache_get(key) is None:
+                cache.cache_put(key, i, write_disk=False)
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.get_cache_stats()
+    assert stats["hits"] + stats["misses"] == 8 * 200
+    # two threads can miss the same key, the second put then replaces it without an eviction
+    assert 0 < stats["evictions"] <= stats["misses"] - len(cache._caches["features"])
+    assert len(cache._caches["features"]) == 2
@@ -0,0 +1,31 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import src.recommender.asb_recommender as asb
+
+COMBINATIONS = ["diff", "num", "behav", "diff+num+behav", "all"]
+
+
+@pytest.fixture(scope="module")
+def features_labels(asb_frame):
+    config = dict(asb.CONFIG_DEFAULTS, GPA_grades="passed+failed last attempt", model="DT", is_binary_label=True,
+                  feature="Eventually Follows", is_pm=True, combinations=COMBINATIONS, max_depth=4)
+    features, labels, error_msg = asb.get_features_label_from_dataframe(asb_frame.copy(), config)
+    assert error_msg == ""
+    return config, features, labels
+
+
+@pytest.mark.parametrize("pool", ["process", "thread"])
+def test_classify_on_a_pool_matches_serial(features_labels, monkeypatch, pool):
+    config, features, labels = features_labels
+    serial = asb.classify(features, labels, dict(config, n_jobs=1))
+    if pool == "thread":
+        # the fallback used where process pools are unavailable (Lambda has no /dev/shm)
+        monkeypatch.setattr(asb, "get_executor", lambda n_jobs: ThreadPoolExecutor(max_workers=n_jobs))
+    progress = []
+    parallel = asb.classify(features, labels, dict(config, n_jobs=3), lambda *args: progress.append(args))
+    assert parallel == serial
+    assert set(serial[0]) == set(COMBINATIONS)
+    # every fold and final tree reports to the cv counter
+    assert sorted(done for stage, done, total in progress) == list(range(5 * len(COMBINATIONS) + 1))
@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import src.recommender.asb_recommender as asb
+from conftest import make_degree_items
+from test_asb_equivalence import dense, values
+
+FEATURE_CONFIGS = [
+    dict(asb.CONFIG_DEFAULTS, GPA_grades="passed+failed last attempt", model="DT", is_binary_label=True,
+         feature="Eventually Follows", is_pm=True, combinations=["diff", "num", "behav", "all"]),
+    dict(asb.CONFIG_DEFAULTS, GPA_grades="passed", model="DT", label="Course grade", course="course-1", label_index=2,
+         is_binary_label=True, feature="Course-Order", index_type="order", combinations=["diff+num+behav"]),
+]
+
+
+def by_sk(items):
+    # a full query returns the degree's students in SK order
+    return sorted(items, key=lambda item: item["SK"])
+
+
+def student(items, s):
+    return next(item for item in items if item["id"] == s)
+
+
+def replace(old):
+    # same students, new subjects (new courses among them)
+    other = make_degree_items(n_students=60, n_courses=14, seed=9)
+    return [student(other, s) for s in (3, 10, 41)]
+
+
+def add(old):
+    # STUDENTS#60 and #61 sort between #6 and #7
+    other = make_degree_items(n_students=62, n_courses=14, seed=9)
+    return [student(other, 60), student(other, 61)]
+
+
+def shrink(old):
+    # students keep only their first subject, so some courses lose rows or disappear
+    return [dict(student(old, s), subjects=student(old, s)["subjects"][:1]) for s in (0, 7, 22, 35)]
+
+
+CHANGE_SETS = {
+    "replace": (replace, []),
+    "add": (add, []),
+    "delete": (lambda old: [], [5, 20, 33]),
+    "shrink": (shrink, []),
+    "mixed": (lambda old: replace(old) + add(old) + shrink(old), [5, 20]),
+}
+
+
+def apply_changes(old, name):
+    make_items, deleted = CHANGE_SETS[name]
+    items = make_items(old)
+    changed = {item["SK"] for item in items} | {f"STUDENTS#{s}" for s in deleted}
+    new = [item for item in old if item["SK"] not in changed] + items
+    return by_sk(new), by_sk(items), sorted(changed)
+
+
+def assert_same_state(actual, expected):
+    assert actual["version"] == expected["version"]
+    assert actual["keys"] == expected["keys"]
+    pd.testing.assert_frame_equal(actual["frame"], expected["frame"])
+    pd.testing.assert_frame_equal(actual["course_grades"].sort_index().sort_index(axis=1),
+                                  expected["course_grades"].sort_index().sort_index(axis=1))
+
+
+@pytest.mark.parametrize("name", list(CHANGE_SETS))
+def test_update_matches_a_rebuild(name):
+    old = by_sk(make_degree_items())
+    new, items, changed = apply_changes(old, name)
+    updated = asb.update_degree_state(asb.build_degree_state(old, 1), items, changed, 2)
+    rebuilt = asb.build_degree_state(new, 2)
+    assert_same_state(updated, rebuilt)
+
+    for config in FEATURE_CONFIGS:
+        actual_features, actual_labels, actual_error = asb.get_features_label_from_dataframe(updated["frame"].copy(), config)
+        expected_features, expected_labels, expected_error = asb.get_features_label_from_dataframe(rebuilt["frame"].copy(), config)
+        assert actual_error == expected_error == ""
+        for actual, expected in zip(actual_features, expected_features):
+            assert list(actual.columns) == list(expected.columns)
+            assert np.array_equal(dense(actual), dense(expected), equal_nan=True)
+        for actual, expected in zip(actual_labels, expected_labels):
+            assert values(actual["label"]) == values(expected["label"])
+
+
+class FakeTable:
+    def __init__(self, db):
+        self.db = db
+
+    def query(self, KeyConditionExpression, **params):
+        sk = KeyConditionExpression.get_expression()["values"][1].get_expression()
+        if sk["operator"] == "begins_with":
+            self.db.full_queries += 1
+            matches = lambda key: key.startswith(sk["values"][1])
+        else:
+            matches = lambda key: sk["values"][1] <= key <= sk["values"][2]
+        return {"Items": [item for item in self.db.records if matches(item["SK"])]}
+
+
+class FakeDynamoDB:
+    def __init__(self, items, changes):
+        self.records = by_sk(items + changes)
+        self.full_queries = 0
+        self.fetched = []
+
+    def Table(self, name):
+        return FakeTable(self)
+
+    def batch_get_item(self, RequestItems):
+        (table_name, request), = RequestItems.items()
+        sks = {k["SK"] for k in request["Keys"]}
+        self.fetched.extend(sorted(sks))
+        return {"Responses": {table_name: [item for item in self.records if item["SK"] in sks]}}
+
+
+@pytest.fixture
+def state_cache(monkeypatch, tmp_path):
+    monkeypatch.delenv("S3_BUCKET", raising=False)
+    monkeypatch.setattr(asb, "FEATURE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(asb, "_caches", {kind: asb.OrderedDict() for kind in asb.CACHE_SIZES})
+    return asb
+
+
+@pytest.mark.parametrize("missing", [[], [4], [3, 4, 5]])
+def test_load_degree_state_falls_back_to_a_full_rebuild(state_cache, monkeypatch, missing):
+    old = by_sk(make_degree_items())
+    new, _, changed = apply_changes(old, "mixed")
+    # the cached state is at version 2; each later version changed one student and wrote one DATA-CHANGE record,
+    # some of them missing (never written or past their TTL)
+    versions = range(3, 3 + len(changed))
+    changes = [{"PK": "DEGREE#1", "SK": f"DATA-CHANGE#{v:010d}", "student_id": sk.split("#")[1], "data_version": v}
+               for v, sk in zip(versions, changed) if v not in missing]
+    dynamodb = FakeDynamoDB(new, changes)
+    monkeypatch.setattr(asb.boto3, "resource", lambda *args, **kwargs: dynamodb)
+    asb.cache_put(("degree-state", "1", "table"), asb.build_degree_state(old, 2), write_disk=False)
+
+    version = versions[-1]
+    expected_keys = None if missing else [{"PK": "DEGREE#1", "SK": sk} for sk in changed]
+    assert asb.get_changed_student_keys("1", "table", 2, version) == expected_keys
+    state = asb.load_degree_state("1", "table", str(version))
+    assert_same_state(state, asb.build_degree_state(new, version))
+    if missing:
+        assert dynamodb.full_queries == 1 and dynamodb.fetched == []
+    else:
+        # only the changed students are read again; deleted ones are simply not returned
+        assert dynamodb.full_queries == 0 and dynamodb.fetched == changed
+    assert asb.cache_get(("degree-state", "1", "table")) is state
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import KFold
+
+import src.recommender.asb_recommender as asb
+from src.recommender.asb_recommender import classify_depths, cross_val, fit_tree, predict_by_depth
+
+
+def make_features(n_rows=40, seed=68):
+    rng = np.random.RandomState(seed)
+    # duplicated columns give tied splits, where a truncated deep tree and a shallow tree disagree
+    base = rng.randint(0, 3, size=(n_rows, 4))
+    X = pd.DataFrame(np.hstack([base, base[:, :2], rng.rand(n_rows, 2)]), columns=[f"f{i}" for i in range(8)])
+    y = pd.DataFrame({"label": np.where(base[:, 0] + rng.randint(0, 2, n_rows) > 2, "high", "low")})
+    return X, y
+
+
+def walk_to_depth(clf, x, depth):
+    tree_ = clf.tree_
+    node = 0
+    for _ in range(depth):
+        if tree_.children_left[node] == -1:
+            break
+        node = tree_.children_left[node] if x[tree_.feature[node]] <= tree_.threshold[node] else tree_.children_right[node]
+    return clf.classes_[tree_.value[node, 0].argmax()]
+
+
+def count_fits(monkeypatch):
+    calls = []
+    def counting_fit_tree(X, y, max_depth):
+        calls.append(max_depth)
+        return fit_tree(X, y, max_depth)
+    monkeypatch.setattr(asb, "fit_tree", counting_fit_tree)
+    return calls
+
+
+def test_predict_by_depth_stops_at_each_depth():
+    X, y = make_features()
+    Xv, yv = X.values, y["label"].values
+    for train, test in KFold(n_splits=4, shuffle=True, random_state=100).split(Xv, yv):
+        clf = fit_tree(Xv[train], yv[train], 5)
+        for depth, y_pred in enumerate(predict_by_depth(clf, Xv[test], range(1, 6)), start=1):
+            assert list(y_pred) == [walk_to_depth(clf, x, depth) for x in Xv[test]]
+
+
+def test_depth_curve_fits_one_tree_per_fold(monkeypatch):
+    X, y = make_features()
+    calls = count_fits(monkeypatch)
+    curves, error_msg = classify_depths([X], [y], {"combinations": ["behav"], "max_depth": 4})
+    assert error_msg == ""
+    assert calls == [4] * 4
+    # the deepest point is the max_depth tree itself
+    score_dict, _ = cross_val(None, X, y.astype(str), 4, {}, "behav", 4, None)
+    assert curves["behav"][4]["accuracy"] == score_dict["behav"]["accuracy"]
+    assert curves["behav"][4]["class"] == score_dict["behav"]["class"]
+
+
+def test_depth_refit_matches_cross_val_per_depth(monkeypatch):
+    X, y = make_features()
+    calls = count_fits(monkeypatch)
+    config = {"combinations": ["behav"], "max_depth": 4, "depth_refit": True}
+    curves, error_msg = classify_depths([X], [y], config)
+    assert error_msg == ""
+    assert sorted(calls) == sorted([1, 2, 3, 4] * 4)
+    truncated, _ = classify_depths([X], [y], dict(config, depth_refit=False))
+    differs = False
+    for depth, scores in curves["behav"].items():
+        score_dict, _ = cross_val(None, X, y.astype(str), 4, {}, "behav", depth, None)
+        assert scores["accuracy"] == score_dict["behav"]["accuracy"]
+        assert scores["class"] == score_dict["behav"]["class"]
+        assert scores["mean_accuracy"] == round(float(np.mean(scores["accuracy"])), 4)
+        differs |= truncated["behav"][depth]["accuracy"] != scores["accuracy"]
+    # this cohort has tied splits, so the cheaper truncated curve is not the refitted one
+    assert differs
+
+
+def test_depth_curve_needs_four_rows():
+    X, y = make_features(n_rows=3)
+    curves, error_msg = classify_depths([X], [y], {"combinations": ["behav"], "max_depth": 2})
+    assert curves == {}
+    assert "4-fold" in error_msg
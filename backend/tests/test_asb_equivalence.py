@@ -0,0 +1,174 @@
+import itertools
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import asb_reference as ref
+from src.recommender import asb_recommender as asb
+
+FEATURES = ["Course-Semester", "Course-Order", "Course-Distance", "Directly Follows", "Eventually Follows", "Path Length"]
+INDEX_TYPES = ["fachsemester", "order", "distance"]
+PM_FEATURES = ["Directly Follows", "Eventually Follows", "Path Length"]
+INDEX_COLUMNS = ["course-index", "index", "start-index"]
+
+
+def values(column):
+    return [None if pd.isna(v) else v for v in column.astype(object)]
+
+
+def dense(features):
+    matrix = features.matrix.toarray() if isinstance(features, asb.SparseFeatures) else features.values
+    return np.asarray(matrix, dtype=np.float64).reshape(len(features), len(features.columns))
+
+
+def expected_matrix(actual, expected, feature, is_atomic):
+    # lifecycle Course-* columns come in first-appearance order, the reference listed them in set() order
+    names = list(expected.columns)
+    if is_atomic or feature in PM_FEATURES:
+        assert list(actual.columns) == names
+    else:
+        assert sorted(actual.columns) == sorted(names)
+    return dense(expected)[:, [names.index(name) for name in actual.columns]]
+
+
+def make_config(feature, is_atomic, label="Overall GPA", **overrides):
+    config = dict(asb.CONFIG_DEFAULTS, feature=feature, is_atomic=is_atomic, is_pm=feature in PM_FEATURES,
+                  label=label, GPA_grades="passed+failed last attempt")
+    if label != "Overall GPA":
+        config.update(course="course-1", label_index=2, is_binary_label=True)
+    config.update(overrides)
+    return config
+
+
+def indexed_frames(df, feature, is_atomic, index_type):
+    expected, actual = ref.as_reference_frame(df), df.copy()
+    ref.add_course_index(expected, feature, is_atomic, index_type)
+    asb.add_course_index(actual, feature, is_atomic, index_type)
+    return expected, actual
+
+
+@pytest.mark.parametrize("feature,is_atomic,index_type", itertools.product(FEATURES, [True, False], INDEX_TYPES))
+def test_add_course_index(asb_frame, feature, is_atomic, index_type):
+    expected, actual = indexed_frames(asb_frame, feature, is_atomic, index_type)
+    for column in INDEX_COLUMNS:
+        assert values(actual[column]) == values(expected[column]), column
+
+
+@pytest.mark.parametrize("GPA_grades,is_binary,persisted", itertools.product(
+    ["passed+failed last attempt", "passed", ""], [True, False], [False, True]))
+def test_GPA_label(asb_frame, GPA_grades, is_binary, persisted):
+    actual = asb_frame.copy()
+    if persisted:
+        # the persisted degree frame answers from its precomputed GPA columns
+        asb.add_student_columns(actual)
+    expected_label, expected = ref.get_GPA_label(ref.as_reference_frame(asb_frame), is_binary, GPA_grades)
+    actual_label, actual = asb.get_GPA_label(actual, is_binary, GPA_grades)
+    assert values(actual_label["label"]) == values(expected_label["label"])
+    for column in ["GPA", "GPA-2level", "GPA-5level"]:
+        assert values(actual[column]) == values(expected[column]), column
+
+
+@pytest.mark.parametrize("feature,is_atomic,index_type,label", itertools.product(
+    FEATURES, [True, False], ["fachsemester", "order"], ["Overall GPA", "Course grade"]))
+def test_behavioral_features(asb_frame, feature, is_atomic, index_type, label):
+    config = make_config(feature, is_atomic, label, index_type=index_type)
+    expected_df, actual_df = indexed_frames(asb_frame, feature, is_atomic, index_type)
+    expected = ref.get_behavioral_features(expected_df, config)
+    actual = asb.get_behavioral_features(actual_df, config)
+    matrix = expected_matrix(actual, expected, feature, is_atomic)
+    assert np.array_equal(dense(actual), matrix)
+
+    # trees fitted on the CSR matrix score like trees fitted on the dense frame
+    if len(expected.columns):
+        y = ref.get_GPA_label(expected_df, True, config["GPA_grades"])[0].fillna("none")
+        actual_scores, _ = asb.cross_val(None, actual, y, 4, {}, "behav", 3, feature)
+        expected_scores, _ = asb.cross_val(None, pd.DataFrame(matrix), y, 4, {}, "behav", 3, feature)
+        assert actual_scores == expected_scores
+
+
+@pytest.mark.parametrize("feature,is_atomic,label,min_support", itertools.product(
+    PM_FEATURES, [True, False], ["Overall GPA", "Course grade"], [1, 3]))
+def test_observed_pm_vocabulary(asb_frame, feature, is_atomic, label, min_support):
+    # the observed vocabulary keeps the pairs of the full one that at least min_support students have
+    config = make_config(feature, is_atomic, label, pm_vocabulary="observed", pm_min_support=min_support)
+    expected_df, actual_df = indexed_frames(asb_frame, feature, is_atomic, config["index_type"])
+    expected = ref.get_behavioral_features(expected_df, config)
+    actual = asb.get_behavioral_features(actual_df, config)
+    matrix = dense(expected)
+    support = (matrix != (-1 if feature == "Path Length" else 0)).sum(axis=0)
+    kept = [name for name, count in zip(expected.columns, support) if count >= min_support]
+    assert sorted(actual.columns) == sorted(kept)
+    columns = [list(expected.columns).index(name) for name in actual.columns]
+    assert np.array_equal(dense(actual), matrix[:, columns])
+
+
+@pytest.mark.parametrize("feature,is_atomic,label,persisted", itertools.product(
+    ["Course-Semester", "Eventually Follows"], [True, False], ["Overall GPA", "Course grade"], [False, True]))
+def test_difficulty_and_numerical_features(asb_frame, feature, is_atomic, label, persisted):
+    config = make_config(feature, is_atomic, label)
+    expected_df, actual_df = indexed_frames(asb_frame, feature, is_atomic, config["index_type"])
+    if persisted:
+        # the persisted degree frame carries the course medians
+        asb.set_course_medians(actual_df, asb.get_course_grade_counts(actual_df))
+    for name in ["get_difficulty_features", "get_numerical_features"]:
+        expected = getattr(ref, name)(expected_df, config)
+        actual = getattr(asb, name)(actual_df, config)
+        assert list(actual.columns) == list(expected.columns), name
+        assert actual.values.tolist() == expected.values.tolist(), name
+
+
+@pytest.mark.parametrize("feature,is_atomic,is_binary", itertools.product(
+    ["Course-Semester", "Eventually Follows"], [True, False], [True, False]))
+def test_course_labels(asb_frame, feature, is_atomic, is_binary):
+    is_pm = feature in PM_FEATURES
+    expected_df, actual_df = indexed_frames(asb_frame, feature, is_atomic, "order")
+    label_indices = [1, 2, 3]
+    for course in ["course-1", "course-7", "missing"]:
+        shared = asb.get_course_grade_labels(actual_df, course, is_binary, is_atomic, label_indices, is_pm)
+        for label_index in label_indices:
+            expected = ref.get_course_grade_label(expected_df, course, is_binary, is_atomic, label_index, is_pm)
+            actual = asb.get_course_grade_label(actual_df, course, is_binary, is_atomic, label_index, is_pm)
+            assert values(actual["label"]) == values(expected["label"]), (course, label_index)
+            assert values(shared[label_index]["label"]) == values(expected["label"]), (course, label_index)
+
+            expected = ref.get_passfail_label(expected_df, course, is_atomic, label_index, is_pm)
+            actual = asb.get_passfail_label(actual_df, course, is_atomic, label_index, is_pm)
+            assert values(actual["label"]) == values(expected["label"]), (course, label_index)
+
+        config = make_config(feature, is_atomic, "Course grade", course=course, label_index=2, is_binary_label=is_binary)
+        assert values(asb.get_label(actual_df, config)["label"]) == values(ref.get_label(expected_df, config)["label"])
+
+
+@pytest.mark.parametrize("feature,is_atomic,label", itertools.product(FEATURES, [True, False], ["Overall GPA", "Course grade"]))
+def test_features_label_across_combinations(asb_frame, feature, is_atomic, label):
+    combinations = ["diff", "num", "behav", "diff+num", "diff+behav", "num+behav", "diff+num+behav", "all"]
+    config = make_config(feature, is_atomic, label, combinations=combinations, index_type="order", is_binary_label=True)
+    expected_features, expected_labels, expected_error = ref.get_features_label_from_dataframe(ref.as_reference_frame(asb_frame), config)
+    actual_features, actual_labels, actual_error = asb.get_features_label_from_dataframe(asb_frame.copy(), config)
+    assert actual_error == expected_error
+    assert len(actual_features) == len(expected_features)
+    for combination, actual, expected in zip(combinations, actual_features, expected_features):
+        assert np.array_equal(dense(actual), expected_matrix(actual, expected, feature, is_atomic)), combination
+    for actual, expected in zip(actual_labels, expected_labels):
+        assert values(actual["label"]) == values(expected["label"])
+
+
+def test_lifecycle_feature_order_ignores_hash_seed():
+    # string hashes change with PYTHONHASHSEED, the lifecycle column order must not
+    script = (
+        "from conftest import make_degree_items\n"
+        "from src.recommender import asb_recommender as asb\n"
+        "df = asb.convert_dynamodb_to_asb_format(make_degree_items())\n"
+        "asb.add_course_index(df, 'Course-Semester', False, 'fachsemester')\n"
+        "print(asb.get_lifecycle_course_index(df, None))\n"
+    )
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    outputs = set()
+    for seed in ["1", "2", "3"]:
+        env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=os.pathsep.join([tests_dir, os.path.dirname(tests_dir)]))
+        outputs.add(subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True).stdout)
+    assert len(outputs) == 1
@@ -0,0 +1,128 @@
+import json
+import random
+
+import pytest
+
+import src.recommender.asb_jobs as asb_jobs
+import src.recommender.asb_recommender as asb_recommender
+import src.handler.asb_docker_handler as asb_docker_handler
+
+
+def make_student_items(n_students=60, seed=7):
+    rng = random.Random(seed)
+    items = []
+    for s in range(n_students):
+        subjects = []
+        for semester in range(1, 4):
+            for course in rng.sample(range(8), 3):
+                grade = rng.choice([0, 55, 72, 85, 95])
+                subjects.append({
+                    "code": f"C{course}",
+                    "semester": str(semester),
+                    "grade": str(grade),
+                    "status": "APR" if grade >= 70 else "REP",
+                })
+        items.append({"PK": "DEGREE#1", "SK": f"STUDENTS#{s}", "id": str(s), "start_date": "01/03/2020", "subjects": subjects})
+    return items
+
+
+class FakeTable:
+    def __init__(self, items):
+        self.items = items
+
+    def get_item(self, Key):
+        # no DATA-VERSION record: the frame is read in full and nothing is cached
+        return {}
+
+    def query(self, **params):
+        return {"Items": list(self.items)}
+
+
+class FakeBoto3:
+    def __init__(self, items):
+        self.items = items
+
+    def resource(self, name, **kwargs):
+        assert name == "dynamodb"
+        return self
+
+    def Table(self, name):
+        return FakeTable(self.items)
+
+    def client(self, name, **kwargs):
+        raise AssertionError(f"el backend local no debería usar {name}")
+
+
+@pytest.fixture
+def local_jobs(monkeypatch):
+    fake = FakeBoto3(make_student_items())
+    monkeypatch.setenv("ASB_JOB_BACKEND", "local")
+    monkeypatch.setattr(asb_jobs, "JOB_BACKEND", "local")
+    monkeypatch.setattr(asb_jobs, "boto3", fake)
+    monkeypatch.setattr(asb_recommender, "boto3", fake)
+    monkeypatch.delenv("S3_BUCKET", raising=False)
+    monkeypatch.setenv("ASB_WORKERS", "1")
+    return asb_jobs
+
+
+def test_async_job_submit_status_result(local_jobs):
+    body = {"async": True, "degree_id": "1", "analysis_config": {"max_depth": 2}}
+    response = asb_docker_handler.lambda_handler({"body": json.dumps(body)}, None)
+    assert response["statusCode"] == 202
+    job_id = json.loads(response["body"])["job_id"]
+
+    local_jobs.wait_local_jobs()
+    response = asb_docker_handler.lambda_handler({"pathParameters": {"job_id": job_id}}, None)
+    assert response["statusCode"] == 200
+    job = json.loads(response["body"])
+    assert job["status"] == "done"
+    assert job["request"] == body
+    assert job["result"]["error_msg"] == ""
+    assert job["result"]["DT_names"]
+    assert all(job["progress"][stage]["done"] > 0 for stage in ("fetch", "features", "cv"))
+
+    missing = asb_docker_handler.lambda_handler({"pathParameters": {"job_id": "nope"}}, None)
+    assert missing["statusCode"] == 404
+
+
+def test_worker_reports_failed_records(local_jobs, monkeypatch):
+    def analyze(request, progress):
+        if request["degree_id"] == "bad":
+            raise RuntimeError("DynamoDB no disponible")
+        return {"error_msg": ""}
+    monkeypatch.setattr(asb_docker_handler, "analyze", analyze)
+
+    ok, bad = local_jobs.new_job({"degree_id": "1"}), local_jobs.new_job({"degree_id": "bad"})
+    local_jobs.put_job(ok)
+    local_jobs.put_job(bad)
+    event = {"Records": [
+        {"messageId": "m-ok", "body": json.dumps({"job_id": ok["job_id"]})},
+        {"messageId": "m-bad", "body": json.dumps({"job_id": bad["job_id"]})},
+    ]}
+    assert asb_docker_handler.lambda_handler(event, None) == {"batchItemFailures": [{"itemIdentifier": "m-bad"}]}
+    assert local_jobs.get_job(ok["job_id"])["status"] == "done"
+    failed = local_jobs.get_job(bad["job_id"])
+    assert failed["status"] == "failed"
+    assert "DynamoDB no disponible" in failed["error_msg"]
+
+    # a redelivered finished job is acknowledged without running again
+    event["Records"] = event["Records"][:1]
+    assert asb_docker_handler.lambda_handler(event, None) == {"batchItemFailures": []}
+
+
+def test_submit_without_queue_fails_loudly(monkeypatch):
+    # on Lambda the local threads would freeze after the response, so sqs is never swapped for local
+    monkeypatch.setattr(asb_jobs, "JOB_BACKEND", "sqs")
+    monkeypatch.setattr(asb_jobs, "JOB_QUEUE_URL", None)
+    monkeypatch.setattr(asb_jobs, "boto3", FakeBoto3([]))
+    with pytest.raises(RuntimeError, match="ASB_JOB_QUEUE_URL"):
+        asb_jobs.submit_asb_job({"degree_id": "1"}, None)
+    response = asb_docker_handler.lambda_handler({"body": json.dumps({"async": True, "degree_id": "1"})}, None)
+    assert response["statusCode"] == 500
+    assert "ASB_JOB_QUEUE_URL" in json.loads(response["body"])["error_msg"]
+
+
+def test_jobs_expire(local_jobs, monkeypatch):
+    monkeypatch.setattr(local_jobs.time, "time", lambda: 1000)
+    monkeypatch.setattr(local_jobs, "JOB_TTL_DAYS", 2)
+    assert local_jobs.new_job({"degree_id": "1"})["expires_at"] == 1000 + 2 * 86400
@@ -0,0 +1,90 @@
+import random
+from collections import Counter
+
+import pytest
+
+import src.recommender.asb_recommender as asb
+from conftest import make_degree_items
+
+COHORTS = {"2015": 50, "2016": 30, "2017": 17, None: 6}
+
+
+def make_keys():
+    keys = []
+    for year, n in COHORTS.items():
+        for i in range(n):
+            key = {"PK": "DEGREE#1", "SK": f"STUDENTS#{year}-{i:03d}"}
+            if year is not None:
+                key["start_date"] = f"01/03/{year}"
+            keys.append(key)
+    random.Random(0).shuffle(keys)
+    return keys
+
+
+def test_same_seed_gives_the_same_sample():
+    keys = make_keys()
+    for sample_by in [None, "cohort"]:
+        first = asb.sample_student_keys(keys, 20, seed=5, sample_by=sample_by)
+        # the key order a query returns does not matter
+        again = asb.sample_student_keys(list(reversed(keys)), 20, seed=5, sample_by=sample_by)
+        assert first == again
+        assert len({k["SK"] for k in first}) == 20
+        assert asb.sample_student_keys(keys, 20, seed=6, sample_by=sample_by) != first
+
+
+@pytest.mark.parametrize("sample_size", [10, 20, 37])
+def test_cohort_sample_keeps_cohort_proportions(sample_size):
+    keys = make_keys()
+    sample = asb.sample_student_keys(keys, sample_size, seed=1, sample_by="cohort")
+    assert len(sample) == sample_size
+    counts = Counter(asb.get_cohort_year(k) for k in sample)
+    total = sum(COHORTS.values())
+    for year, n in COHORTS.items():
+        quota = n * sample_size / total
+        # largest-remainder allocation: every cohort gets its quota rounded down or up
+        assert int(quota) <= counts[year or "unknown"] <= int(quota) + 1
+    assert sum(counts.values()) == sample_size
+
+
+class FakeTable:
+    def __init__(self, items):
+        self.items = items
+        self.queries = []
+
+    def query(self, **params):
+        self.queries.append(params)
+        fields = [f.strip() for f in params["ProjectionExpression"].split(",")]
+        names = params.get("ExpressionAttributeNames", {})
+        fields = [names.get(f, f) for f in fields]
+        return {"Items": [{f: item[f] for f in fields if f in item} for item in self.items]}
+
+
+class FakeDynamoDB:
+    def __init__(self, items):
+        self.table = FakeTable(items)
+        self.by_sk = {item["SK"]: item for item in items}
+        self.fetched = []
+
+    def Table(self, name):
+        return self.table
+
+    def batch_get_item(self, RequestItems):
+        (table_name, request), = RequestItems.items()
+        sks = [k["SK"] for k in request["Keys"]]
+        self.fetched.extend(sks)
+        return {"Responses": {table_name: [self.by_sk[sk] for sk in sks]}}
+
+
+def test_format_from_dynamodb_fetches_only_the_sample(monkeypatch):
+    items = make_degree_items(n_students=60)
+    dynamodb = FakeDynamoDB(items)
+    monkeypatch.setattr(asb.boto3, "resource", lambda *args, **kwargs: dynamodb)
+    df = asb.format_from_dynamodb("1", "table", sample_size=12, seed=3, sample_by="cohort")
+
+    # the degree query reads keys and start dates only; subjects come from batch_get_item for the sample
+    assert all("subjects" not in q["ProjectionExpression"] for q in dynamodb.table.queries)
+    expected = asb.sample_student_keys(asb.get_student_keys("1", "table"), 12, 3, "cohort")
+    assert sorted(dynamodb.fetched) == sorted(k["SK"] for k in expected)
+    sampled_ids = {f"student_{dynamodb.by_sk[k['SK']]['id']}" for k in expected}
+    assert not df.empty
+    assert set(df["studentstudyid"].astype(str)) <= sampled_ids
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import src.recommender.asb_recommender as asb
+
+
+def make_config(**overrides):
+    config = dict(asb.CONFIG_DEFAULTS, GPA_grades="passed+failed last attempt", model="DT", max_depth=2)
+    config.update(overrides)
+    return config
+
+
+def course_config(label_index, **overrides):
+    return make_config(label="Course grade", course="course-1", label_index=label_index, is_binary_label=True,
+                       feature="Course-Order", index_type="order", **overrides)
+
+
+def test_sweep_builds_course_labels_once_for_all_label_indices(asb_frame, monkeypatch):
+    builds = []
+    get_label_engine = asb.get_label_engine
+    def counting_engine(df):
+        builds.append(len(df))
+        return get_label_engine(df)
+    monkeypatch.setattr(asb, "get_label_engine", counting_engine)
+
+    configs = [course_config(i) for i in [1, 2, 3]] + [course_config(2, combinations=["diff"])]
+    asb.submit_sweep_with_dataframe(asb_frame.copy(), configs)
+    assert len(builds) == 1
+
+    indexed = asb_frame.copy()
+    asb.add_course_index(indexed, "Course-Order", True, "order")
+    shared = {"index": {}, "label": {}, "features": {}}
+    for config in configs:
+        expected = asb.get_label(indexed, config)
+        actual = asb.get_sweep_labels(indexed, config, configs, shared)
+        pd.testing.assert_frame_equal(actual, expected)
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_sweep_matches_separate_classify_runs(asb_frame, n_jobs):
+    configs = [
+        make_config(is_binary_label=True, combinations=["behav", "diff"]),
+        course_config(2, max_depth=3, combinations=["behav", "num+behav"]),
+    ]
+    table, results = asb.submit_sweep_with_dataframe(asb_frame.copy(), configs, n_jobs)
+
+    assert len(results) == len(configs)
+    for config, result in zip(configs, results):
+        features, labels, error_msg = asb.get_features_label_from_dataframe(asb_frame.copy(), config)
+        assert error_msg == ""
+        expected = asb.classify(features, labels, config)
+        assert result == expected
+        assert result[0]
+
+    # one row per (config, combination), ranked by mean accuracy; "config" points back into configs
+    assert len(table) == sum(len(c["combinations"]) for c in configs)
+    assert list(table["mean_accuracy"]) == sorted(table["mean_accuracy"], reverse=True)
+    rows = table.sort_values(["config", "combination"], kind="stable")
+    assert list(rows["config"]) == [0, 0, 1, 1]
+    for _, row in table.iterrows():
+        config, (score_dict, *_) = configs[row["config"]], results[row["config"]]
+        assert row["label"] == config["label"] and row["max_depth"] == config["max_depth"]
+        assert row["mean_accuracy"] == np.mean(score_dict[row["combination"]]["accuracy"])
@@ -0,0 +1,107 @@
+import json
+import os
+
+import joblib
+import pytest
+
+import asb_inference
+import asb_recommender
+import asb_train
+from conftest import make_degree_items
+
+TRAIN_CONFIGS = [
+    {"is_binary_label": True, "combinations": ["behav", "diff", "num"], "max_depth": 3},
+    {"is_binary_label": True, "combinations": ["behav"], "GPA_grades": "passed"},
+    {"label": "Course grade", "course": "course-1", "label_index": 2, "is_binary_label": True,
+     "feature": "Course-Order", "index_type": "order", "combinations": ["behav", "num+behav"]},
+]
+
+
+class FakeTable:
+    def __init__(self, items):
+        self.items = items
+
+    def get_item(self, Key):
+        return {"Item": {"data_version": 4}}
+
+    def query(self, **params):
+        return {"Items": list(self.items)}
+
+
+class FakeBoto3:
+    def __init__(self, items):
+        self.items = items
+
+    def resource(self, name, **kwargs):
+        return self
+
+    def Table(self, name):
+        return FakeTable(self.items)
+
+
+@pytest.fixture(scope="module")
+def model_dir(tmp_path_factory):
+    items = make_degree_items(n_students=80, seed=3)
+    model_dir = str(tmp_path_factory.mktemp("asb-model"))
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(asb_recommender, "boto3", FakeBoto3(items))
+        mp.setenv("DEGREE_ID", "1")
+        mp.setenv("ASB_CONFIGS", json.dumps(TRAIN_CONFIGS))
+        mp.setenv("ASB_GPA_GRADES", "")
+        mp.setenv("ASB_WORKERS", "1")
+        asb_train.train(model_dir)
+    return model_dir, items
+
+
+def load_model_pack(model_dir):
+    # what inference.get_model loads for the endpoint
+    with open(os.path.join(model_dir, "metadata.json")) as f:
+        metadata = json.load(f)
+    return {"model": joblib.load(os.path.join(model_dir, "model.joblib")), "metadata": metadata}
+
+
+def expected_analysis(items, analysis_config):
+    config = dict(asb_recommender.get_analysis_config(analysis_config), rules_format=analysis_config.get("rules_format", "text"))
+    df = asb_recommender.convert_dynamodb_to_asb_format(items)
+    features, labels, error_msg = asb_recommender.get_features_label_from_dataframe(df, config)
+    assert error_msg == ""
+    score_dict, DT_names, _, parsed, error_msg, trees = asb_recommender.classify(features, labels, config)
+    return {"score_dict": score_dict, "DT_names": DT_names, "parsed": parsed, "trees": trees, "error_msg": error_msg}
+
+
+def test_artifact_files(model_dir):
+    model_dir, _ = model_dir
+    assert sorted(os.listdir(model_dir)) == ["metadata.json", "model.joblib", "report.csv"]
+    pack = load_model_pack(model_dir)
+    assert pack["metadata"]["algorithm"] == "asb"
+    assert pack["model"]["data_version"] == "4"
+    assert pack["model"]["counts"]["configs_trained"] == len(TRAIN_CONFIGS)
+    # ASB_GPA_GRADES applies to configs that do not set GPA_grades themselves
+    assert [c["GPA_grades"] for c in pack["metadata"]["configs"]] == ["", "passed", ""]
+
+
+@pytest.mark.parametrize("analysis_config", [
+    dict(TRAIN_CONFIGS[0], GPA_grades=""),
+    dict(TRAIN_CONFIGS[0], GPA_grades="", combinations=["num", "behav"], rules_format="structured"),
+    TRAIN_CONFIGS[1],
+    dict(TRAIN_CONFIGS[2], GPA_grades=""),
+])
+def test_predict_asb_answers_like_a_fresh_analysis(model_dir, analysis_config):
+    model_dir, items = model_dir
+    out = asb_inference.predict_asb({"degree_id": "1", "analysis_config": analysis_config}, load_model_pack(model_dir))
+    assert "error" not in out
+    expected = expected_analysis(items, analysis_config)
+    for field in ["score_dict", "DT_names", "parsed", "trees", "error_msg"]:
+        assert out[field] == expected[field], field
+
+
+def test_predict_asb_reports_untrained_configs(model_dir):
+    model_dir, _ = model_dir
+    pack = load_model_pack(model_dir)
+    # the Lambda default GPA basis was not trained for this degree
+    out = asb_inference.predict_asb({"degree_id": "1", "analysis_config": TRAIN_CONFIGS[0]}, pack)
+    assert out["error"] == "Configuración ASB no entrenada"
+    out = asb_inference.predict_asb({"degree_id": "1", "analysis_config": dict(TRAIN_CONFIGS[1], combinations=["diff"])}, pack)
+    assert out["error"] == "Combinaciones no entrenadas: ['diff']"
+    out = asb_inference.predict_asb({"degree_id": "2", "analysis_config": TRAIN_CONFIGS[1]}, pack)
+    assert "no para 2" in out["error"]
@@ -0,0 +1,151 @@
+import sys
+
+import numpy as np
+import pytest
+
+import asb_reference as ref
+import src.recommender.asb_recommender as asb
+
+EXPECTED_DOT = """digraph Tree {
+node [shape=box, style="filled, rounded", color="black", fontname="helvetica"] ;
+edge [fontname="helvetica"] ;
+0 [label="x \\"q\\" <= 1.5", fillcolor="white"] ;
+1 [label="a", fillcolor="PaleGreen"] ;
+2 [label="b", fillcolor="plum"] ;
+0 -> 1 [labeldistance=2.5, labelangle=45, headlabel="True"] ;
+0 -> 2 [labeldistance=2.5, labelangle=-45, headlabel="False"] ;
+}"""
+
+
+def small_tree():
+    clf = asb.fit_tree(np.array([[0, 5], [1, 5], [2, 5], [3, 5]]), np.array(["a", "a", "b", "b"]), 2)
+    return asb.get_tree_structure(clf, ['x "q"', "y"], ["a", "b"])
+
+
+def fitted_structure(seed):
+    rng = np.random.RandomState(seed)
+    X = rng.randint(0, 4, size=(200, 6))
+    y = np.where(X[:, 0] + X[:, 3] + rng.randint(0, 2, 200) > 4, "high", "low")
+    clf = asb.fit_tree(X, y, 5)
+    asb.prune_duplicate_leaves(clf)
+    return asb.get_tree_structure(clf, [f"f{i}" for i in range(6)], ["high", "low"])
+
+
+class FakeSource:
+    renders = []
+
+    def __init__(self, dot):
+        self.dot = dot
+
+    def pipe(self, format):
+        FakeSource.renders.append((self.dot, format))
+        return f"{format}:{self.dot}".encode("utf-8")
+
+
+@pytest.fixture
+def fake_graphviz(monkeypatch):
+    # graphviz is an optional dependency; the fake counts the renders that reach it
+    FakeSource.renders = []
+    monkeypatch.setattr(asb, "_GRAPHVIZ_OK", True)
+    monkeypatch.setattr(asb, "graphviz", type("graphviz", (), {"Source": FakeSource}), raising=False)
+    monkeypatch.setattr(asb, "_caches", {kind: asb.OrderedDict() for kind in asb.CACHE_SIZES})
+    return FakeSource
+
+
+def test_tree_to_dot_is_stable():
+    assert asb.tree_to_dot(small_tree()) == EXPECTED_DOT
+    # refitting the same data gives the same structure, dot and content hash
+    first, second = fitted_structure(3), fitted_structure(3)
+    assert first == second
+    assert asb.tree_to_dot(first) == asb.tree_to_dot(second)
+    assert asb.get_tree_hash(first, "png") == asb.get_tree_hash(second, "png")
+    assert asb.get_tree_hash(first, "png") != asb.get_tree_hash(first, "svg")
+
+
+def test_pruned_structure_keeps_only_reachable_nodes():
+    structure = fitted_structure(3)
+    children = [c for c in structure["left"] + structure["right"] if c != -1]
+    assert sorted(children) == list(range(1, len(structure["feature"])))
+    for i, name in enumerate(structure["feature"]):
+        assert (name is None) == (structure["left"][i] == -1 == structure["right"][i])
+
+
+def test_second_render_is_served_from_the_cache(fake_graphviz):
+    structure = fitted_structure(3)
+    figure = asb.render_tree(structure, "svg")
+    assert asb.render_tree(structure, "svg") == figure
+    assert fake_graphviz.renders == [(asb.tree_to_dot(structure), "svg")]
+    # an equal structure built separately hits the same sha1 key; another format is a new render
+    assert asb.render_tree(fitted_structure(3), "svg") == figure
+    asb.render_tree(structure, "png")
+    assert len(fake_graphviz.renders) == 2
+    assert ("figure", asb.get_tree_hash(structure, "svg")) in asb._caches["figure"]
+
+
+def test_render_tree_rejects_unknown_formats():
+    with pytest.raises(ValueError):
+        asb.render_tree(small_tree(), "gif")
+
+
+def chain_tree(n=1300):
+    # alternating labels on one feature: every split peels off one sample, so the tree is n - 1 levels deep
+    X = np.arange(n, dtype=np.float64).reshape(-1, 1)
+    y = np.where(np.arange(n) % 2 == 0, "a", "b")
+    return X, y, asb.fit_tree(X, y, None)
+
+
+def rule_rows(X, rule, feature_names):
+    rows = np.ones(len(X), dtype=bool)
+    for c in rule["conditions"]:
+        values = X[:, feature_names.index(c["feature"])]
+        rows &= values <= c["threshold"] if c["op"] == "<=" else values > c["threshold"]
+    return rows
+
+
+def check_rules_leaf_for_leaf(X, y, clf, feature_names, class_names):
+    structured = asb.get_rules(clf, feature_names, class_names, structured=True)
+    text = asb.get_rules(clf, feature_names, class_names)
+    assert len(structured) == len(text) == clf.get_n_leaves()
+    assert asb.get_text_rules(structured) == text
+    for rule in structured:
+        # each rule's conditions select exactly the training rows of its leaf
+        rows = rule_rows(X, rule, feature_names)
+        assert rows.sum() == rule["samples"]
+        counts = {c: int((y[rows] == c).sum()) for c in class_names}
+        assert rule["class"] == max(class_names, key=lambda c: counts[c])
+        assert rule["accuracy"] == round(100.0 * counts[rule["class"]] / rule["samples"], 2)
+    return structured, text
+
+
+def test_structured_rules_match_text_rules():
+    rng = np.random.RandomState(3)
+    X = rng.randint(0, 4, size=(200, 6)).astype(np.float64)
+    y = np.where(X[:, 0] + X[:, 3] + rng.randint(0, 2, 200) > 4, "high", "low")
+    names = [f"f{i}" for i in range(6)]
+    clf = asb.fit_tree(X, y, 6)
+    _, text = check_rules_leaf_for_leaf(X, y, clf, names, ["high", "low"])
+    assert text == ref.get_rules(clf, names, ["high", "low"])
+
+
+def test_rules_of_a_tree_deeper_than_the_recursion_limit():
+    X, y, clf = chain_tree()
+    assert clf.get_depth() > sys.getrecursionlimit()
+    with pytest.raises(RecursionError):
+        ref.get_rules(clf, ["x"], ["a", "b"])
+    structured, _ = check_rules_leaf_for_leaf(X, y, clf, ["x"], ["a", "b"])
+    assert max(len(rule["conditions"]) for rule in structured) == clf.get_depth()
+
+
+def test_prune_duplicate_leaves_matches_the_recursive_version():
+    for seed in range(5):
+        rng = np.random.RandomState(seed)
+        X = rng.randint(0, 4, size=(200, 6))
+        y = rng.choice(["a", "b", "c"], 200, p=[0.6, 0.3, 0.1])
+        clf, expected = asb.fit_tree(X, y, 6), asb.fit_tree(X, y, 6)
+        asb.prune_duplicate_leaves(clf)
+        ref.prune_duplicate_leaves(expected)
+        for array in ("children_left", "children_right", "feature"):
+            assert np.array_equal(getattr(clf.tree_, array), getattr(expected.tree_, array))
+    # and a tree deeper than the recursion limit prunes without recursing
+    _, _, clf = chain_tree()
+    asb.prune_duplicate_leaves(clf)
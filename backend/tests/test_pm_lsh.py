@@ -0,0 +1,79 @@
+import random
+
+import numpy as np
+import pytest
+
+import pm_inference
+import pm_lsh
+import pm_peers
+from test_pm_peers import curriculum_terms, random_peers, random_terms
+
+
+@pytest.mark.parametrize("bands,rows", [(16, 4), (1, 64), (4, 8)])
+def test_identical_footprints_are_always_candidates(bands, rows):
+    rng = random.Random(30)
+    for _ in range(20):
+        target = [term for term in curriculum_terms(rng) if term] or [["C0"]]
+        peers = random_peers(rng, 80)
+        # a copy of the target, the target followed by more terms and every shorter prefix of it
+        copies = [[list(term) for term in target], target + curriculum_terms(rng)[len(target):] + [["C13"]]]
+        copies += [target[:length] for length in range(1, len(target))]
+        positions = rng.sample(range(len(peers) + len(copies)), len(copies))
+        for position, terms in sorted(zip(positions, copies)):
+            peers.insert(position, {"student_id": -position, "gpa": 4.0, "subjects_by_term": terms})
+        peer_index = pm_peers.build_peer_index(peers)
+        candidates = pm_lsh.lsh_candidates(target, peer_index, pm_lsh.build_peer_lsh(peer_index, bands, rows))
+        assert set(positions) <= set(candidates.tolist())
+        assert np.all(pm_peers.similarity_to_peers(target, peer_index, np.array(positions, dtype=np.int64)) == 1.0)
+
+
+def test_lsh_recall_is_exact_when_only_identical_footprints_count():
+    # at min_sim 1.0 exact retrieval keeps only peers whose truncated footprint equals the target's,
+    # which have the same signature and share every bucket whatever bands x rows is
+    rng = random.Random(31)
+    peer_index = pm_peers.build_peer_index(random_peers(rng, 200))
+    queries, _ = pm_lsh.sample_peer_queries(peer_index, 60, seed=5)
+    queries += [random_terms(rng) for _ in range(20)]
+    configs = [(1, 64), (16, 4), (2, 1)]
+    report = pm_lsh.lsh_recall(peer_index, queries, configs, min_sim=1.0)
+    assert [(r["bands"], r["rows"]) for r in report] == configs
+    for r in report:
+        assert r["similar_exact"] > 0
+        assert r["recall"] == 1.0
+        assert r["candidate_rate"] < 1.0
+
+
+def test_predict_pm_approximate_is_a_subset_of_exact(monkeypatch):
+    rng = random.Random(32)
+    peers = random_peers(rng, 150)
+    peer_index = pm_peers.build_peer_index(peers)
+    course_stats = {f"C{i}": {"avg_grade": rng.uniform(2.0, 4.0), "adoption_rate": rng.random()} for i in range(14)}
+    model_pack = {"model": {"params": {"similarity_threshold": 0.8, "top_k": 5}, "course_stats": course_stats},
+                  "metadata": {"export_time": "t"}, "peer_index": peer_index,
+                  "peer_lsh": pm_lsh.build_peer_lsh(peer_index, 8, 4, min_sim=0.8)}
+    target = []
+    monkeypatch.setattr(pm_inference, "get_student_item", lambda student_id, degree_id: {"subjects": []})
+    monkeypatch.setattr(pm_inference, "build_target_terms", lambda item: target)
+    found = 0
+    for _ in range(30):
+        target[:] = [term for term in curriculum_terms(rng) if term] or [["C0"]]
+        request = {"student_id": 7, "degree_id": "1", "k": 100}
+        exact = pm_inference.predict_pm(request, model_pack)
+        approximate = pm_inference.predict_pm(dict(request, retrieval="approximate"), model_pack)
+        assert exact["retrieval"]["mode"] == "exact" and approximate["retrieval"]["mode"] == "approximate"
+
+        # similar_peers is cut to 20, so compare against every peer exact retrieval finds
+        similar, sims = pm_peers.retrieve_similar_peers(target, peer_index, 0.8)
+        exact_peers = {(pm_peers.peer_student_id(peer_index, p), round(round(float(s), 6), 4)) for p, s in zip(similar, sims)}
+        approximate_peers = {(p["student_id"], p["sim"]) for p in approximate["similar_peers"]}
+        assert approximate_peers <= exact_peers
+        found += len(approximate_peers)
+
+        exact_support = {r["subject"]: r["support"] for r in exact["recommendations"]}
+        for r in approximate["recommendations"]:
+            assert r["support"] <= exact_support[r["subject"]]
+    assert found > 0
+
+    # below the index's own min_sim the request falls back to exact retrieval
+    low = pm_inference.predict_pm({"student_id": 7, "degree_id": "1", "min_sim": 0.6, "retrieval": "approximate"}, model_pack)
+    assert low["retrieval"]["mode"] == "exact"
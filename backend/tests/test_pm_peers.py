@@ -0,0 +1,138 @@
+import random
+
+import numpy as np
+import pytest
+
+import pm_inference
+import pm_peers
+import pm_train
+
+
+def reference_similarity(seq_a, seq_b):
+    # the footprint similarity as originally written: one relation per ordered course pair, compared as dicts
+    length = min(len(seq_a), len(seq_b))
+    if length == 0:
+        return 0.0
+    truncated_a, truncated_b = seq_a[:length], seq_b[:length]
+    universe = set([c for term in truncated_a for c in term] + [c for term in truncated_b for c in term])
+    if len(universe) <= 1:
+        return 1.0
+    fp_a = pm_peers.build_footprint_map(truncated_a, universe)
+    fp_b = pm_peers.build_footprint_map(truncated_b, universe)
+    differences = sum(1 for key, value in fp_a.items() if value != fp_b.get(key))
+    return 1.0 - (differences / max(1, len(fp_a)))
+
+
+def random_terms(rng, n_courses=14, max_terms=6):
+    # empty terms, courses repeated in later terms and a few courses outside the shared pool
+    terms = []
+    for _ in range(rng.randint(0, max_terms)):
+        term = [f"C{rng.randrange(n_courses)}" for _ in range(rng.randint(0, 4))]
+        if rng.random() < 0.1:
+            term.append(f"X{rng.randrange(100)}")
+        terms.append(term)
+    return terms
+
+
+CURRICULUM = [["C0", "C1", "C2"], ["C3", "C4"], ["C5", "C6", "C7"], ["C8", "C9"], ["C10", "C11"]]
+
+
+def curriculum_terms(rng):
+    # a prefix of the shared curriculum with courses dropped, postponed or added, so peers resemble each other
+    terms = [[] for _ in range(rng.randint(1, len(CURRICULUM)))]
+    for term_index in range(len(terms)):
+        for course in CURRICULUM[term_index]:
+            r = rng.random()
+            if r < 0.1 and term_index + 1 < len(terms):
+                terms[term_index + 1].append(course)
+            elif r < 0.9:
+                terms[term_index].append(course)
+        if rng.random() < 0.2:
+            terms[term_index].append(f"C{rng.randint(12, 13)}")
+    return terms
+
+
+def random_peers(rng, n_peers, student_ids=None):
+    ids = student_ids or [1000 + i for i in range(n_peers)]
+    return [{"student_id": ids[i % len(ids)], "gpa": round(rng.uniform(3.0, 4.0), 2), "subjects_by_term": curriculum_terms(rng)}
+            for i in range(n_peers)]
+
+
+def reference_next_courses(target_terms, peers, min_sim):
+    # the original recommend_by_pm loop: next-term courses of every similar peer, weighted by similarity
+    completed = set(c for term in target_terms for c in term)
+    similar = [(peer, reference_similarity(target_terms, peer["subjects_by_term"])) for peer in peers if peer["subjects_by_term"]]
+    similar = sorted([(peer, round(sim, 6)) for peer, sim in similar if sim >= min_sim], key=lambda x: x[1], reverse=True)
+    candidates = {}
+    for peer, sim in similar:
+        terms = peer["subjects_by_term"]
+        for c in (terms[len(target_terms)] if len(target_terms) < len(terms) else []):
+            if c not in completed:
+                agg = candidates.setdefault(c, {"support": 0, "sim_sum": 0.0})
+                agg["support"] += 1
+                agg["sim_sum"] += sim
+    return similar, candidates
+
+
+def test_similarity_matches_footprint_maps():
+    rng = random.Random(19)
+    for _ in range(2000):
+        seq_a = random_terms(rng) if rng.random() < 0.5 else curriculum_terms(rng)
+        seq_b = random_terms(rng) if rng.random() < 0.5 else curriculum_terms(rng)
+        assert pm_peers.similarity_of_footprints(seq_a, seq_b) == reference_similarity(seq_a, seq_b), (seq_a, seq_b)
+
+
+def test_relation_matrix_matches_relation_between_courses():
+    rng = random.Random(7)
+    for _ in range(200):
+        terms = random_terms(rng)
+        vocabulary = pm_peers.build_vocabulary([c for term in terms for c in term] + ["C0", "C1"])
+        relations = pm_peers.relation_matrix(pm_peers.term_index_vector(terms, vocabulary))
+        index_map = pm_peers.index_terms_by_course(terms)
+        for a, i in vocabulary.items():
+            for b, j in vocabulary.items():
+                if a != b:
+                    assert pm_peers.RELATION_CODES[relations[i, j]] == pm_peers.relation_between_courses(a, b, index_map)
+
+
+def test_similarity_to_peers_matches_pairwise():
+    rng = random.Random(20)
+    peers = random_peers(rng, 150)
+    peer_index = pm_peers.build_peer_index(peers)
+    for _ in range(40):
+        target = random_terms(rng) if rng.random() < 0.3 else curriculum_terms(rng)
+        expected = np.array([reference_similarity(target, peer["subjects_by_term"]) for peer in peers])
+        assert np.array_equal(pm_peers.similarity_to_peers(target, peer_index), expected)
+        subset = np.array(sorted(rng.sample(range(len(peers)), 30)), dtype=np.int64)
+        assert np.array_equal(pm_peers.similarity_to_peers(target, peer_index, subset), expected[subset])
+
+
+@pytest.mark.parametrize("min_sim", [0.5, 0.7, 0.9])
+def test_recommend_by_pm_matches_pairwise(min_sim):
+    rng = random.Random(21)
+    peers = random_peers(rng, 150)
+    peer_index = pm_peers.build_peer_index(peers)
+    for _ in range(40):
+        target = curriculum_terms(rng)
+        _, candidates = reference_next_courses(target, peers, min_sim)
+        expected = sorted(((c, agg["support"]) for c, agg in candidates.items()), key=lambda x: (-x[1], x[0]))
+        assert pm_train.recommend_by_pm({"subjects_by_term": target}, peers, min_sim, peer_index) == expected
+
+
+@pytest.mark.parametrize("student_ids", [None, ["A-17", None, 42]])
+def test_predict_pm_matches_pairwise(monkeypatch, student_ids):
+    rng = random.Random(22)
+    peers = random_peers(rng, 120, student_ids)
+    course_stats = {f"C{i}": {"avg_grade": rng.uniform(2.0, 4.0), "adoption_rate": rng.random()} for i in range(14)}
+    model_pack = {"model": {"params": {"similarity_threshold": 0.6, "top_k": 5}, "successful_students": peers,
+                            "course_stats": course_stats}, "metadata": {"export_time": "t"}}
+    target = []
+    monkeypatch.setattr(pm_inference, "get_student_item", lambda student_id, degree_id: {"subjects": []})
+    monkeypatch.setattr(pm_inference, "build_target_terms", lambda item: target)
+    for _ in range(30):
+        target[:] = [term for term in curriculum_terms(rng) if term] or [["C0"]]
+        similar, candidates = reference_next_courses(target, peers, 0.6)
+        result = pm_inference.predict_pm({"student_id": 7, "degree_id": "1"}, model_pack)
+        assert result["similar_peers"] == [{"student_id": peer["student_id"], "sim": round(sim, 4)} for peer, sim in similar[:20]]
+        expected = pm_inference.rank_candidates(candidates, course_stats)[:5]
+        assert [{k: v for k, v in r.items() if k != "reason"} for r in result["recommendations"]] == expected
@@ -0,0 +1,52 @@
+import pytest
+
+import pm_train
+from conftest import make_degree_items
+
+GPA_THRESHOLD, SIM_THRESHOLD, TOP_K = 3.0, 0.6, 5
+
+
+def run_training_stages(items, pool):
+    # the stages train() runs on the worker pool, with the thresholds of a small cohort
+    students = pm_train.items_to_terms_parallel(items, pool)
+    successful = [s for s in students if s["gpa"] >= GPA_THRESHOLD]
+    peer_pool = [s for s in students if s["gpa"] >= 2.5]
+    pairwise = pm_train.build_pairwise_similarity(students, peer_pool, 0.5, block_size=16, pool=pool)
+    metrics = pm_train.evaluate_holdout_last_term(students, successful, SIM_THRESHOLD, TOP_K, GPA_THRESHOLD, pairwise, pool)
+    tuning = pm_train.tune_parameters_with_simulation(students, TOP_K, pairwise, pool)
+    csr = {key: pairwise[key].tolist() for key in ("offsets", "peers", "sims")}
+    return students, metrics, tuning, csr
+
+
+@pytest.fixture
+def tuning_grid(monkeypatch):
+    monkeypatch.setenv("TUNING_GPA_GRID", "2.5,3.0,3.4")
+    monkeypatch.setenv("TUNING_SIM_GRID", "0.5,0.6,0.7")
+    monkeypatch.setenv("TUNING_COHORT_SIZE", "60")
+
+
+def test_worker_pool_matches_serial(tuning_grid):
+    items = make_degree_items(150, seed=5)
+    serial = run_training_stages(items, None)
+    pool = pm_train.open_worker_pool(3)
+    try:
+        parallel = run_training_stages(items, pool)
+    finally:
+        pm_train.close_worker_pool(pool)
+    assert parallel == serial
+
+    students, metrics, tuning, _ = serial
+    assert metrics["tp"] + metrics["fp"] > 0
+    assert len(tuning) == 9
+    # the shared similarity pass gives the metrics a per-threshold pass would; only the retrieval
+    # counters, which describe the pass itself, differ
+    successful = [s for s in students if s["gpa"] >= GPA_THRESHOLD]
+    own_pass = pm_train.evaluate_holdout_last_term(students, successful, SIM_THRESHOLD, TOP_K, GPA_THRESHOLD)
+    assert dict(own_pass, retrieval=None) == dict(metrics, retrieval=None)
+
+
+def test_pairwise_rejects_lower_threshold(tuning_grid):
+    students = pm_train.items_to_terms(make_degree_items(40, seed=6))
+    pairwise = pm_train.build_pairwise_similarity(students, students, 0.6)
+    with pytest.raises(ValueError):
+        pm_train.evaluate_holdout_last_term(students, students, 0.5, TOP_K, 0.0, pairwise)